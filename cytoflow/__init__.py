@@ -20,6 +20,7 @@ from __future__ import absolute_import
 # basics
 from .experiment import Experiment
 from .operations.import_op import ImportOp, Tube
+from .operations.import_watcher import ImportWatcher
 
 # gates
 from .operations.threshold import ThresholdOp
@@ -27,6 +28,7 @@ from .operations.range import RangeOp
 from .operations.range2d import Range2DOp
 from .operations.polygon import PolygonOp
 from .operations.quad import QuadOp
+from .operations.gate_set import GateSetOp
 
 # transforms (deprecated!)
 from .operations.hlog import HlogTransformOp
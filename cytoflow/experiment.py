@@ -17,6 +17,10 @@
 
 from __future__ import absolute_import
 
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
 import pandas as pd
 from traits.api import HasStrictTraits, Dict, List, Instance, Str, Any, \
                        Property, cached_property
@@ -122,6 +126,15 @@ class Experiment(HasStrictTraits):
     DataFrame API pieces (like query()); and of course, you can just get the
     data frame itself with Experiment.data
     
+    Cloning an `Experiment` is cheap: the clone's `data` is a shallow copy 
+    that shares its column storage with the parent.  Columns are 
+    copy-on-write -- `add_channel()`, `add_condition()` and ``ex[column] = ...``
+    give the written column new storage, leaving the parent's column (and 
+    every other column) alone.  The flip side is that you must NOT modify
+    the values in `data` in place (ie, with ``ex.data[column] = ...`` on an
+    existing column, or with ``ex.data.loc[...] = ...``); doing so may 
+    modify the parent experiment as well.
+    
     Examples
     --------
     >>> import cytoflow as flow
@@ -160,8 +173,18 @@ class Experiment(HasStrictTraits):
         return self.data.__getitem__(key)
      
     def __setitem__(self, key, value):
-        """Override __setitem__ so we can assign columns like ex.column = ..."""
-        return self.data.__setitem__(key, value)
+        """Override __setitem__ so we can assign columns like ex.column = ...
+        
+        If `key` is already a column, its values are replaced with new storage 
+        instead of being overwritten in place, because the old values may be 
+        shared with this experiment's parent (see `clone()`.)
+        """
+        if key in self.data:
+            loc = self.data.columns.get_loc(key)
+            del self.data[key]
+            self.data.insert(loc, key, value)
+        else:
+            self.data[key] = value
     
     def __len__(self):
         return len(self.data)
@@ -212,9 +235,15 @@ class Experiment(HasStrictTraits):
         return self.data.query(expr, resolvers = ({}, resolvers), **kwargs)
     
     def clone(self):
-        """Clone this experiment"""
+        """Clone this experiment.
+        
+        The clone's `data` shares its column storage with this experiment's;
+        only columns that are subsequently written (with `add_channel()`,
+        `add_condition()` or ``clone[column] = ...``) get new storage.
+        The metadata and history are (deep) copies.
+        """
         new_exp = self.clone_traits()
-        new_exp.data = self.data.copy()
+        new_exp.data = self.data.copy(deep = False)
         return new_exp
             
     def add_condition(self, name, dtype, data = None):
@@ -429,6 +458,185 @@ class Experiment(HasStrictTraits):
         
         self.data = self.data.append(new_data, ignore_index = True)
         del new_data
+        
+    def add_events_bulk(self, tubes, num_workers = 1):
+        """
+        Add many tubes' worth of new events to this Experiment at once.
+        
+        Equivalent to calling `add_events()` once for each tube in `tubes`,
+        but much faster when there are many tubes: instead of re-allocating
+        `self.data` (and re-merging the categorical conditions) once per 
+        tube, the final columns are allocated once and each tube is copied 
+        into its own slice.  Categorical conditions are encoded against
+        a single set of categories shared by all the tubes.
+        
+        Parameters
+        ----------
+        tubes : List((pandas.DataFrame, Dict(Str, Any)))
+            A list of `(data, conditions)` pairs, one per tube or well.  
+            `data` and `conditions` have the same requirements as the 
+            corresponding parameters to `add_events()`, except that `data`
+            can be anything with `columns`, a length, and array-like 
+            columns -- for example, a memory-mapped 
+            `cytoflow.operations.import_op.FCSFile`.
+            
+        num_workers : Int (default = 1)
+            How many threads to use to copy the tubes into `self.data`.  Each
+            tube is copied into its own slice, so the result doesn't depend 
+            on `num_workers`.
+            
+        Raises
+        ------
+        CytoflowError
+            Under the same circumstances as `add_events()`.
+            
+        Examples
+        --------
+        >>> import cytoflow as flow
+        >>> import fcsparser
+        >>> ex = flow.Experiment()
+        >>> ex.add_condition("Time", "float")
+        >>> ex.add_condition("Strain", "category")
+        >>> _, tube1 = fcsparser.parse('CFP_Well_A4.fcs')
+        >>> _, tube2 = fcsparser.parse('RFP_Well_A3.fcs')
+        >>> ex.add_events_bulk([(tube1, {"Time" : 1, "Strain" : "BL21"}),
+        ...                     (tube2, {"Time" : 1, "Strain" : "Top10G"})])
+        """
+        
+        if not tubes:
+            return
+        
+        if len(self) > 0:
+            channels = self.channels
+        else:
+            channels = [c for c in self.data.columns if c in self.channels]
+            for c in tubes[0][0].columns:
+                if c not in channels:
+                    channels.append(c)
+        
+        for data, conditions in tubes:
+            if set(data.columns) != set(channels):
+                raise util.CytoflowError("New events don't have the same channels")
+            
+            if( any(True for k in conditions if k not in self.conditions) or \
+                any(True for k in self.conditions if k not in conditions) ):
+                raise util.CytoflowError("Metadata for this tube isn't the same as "
+                                         "self.conditions")
+        
+        lengths = [len(data) for data, _ in tubes]
+        old_len = len(self)
+        num_events = old_len + sum(lengths)
+        
+        # allocate all the channels at once, one row per channel, so each
+        # channel is contiguous and the DataFrame can wrap the buffer 
+        # without copying it.  
+        values = np.empty((len(channels), num_events), dtype = "float64")
+        if old_len > 0:
+            for i, channel in enumerate(channels):
+                values[i, 0:old_len] = self.data[channel].values
+                
+        starts = old_len + np.cumsum([0] + lengths[:-1])
+        
+        def copy_tube(idx):
+            data = tubes[idx][0]
+            start = starts[idx]
+            for i, channel in enumerate(channels):
+                values[i, start:start + lengths[idx]] = np.asarray(data[channel])
+                
+        if num_workers > 1 and len(tubes) > 1:
+            # numpy releases the GIL while it copies
+            pool = ThreadPool(min(num_workers, len(tubes)))
+            try:
+                pool.map(copy_tube, range(len(tubes)))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for idx in range(len(tubes)):
+                copy_tube(idx)
+                
+        new_data = pd.DataFrame(values.T, columns = channels)
+        
+        # insert the conditions in the same order as they were in self.data
+        columns = list(self.data.columns) + \
+                  [c for c in channels if c not in self.data]
+        meta_types = self.conditions
+
+        for loc, meta_name in enumerate(columns):
+            if meta_name not in meta_types:
+                continue
+            
+            meta_type = meta_types[meta_name]
+            try:
+                tube_values = pd.Series([conditions[meta_name] 
+                                         for _, conditions in tubes],
+                                        dtype = meta_type)
+            except (ValueError, TypeError):
+                raise util.CytoflowError("Had trouble converting condition {0} "
+                                         "to type {1}"
+                                         .format(meta_name, meta_type))
+                
+            old_values = self.data[meta_name]
+            
+            if meta_type == "category":
+                cats = pd.Categorical(list(old_values.cat.categories) +
+                                      list(tube_values.cat.categories)).categories
+                codes = np.concatenate(
+                    [pd.Categorical(old_values, categories = cats).codes,
+                     np.repeat(pd.Categorical(tube_values, categories = cats).codes,
+                               lengths)])
+                new_values = pd.Categorical.from_codes(codes, cats)
+            else:
+                new_values = np.concatenate(
+                    [old_values.values.astype(tube_values.dtype),
+                     np.repeat(tube_values.values, lengths)])
+                    
+            new_data.insert(loc, meta_name, new_values)
+        
+        self.data = new_data
+    
+    def append(self, other):
+        """
+        Append the events in another `Experiment` to this one.  Operates
+        *in place*.
+        
+        `other` must have the same columns as this `Experiment` -- for
+        example, because the same operations were applied to both.  Its
+        metadata and history are ignored.  Categorical columns are
+        re-encoded against the union of both experiments' categories.
+        
+        Parameters
+        ----------
+        other : Experiment
+            The `Experiment` whose events to append.
+        
+        Raises
+        ------
+        CytoflowError
+            If `other` doesn't have the same columns as this `Experiment`.
+        """
+        
+        if set(other.data.columns) != set(self.data.columns):
+            raise util.CytoflowError("Experiments don't have the same columns")
+        
+        columns = OrderedDict()
+        for name in self.data.columns:
+            old_values = self.data[name]
+            new_values = other.data[name]
+            
+            if old_values.dtype.name == "category":
+                cats = pd.Categorical(list(old_values.cat.categories) +
+                                      list(new_values.cat.categories)).categories
+                codes = np.concatenate(
+                    [pd.Categorical(old_values, categories = cats).codes,
+                     pd.Categorical(new_values, categories = cats).codes])
+                columns[name] = pd.Categorical.from_codes(codes, cats)
+            else:
+                columns[name] = np.concatenate(
+                    [old_values.values,
+                     new_values.values.astype(old_values.dtype)])
+        
+        self.data = pd.DataFrame(columns, columns = list(self.data.columns))
 
 if __name__ == "__main__":
     import fcsparser
@@ -24,6 +24,7 @@ from .range import RangeOp
 from .range2d import Range2DOp
 from .polygon import PolygonOp
 from .quad import QuadOp
+from .gate_set import GateSetOp
 
 # data-driven
 from .gaussian_1d import GaussianMixture1DOp
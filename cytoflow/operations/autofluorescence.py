@@ -26,10 +26,11 @@ import cytoflow.views
 import cytoflow.utility as util
 
 from .i_operation import IOperation
-from .import_op import Tube, ImportOp, check_tube, parse_tube
+from .estimator import EstimatorMixin
+from .import_op import check_tube, parse_tube, import_control
 
 @provides(IOperation)
-class AutofluorescenceOp(HasStrictTraits):
+class AutofluorescenceOp(EstimatorMixin, HasStrictTraits):
     """
     Apply autofluorescence correction to a set of fluorescence channels.
     
@@ -73,13 +74,14 @@ class AutofluorescenceOp(HasStrictTraits):
     # traits
     id = Constant('edu.mit.synbio.cytoflow.operations.autofluorescence')
     friendly_id = Constant("Autofluorescence correction")
+    row_local = Constant(True)
     
     name = CStr()
     channels = List(Str)
     blank_file = File(filter = "*.fcs", exists = True, transient = True)
 
-    _af_median = Dict(Str, CFloat)
-    _af_stdev = Dict(Str, CFloat)
+    _af_median = Dict(Str, CFloat, estimate = True)
+    _af_stdev = Dict(Str, CFloat, estimate = True)
     
     def estimate(self, experiment, subset = None): 
         """
@@ -95,13 +97,9 @@ class AutofluorescenceOp(HasStrictTraits):
         # don't have to validate that blank_file exists; should crap out on 
         # trying to set a bad value
         
-        # make a little Experiment
+        # make a little Experiment, with the previous operations applied
         check_tube(self.blank_file, experiment)
-        blank_exp = ImportOp(tubes = [Tube(file = self.blank_file)]).apply()
-        
-        # apply previous operations
-        for op in experiment.history:
-            blank_exp = op.apply(blank_exp)
+        blank_exp = import_control(self.blank_file, experiment)
             
         # subset it
         if subset:
@@ -160,6 +158,17 @@ class AutofluorescenceOp(HasStrictTraits):
         new_experiment.history.append(self.clone_traits())
         return new_experiment
     
+    def _get_estimate(self):
+        if not self._af_median:
+            return None
+        
+        return {"af_median" : dict(self._af_median),
+                "af_stdev" : dict(self._af_stdev)}
+        
+    def _set_estimate(self, estimate):
+        self._af_median = estimate["af_median"]
+        self._af_stdev = estimate["af_stdev"]
+    
     def default_view(self, **kwargs):
         return AutofluorescenceDiagnosticView(op = self, **kwargs)
     
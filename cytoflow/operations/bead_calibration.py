@@ -24,7 +24,8 @@ Created on Aug 31, 2015
 from __future__ import division, absolute_import
 
 from traits.api import (HasStrictTraits, Str, CStr, File, Dict, Python,
-                        Instance, Int, List, Float, Constant, provides)
+                        Instance, Int, List, Float, Constant, Any, Tuple,
+                        Property, provides)
 import numpy as np
 import math
 import scipy.signal
@@ -35,10 +36,11 @@ import cytoflow.views
 import cytoflow.utility as util
 
 from .i_operation import IOperation
+from .estimator import EstimatorMixin
 from .import_op import parse_tube
 
 @provides(IOperation)
-class BeadCalibrationOp(HasStrictTraits):
+class BeadCalibrationOp(EstimatorMixin, HasStrictTraits):
     """
     Calibrate arbitrary channels to molecules-of-fluorophore using fluorescent
     beads (eg, the Spherotech RCP-30-5A rainbow beads.)
@@ -91,6 +93,10 @@ class BeadCalibrationOp(HasStrictTraits):
         How bright must a bead peak be to be considered?  Default == 100.
         Must be set to use `estimate()`.
         
+    estimate_subsample : PositiveInt (default = 0)
+        If greater than 0, find the peaks using at most this many beads 
+        (chosen at random.)
+        
     Notes
     -----
     The peak finding is rather sophisticated.  
@@ -148,6 +154,7 @@ class BeadCalibrationOp(HasStrictTraits):
     # traits
     id = Constant('edu.mit.synbio.cytoflow.operations.beads_calibrate')
     friendly_id = Constant("Bead Calibration")
+    row_local = Constant(True)
     
     name = CStr()
     units = Dict(Str, Str)
@@ -156,13 +163,17 @@ class BeadCalibrationOp(HasStrictTraits):
     bead_peak_quantile = Int(80)
 
     bead_brightness_threshold = Float(100)
+    estimate_subsample = util.PositiveInt(0, allow_zero = True)
     # TODO - bead_brightness_threshold should probably be different depending
     # on the data range of the input.
     
     beads = Dict(Str, List(Float), transient = True)
 
-    #_coefficients = Dict(Str, Python)
-    _calibration_functions = Dict(Str, Python)
+    # channel --> (a, b), where the calibrated value is b * x ** a
+    _coefficients = Dict(Str, Tuple(Float, Float), estimate = True)
+    _calibration_functions = Property(Dict(Str, Python), 
+                                      depends_on = "_coefficients")
+    _subsampled = Dict(Any, Tuple(Int, Int))
 
     def estimate(self, experiment, subset = None): 
         """
@@ -179,6 +190,10 @@ class BeadCalibrationOp(HasStrictTraits):
             raise util.CytoflowOpError("Units don't match beads.")
         
         beads_data = parse_tube(self.beads_file, experiment)
+        num_events = len(beads_data)
+        beads_data = util.subsample(beads_data, self.estimate_subsample)
+        self._subsampled = {True : (len(beads_data), num_events)}
+        
         channels = self.units.keys()
 
         for channel in channels:
@@ -226,11 +241,11 @@ class BeadCalibrationOp(HasStrictTraits):
             elif len(peaks) == 1:
                 # if we only have one peak, assume it's the brightest peak
                 a = mef[-1] / peaks[0]
-                self._calibration_functions[channel] = lambda x, a=a: a * x
+                self._coefficients[channel] = (1.0, a)
             elif len(peaks) == 2:
                 # if we have only two peaks, assume they're the brightest two
                 a = (mef[-1] - mef[-2]) / (peaks[1] - peaks[0])
-                self._calibration_functions[channel] = lambda x, a=a: a * x
+                self._coefficients[channel] = (1.0, a)
             else:
                 # if there are n > 2 peaks, check all the contiguous n-subsets
                 # of mef for the one whose linear regression with the peaks
@@ -266,8 +281,7 @@ class BeadCalibrationOp(HasStrictTraits):
                 
                 a = best_lr[0]
                 b = 10 ** best_lr[1]
-                self._calibration_functions[channel] = \
-                    lambda x, a=a, b=b: b * np.power(x, a)
+                self._coefficients[channel] = (a, b)
 
     def apply(self, experiment):
         """Applies the bleedthrough correction to an experiment.
@@ -289,14 +303,14 @@ class BeadCalibrationOp(HasStrictTraits):
         if not self.units:
             raise util.CytoflowOpError("Units not specified.")
         
-        if not self._calibration_functions:
+        if not self._coefficients:
             raise util.CytoflowOpError("Calibration not found. "
                                   "Did you forget to call estimate()?")
         
         if not set(channels) <= set(experiment.channels):
             raise util.CytoflowOpError("Module units don't match experiment channels")
                 
-        if set(channels) != set(self._calibration_functions.keys()):
+        if set(channels) != set(self._coefficients.keys()):
             raise util.CytoflowOpError("Calibration doesn't match units. "
                                   "Did you forget to call estimate()?")
 
@@ -325,6 +339,21 @@ class BeadCalibrationOp(HasStrictTraits):
         new_experiment.history.append(self.clone_traits()) 
         return new_experiment
     
+    def _get__calibration_functions(self):
+        return {channel : util.power_law(a, b) 
+                for channel, (a, b) in self._coefficients.iteritems()}
+        
+    def _get_estimate(self):
+        if not self._coefficients:
+            return None
+        
+        return {"coefficients" : {channel : [a, b] for channel, (a, b)
+                                  in self._coefficients.iteritems()}}
+        
+    def _set_estimate(self, estimate):
+        self._coefficients = {channel : (a, b) for channel, (a, b) 
+                              in estimate["coefficients"].iteritems()}
+    
     def default_view(self, **kwargs):
         """
         Returns a diagnostic plot to see if the bleedthrough spline estimation
@@ -389,6 +418,9 @@ class BeadCalibrationDiagnostic(HasStrictTraits):
         """Plot a faceted histogram view of a channel"""
       
         beads_data = parse_tube(self.op.beads_file, experiment)
+        
+        # the same beads that estimate() used
+        beads_data = util.subsample(beads_data, self.op.estimate_subsample)
 
         plt.figure()
         
@@ -425,4 +457,8 @@ class BeadCalibrationDiagnostic(HasStrictTraits):
             plt.plot(hist_bins[1:], hist_smooth)
             for peak in peak_bins_filtered:
                 plt.axvline(hist_bins[peak], color = 'r')
+                
+            # all the channels used the same beads
+            if idx == 0:
+                util.annotate_subsample(self.op._subsampled.get(True))
 
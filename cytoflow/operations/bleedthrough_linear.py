@@ -23,10 +23,11 @@ Created on Aug 26, 2015
 
 from __future__ import division, absolute_import
 
-import os
+import os, warnings
+from multiprocessing.pool import ThreadPool
 
 from traits.api import HasStrictTraits, Str, CStr, File, Dict, Instance, \
-                       Constant, Tuple, Float, provides
+                       Constant, Tuple, Float, Bool, provides
     
 import numpy as np
 import matplotlib.pyplot as plt
@@ -35,7 +36,12 @@ import cytoflow.views
 import cytoflow.utility as util
 
 from .i_operation import IOperation
-from .import_op import Tube, ImportOp, check_tube, parse_tube
+from .import_op import check_tube, parse_tube, parse_fcs, import_control, \
+                       _fcs_channels
+
+# how many events to compensate at a time.  small enough that the blocks
+# stay in cache.
+_CHUNK_SIZE = 16384
 
 @provides(IOperation)
 class BleedthroughLinearOp(HasStrictTraits):
@@ -57,7 +63,9 @@ class BleedthroughLinearOp(HasStrictTraits):
     To use, set up the `controls` dict with the single color controls;
     call `estimate()` to parameterize the operation; check that the bleedthrough 
     plots look good with `default_view().plot()`; and then `apply()` to an 
-    Experiment.
+    Experiment.  Alternately, if the instrument already measured the 
+    spillover matrix, call `load_spillover()` to use the one stored in an
+    FCS file and skip `estimate()`.
     
     Attributes
     ----------
@@ -76,8 +84,20 @@ class BleedthroughLinearOp(HasStrictTraits):
         `("channel2", "channel1")` must also be present.  The module does not
         assume that the matrix is symmetric.
         
+    num_workers : PositiveInt (default = 1)
+        How many threads to use to compensate the data in `apply()`.
+        
+    single_precision : Bool (default = False)
+        If `True`, do the matrix multiplication in single precision 
+        (`float32`).  It's faster, and accurate to about 7 significant
+        digits; the compensated channels are still stored as `float64`.
+        
     Notes
     -----
+    `apply()` multiplies the data by the inverse of the spillover matrix
+    a block of events at a time, writing each block straight into the new
+    channels' storage, so the only extra memory it needs is the compensated
+    channels themselves.
 
 
     Examples
@@ -96,12 +116,16 @@ class BleedthroughLinearOp(HasStrictTraits):
     # traits
     id = Constant('edu.mit.synbio.cytoflow.operations.bleedthrough_linear')
     friendly_id = Constant("Linear Bleedthrough Correction")
+    row_local = Constant(True)
     
     name = CStr()
 
     controls = Dict(Str, File)
     spillover = Dict(Tuple(Str, Str), Float)
     
+    num_workers = util.PositiveInt(1)
+    single_precision = Bool(False)
+    
     def estimate(self, experiment, subset = None): 
         """
         Estimate the bleedthrough from simgle-channel controls in `controls`
@@ -122,13 +146,9 @@ class BleedthroughLinearOp(HasStrictTraits):
                 
         for channel in channels:
             
-            # make a little Experiment
+            # make a little Experiment, with the previous operations applied
             check_tube(self.controls[channel], experiment)
-            tube_exp = ImportOp(tubes = [Tube(file = self.controls[channel])]).apply()
-            
-            # apply previous operations
-            for op in experiment.history:
-                tube_exp = op.apply(tube_exp)
+            tube_exp = import_control(self.controls[channel], experiment)
                 
             # subset it
             if subset:
@@ -174,6 +194,111 @@ class BleedthroughLinearOp(HasStrictTraits):
                 
                 self.spillover[(from_channel, to_channel)] = lr[0]
                 
+    def load_spillover(self, filename, experiment = None):
+        """
+        Set `spillover` from the spillover matrix in an FCS file's 
+        `$SPILLOVER` keyword (or the older `SPILL` or `SPILLOVER` keywords.)
+        
+        Parameters
+        ----------
+        filename : File
+            The FCS file to read the spillover matrix from.
+            
+        experiment : Experiment (optional)
+            If set, name the channels the same way `experiment` does: 
+            with `$PnN` or `$PnS` (see `ImportOp.name_metadata`), and with
+            the names in `ImportOp.channel_renames`.  Channels in the matrix
+            that weren't imported into `experiment` (see 
+            `ImportOp.channels`) are left out, with a warning.
+            
+        Raises
+        ------
+        CytoflowOpError
+            If the file doesn't have a spillover matrix, it can't be 
+            parsed, or fewer than two of its channels are in `experiment`.
+        """
+        
+        if experiment is not None and "name_metadata" in experiment.metadata:
+            channel_naming = experiment.metadata["name_metadata"]
+        else:
+            channel_naming = "$PnS"
+        
+        try:
+            meta = parse_fcs(filename, 
+                             channel_naming = channel_naming,
+                             meta_data_only = True)
+        except Exception as e:
+            raise util.CytoflowOpError("Couldn't read {0}: {1}"
+                                       .format(filename, str(e)))
+            
+        spill = None
+        for key in ["$SPILLOVER", "SPILL", "SPILLOVER", "$SPILL"]:
+            keys = [k for k in meta if k.upper() == key]
+            if keys:
+                spill = meta[keys[0]]
+                break
+            
+        if spill is None:
+            raise util.CytoflowOpError("{0} doesn't have a spillover matrix"
+                                       .format(filename))
+        
+        # n,[n parameter names],[n * n values, row by row]
+        try:
+            tokens = [t.strip() for t in spill.split(",")]
+            n = int(tokens[0])
+            names = tokens[1:n + 1]
+            values = [float(t) for t in tokens[n + 1:]]
+            if len(names) != n or len(values) != n * n:
+                raise ValueError("expected {0} values, found {1}"
+                                 .format(n * n, len(values)))
+        except (ValueError, IndexError) as e:
+            raise util.CytoflowOpError("Couldn't parse the spillover matrix "
+                                       "in {0}: {1}".format(filename, str(e)))
+            
+        # the matrix names the parameters with $PnN (some instruments use
+        # $PnS); translate them into their names in the file.
+        fcs_channels = meta["_channels_"]
+        channel_names = meta["_channel_names_"]
+        channels = []
+        for name in names:
+            for naming in ["$PnN", "$PnS"]:
+                if naming in fcs_channels and \
+                   name in list(fcs_channels[naming]):
+                    idx = list(fcs_channels[naming]).index(name)
+                    channels.append(channel_names[idx])
+                    break
+            else:
+                raise util.CytoflowOpError("Spillover matrix in {0} refers to "
+                                           "unknown parameter {1}"
+                                           .format(filename, name))
+                
+        # ... and then into the experiment's names, which may be renamed
+        # (or missing, if only some channels were imported.)
+        if experiment is not None:
+            exp_channels = {fcs_name : channel for channel, fcs_name 
+                            in _fcs_channels(experiment).items()}
+            
+            missing = [c for c in channels if c not in exp_channels]
+            if missing:
+                warnings.warn("Channels {0} from the spillover matrix in {1} "
+                              "aren't in the experiment; leaving them out"
+                              .format(", ".join(missing), filename),
+                              util.CytoflowOpWarning)
+                
+            channels = [exp_channels.get(c) for c in channels]
+            if len([c for c in channels if c is not None]) < 2:
+                raise util.CytoflowOpError("Fewer than two of the channels "
+                                           "in the spillover matrix in {0} "
+                                           "are in the experiment"
+                                           .format(filename))
+        
+        self.spillover = {(from_channel, to_channel) : values[i * n + j]
+                          for i, from_channel in enumerate(channels)
+                          for j, to_channel in enumerate(channels)
+                          if i != j 
+                          and from_channel is not None 
+                          and to_channel is not None}
+                
     def apply(self, experiment):
         """Applies the bleedthrough correction to an experiment.
         
@@ -217,9 +342,26 @@ class BleedthroughLinearOp(HasStrictTraits):
         # invert it.  use the pseudoinverse in case a is singular
         a_inv = np.linalg.pinv(a)
         
-        new_experiment.data[channels] = np.dot(experiment.data[channels], a_inv)
-        
+        # new storage for the compensated channels (the old ones are shared
+        # with experiment; see Experiment.clone()), which we fill in place
         for channel in channels:
+            new_experiment[channel] = np.empty(len(experiment))
+        
+        inputs = [experiment.data[channel].values for channel in channels]
+        outputs = [new_experiment.data[channel].values for channel in channels]
+        
+        _compensate(inputs, 
+                    a_inv, 
+                    outputs,
+                    dtype = np.float32 if self.single_precision else np.float64,
+                    num_workers = self.num_workers)
+        
+        for idx, channel in enumerate(channels):
+            # make sure we really were writing into the experiment
+            if not np.may_share_memory(new_experiment.data[channel].values,
+                                       outputs[idx]):
+                new_experiment[channel] = outputs[idx]
+            
             # add the spillover values to the channel's metadata
             new_experiment.metadata[channel]['linear_bleedthrough'] = \
                 {x : self.spillover[(x, channel)]
@@ -245,6 +387,43 @@ class BleedthroughLinearOp(HasStrictTraits):
 
         return BleedthroughLinearDiagnostic(op = self, **kwargs)
     
+# module-level "static" function (doesn't require a class instance)
+def _compensate(inputs, a_inv, outputs, dtype = np.float64, num_workers = 1):
+    """
+    Set `outputs` to `inputs` (as the columns of a matrix) times `a_inv`, 
+    `_CHUNK_SIZE` rows at a time, on `num_workers` threads.  `inputs` and 
+    `outputs` are lists of equal-length 1D arrays.
+    """
+    
+    n = len(inputs[0])
+    a_inv = np.asarray(a_inv, dtype = dtype)
+    
+    def compensate_chunk(start):
+        stop = min(start + _CHUNK_SIZE, n)
+        block = np.empty((stop - start, len(inputs)), dtype = dtype)
+        for idx, x in enumerate(inputs):
+            block[:, idx] = x[start:stop]
+            
+        block = np.dot(block, a_inv)
+        
+        for idx, x in enumerate(outputs):
+            x[start:stop] = block[:, idx]
+            
+    chunks = range(0, n, _CHUNK_SIZE)
+    
+    if num_workers > 1 and len(chunks) > 1:
+        # np.dot releases the GIL, and the chunks write to different 
+        # parts of outputs
+        pool = ThreadPool(min(num_workers, len(chunks)))
+        try:
+            pool.map(compensate_chunk, chunks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for start in chunks:
+            compensate_chunk(start)
+    
 @provides(cytoflow.views.IView)
 class BleedthroughLinearDiagnostic(HasStrictTraits):
     """
@@ -30,7 +30,6 @@ from traits.api import (HasStrictTraits, Str, CStr, File, Dict, Python,
 import numpy as np
 import scipy.interpolate
 import scipy.optimize
-import pandas
 
 import matplotlib.pyplot as plt
 
@@ -38,11 +37,12 @@ import cytoflow.views
 import cytoflow.utility as util
 
 from .i_operation import IOperation
+from .estimator import EstimatorMixin
 from .hlog import hlog, hlog_inv
-from .import_op import Tube, ImportOp, check_tube, parse_tube
+from .import_op import check_tube, parse_tube, import_control
 
 @provides(IOperation)
-class BleedthroughPiecewiseOp(HasStrictTraits):
+class BleedthroughPiecewiseOp(EstimatorMixin, HasStrictTraits):
     """
     Apply bleedthrough correction to a set of fluorescence channels.
     
@@ -77,6 +77,10 @@ class BleedthroughPiecewiseOp(HasStrictTraits):
     mesh_size : Int (default = 32)
         The size of each axis in the mesh used to interpolate corrected values.
         
+    num_workers : PositiveInt (default = 1)
+        How many threads to use to interpolate the corrected values in 
+        `apply()`.
+        
     Notes
     -----
     We use an interpolation-based scheme to estimate corrected bleedthrough.
@@ -92,14 +96,16 @@ class BleedthroughPiecewiseOp(HasStrictTraits):
        instrument, estimate the mapping from (raw colors) --> (actual colors).
        The mesh points are also distributed evenly along the hlog-transformed
        color axes; this captures negative data as well as positive 
-       This is quite slow: ~30 seconds for a mesh size of 32 in 3-space.
-       Remember that additional channels expand the number of mesh points
-       exponentially!
+       The whole mesh is solved at once, with a vectorized Newton's method
+       (~0.2 seconds for a mesh size of 32 in 3-space.)  Remember that 
+       additional channels expand the number of mesh points exponentially!
 
      - Use these estimates to paramaterize a linear interpolator (in linear
-       space, this time).  There's one interpolator per output channel (so
-       for a 3-channel correction, each interpolator is R^3 --> R).  For 
-       each measured cell, run each interpolator to give the corrected output.
+       space, this time).  The interpolator maps (raw colors) --> (actual 
+       colors), so for a 3-channel correction it is R^3 --> R^3; each cell's
+       position in the mesh is found once and shared by all the output
+       channels.  Large experiments are interpolated in chunks, optionally
+       across `num_workers` threads.
 
     Examples
     --------
@@ -120,20 +126,23 @@ class BleedthroughPiecewiseOp(HasStrictTraits):
     # traits
     id = Constant('edu.mit.synbio.cytoflow.operations.bleedthrough_piecewise')
     friendly_id = Constant("Piecewise Bleedthrough Correction")
+    row_local = Constant(True)
     
     name = CStr()
 
     controls = Dict(Str, File)
     num_knots = Int(7)
     mesh_size = Int(32)
+    num_workers = util.PositiveInt(1)
 
-    _splines = Dict(Str, Dict(Str, Python))
-    _interpolators = Dict(Str, Python)
+    _splines = Dict(Str, Dict(Str, Python), estimate = True)
+    _interpolators = Dict(Str, Python, estimate = True)
+    _interpolator = Instance(util.GridInterpolator, estimate = True)
     
     # because the order of the channels is important, we can't just call
     # _interpolators.keys()
     # TODO - this is ugly and unpythonic.  :-/
-    _channels = List(Str)
+    _channels = List(Str, estimate = True)
     
     def estimate(self, experiment, subset = None): 
         """
@@ -156,13 +165,9 @@ class BleedthroughPiecewiseOp(HasStrictTraits):
         for channel in self._channels:
             self._splines[channel] = {}
             
-            # make a little Experiment
+            # make a little Experiment, with the previous operations applied
             check_tube(self.controls[channel], experiment)
-            tube_exp = ImportOp(tubes = [Tube(file = self.controls[channel])]).apply()
-            
-            # apply previous operations
-            for op in experiment.history:
-                tube_exp = op.apply(tube_exp)
+            tube_exp = import_control(self.controls[channel], experiment)
                 
             # subset it
             if subset:
@@ -239,23 +244,31 @@ class BleedthroughPiecewiseOp(HasStrictTraits):
                                                           k = 1)
          
         
-        mesh = pandas.DataFrame(util.cartesian(mesh_axes), 
-                                columns = [x for x in self._channels])
-         
-        mesh_corrected = mesh.apply(_correct_bleedthrough,
-                                    axis = 1,
-                                    args = ([[x for x in self._channels], 
-                                             self._splines]))
-        
-        for channel in self._channels:
-            chan_values = np.reshape(mesh_corrected[channel], [len(x) for x in mesh_axes])
-            self._interpolators[channel] = \
-                scipy.interpolate.RegularGridInterpolator(points = mesh_axes, 
-                                                          values = chan_values, 
-                                                          bounds_error = False, 
-                                                          fill_value = 0.0)
+        self._make_interpolators(mesh_axes)
 
         # TODO - some sort of validity checking.
+        
+    def _make_interpolators(self, mesh_axes):
+        """Correct the mesh with the splines, and interpolate it"""
+        
+        mesh = util.cartesian(mesh_axes)
+        mesh_corrected = _correct_bleedthrough(mesh, 
+                                               self._channels, 
+                                               self._splines)
+        
+        mesh_corrected = np.reshape(mesh_corrected, 
+                                    [len(x) for x in mesh_axes] + [len(self._channels)])
+        self._interpolator = util.GridInterpolator(mesh_axes, 
+                                                   mesh_corrected, 
+                                                   fill_value = 0.0)
+        
+        # one interpolator per channel, to correct other controls with
+        self._interpolators = {}
+        for idx, channel in enumerate(self._channels):
+            self._interpolators[channel] = \
+                util.GridInterpolator(mesh_axes,
+                                      mesh_corrected[..., idx],
+                                      fill_value = 0.0)
 
     def apply(self, experiment):
         """Applies the bleedthrough correction to an experiment.
@@ -272,7 +285,7 @@ class BleedthroughPiecewiseOp(HasStrictTraits):
         if not experiment:
             raise util.CytoflowOpError("No experiment specified")
         
-        if not self._interpolators:
+        if not self._interpolator:
             raise util.CytoflowOpError("Module interpolators aren't set. "
                                   "Did you run estimate()?")
             
@@ -283,6 +296,7 @@ class BleedthroughPiecewiseOp(HasStrictTraits):
         
         # get rid of data outside of the interpolators' mesh 
         # (-3 * autofluorescence sigma)
+        keep = np.ones(len(new_experiment.data), dtype = np.bool_)
         for channel in self._channels:     
             
             # if you update the mesh calculation above, update it here too!
@@ -293,15 +307,17 @@ class BleedthroughPiecewiseOp(HasStrictTraits):
             else:
                 mesh_min = -0.01 * experiment.metadata[channel]['range']  # TODO - does this even work?
 
-            new_experiment.data = \
-                new_experiment.data[new_experiment.data[channel] > mesh_min]
+            keep &= (new_experiment.data[channel] > mesh_min).values
         
-        new_experiment.data.reset_index(drop = True, inplace = True)
+        if not np.all(keep):
+            new_experiment.data = new_experiment.data[keep]
+            new_experiment.data.reset_index(drop = True, inplace = True)
         
-        old_data = new_experiment.data[self._channels]
+        corrected = self._interpolator(new_experiment.data[self._channels].values,
+                                       num_workers = self.num_workers)
         
-        for channel in self._channels:
-            new_experiment[channel] = self._interpolators[channel](old_data)
+        for idx, channel in enumerate(self._channels):
+            new_experiment[channel] = corrected[:, idx]
             
             # add the correction splines to the experiment metadata so we can 
             # correct other controls later on
@@ -311,6 +327,40 @@ class BleedthroughPiecewiseOp(HasStrictTraits):
         new_experiment.history.append(self.clone_traits())
         return new_experiment
     
+    def _get_estimate(self):
+        if not self._interpolator:
+            return None
+        
+        # the splines are linear B-splines; keep their knots and coefficients
+        splines = {}
+        for from_channel, to_splines in self._splines.iteritems():
+            splines[from_channel] = {}
+            for to_channel, spline in to_splines.iteritems():
+                t, c, k = spline._eval_args
+                splines[from_channel][to_channel] = [np.asarray(t).tolist(),
+                                                     np.asarray(c).tolist(),
+                                                     k]
+        
+        return {"channels" : list(self._channels),
+                "splines" : splines,
+                "mesh_axes" : [axis.tolist() for axis in self._interpolator.points]}
+        
+    def _set_estimate(self, estimate):
+        self._channels = estimate["channels"]
+        
+        splines = {}
+        for from_channel, to_splines in estimate["splines"].iteritems():
+            splines[from_channel] = {}
+            for to_channel, (t, c, k) in to_splines.iteritems():
+                splines[from_channel][to_channel] = \
+                    scipy.interpolate.UnivariateSpline._from_tck((np.array(t), 
+                                                                  np.array(c), 
+                                                                  k))
+        self._splines = splines
+        
+        # correcting the mesh is quick; no need to save it
+        self._make_interpolators([np.array(axis) for axis in estimate["mesh_axes"]])
+    
     def default_view(self, **kwargs):
         """
         Returns a diagnostic plot to see if the bleedthrough spline estimation
@@ -327,27 +377,90 @@ class BleedthroughPiecewiseOp(HasStrictTraits):
         return BleedthroughPiecewiseDiagnostic(op = self, **kwargs)
     
 # module-level "static" function (doesn't require a class instance)
-def _correct_bleedthrough(row, channels, splines):
-    idx = {channel : idx for idx, channel in enumerate(channels)}
+def _correct_bleedthrough(mesh, channels, splines, max_iter = 50):
+    """
+    Solve for the actual colors at every point in `mesh` at once.
     
-    def channel_error(x, channel):
-        ret = row[channel] - x[idx[channel]]
-        for from_channel in [c for c in channels if c != channel]:
-            ret -= splines[from_channel][channel](x[idx[from_channel]])
-        return ret
+    Each row `y` of `mesh` is a measurement; we're looking for the `x` such
+    that `y[c] = x[c] + sum(splines[f][c](x[f]) for f != c)` for every channel
+    `c`.  Because the splines are piecewise-linear, Newton's method converges
+    in a few iterations, once each row's estimate is on the right segments;
+    so we iterate on the whole mesh as arrays, dropping the rows that have
+    converged, and only fall back to `scipy.optimize.root` (one row at a
+    time) for rows that don't converge (or whose Jacobian is singular.)
     
-    def row_error(x):
-        ret = [channel_error(x, channel) for channel in channels]
-        return ret
+    Parameters
+    ----------
+    mesh : ndarray
+        An (N, len(channels)) array of measured values.
+        
+    channels : List(Str)
+        The channels, in the same order as the columns of `mesh`.
+        
+    splines : Dict(Str, Dict(Str, UnivariateSpline))
+        The bleedthrough from each channel into each other channel.
+        
+    Returns
+    -------
+    ndarray
+        An array the same shape as `mesh` with the corrected values.
+    """
     
-    x_0 = pandas.to_numeric(row.loc[channels])
-    x = scipy.optimize.root(row_error, x_0)
+    n = len(channels)
+    x = np.array(mesh, dtype = np.float64)
+    active = np.arange(len(x))
+    fallback = []
     
-    ret = row.copy()
-    for idx, channel in enumerate(channels):
-        ret[channel] = x.x[idx]
+    for _ in range(max_iter):
+        if len(active) == 0:
+            break
+        
+        y = mesh[active]
+        xa = x[active]
         
-    return ret
+        resid = xa - y
+        jac = np.zeros((len(active), n, n))
+        jac[:, range(n), range(n)] = 1.0
+        
+        for from_idx, from_channel in enumerate(channels):
+            for to_idx, to_channel in enumerate(channels):
+                if from_idx == to_idx:
+                    continue
+                
+                spline = splines[from_channel][to_channel]
+                resid[:, to_idx] += spline(xa[:, from_idx])
+                jac[:, to_idx, from_idx] = spline(xa[:, from_idx], nu = 1)
+        
+        # singular Jacobians get solved one row at a time, below
+        ok = np.abs(np.linalg.det(jac)) > 1e-12
+        if not np.all(ok):
+            fallback.append(active[~ok])
+            active = active[ok]
+            xa, jac, resid = xa[ok], jac[ok], resid[ok]
+            
+        delta = np.linalg.solve(jac, resid[:, :, np.newaxis])[:, :, 0]
+        x[active] = xa - delta
+        
+        converged = np.all(np.abs(delta) <= 1e-10 * (np.abs(xa) + 1.0), axis = 1)
+        active = active[~converged]
+        
+    fallback.append(active)
+    fallback.append(np.flatnonzero(~np.all(np.isfinite(x), axis = 1)))
+    for row in np.unique(np.concatenate(fallback)):
+        x[row] = _correct_row(mesh[row], channels, splines)
+        
+    return x
+
+def _correct_row(row, channels, splines):
+    def row_error(x):
+        ret = row - x
+        for to_idx, to_channel in enumerate(channels):
+            for from_idx, from_channel in enumerate(channels):
+                if from_idx != to_idx:
+                    ret[to_idx] -= splines[from_channel][to_channel](x[from_idx])
+        return ret
+    
+    return scipy.optimize.root(row_error, row).x
         
 @provides(cytoflow.views.IView)
 class BleedthroughPiecewiseDiagnostic(HasStrictTraits):
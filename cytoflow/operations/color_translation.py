@@ -26,7 +26,7 @@ from __future__ import division, absolute_import
 import math
 
 from traits.api import (HasStrictTraits, Str, CStr, File, Dict, Python,
-                        Instance, Tuple, Bool, Constant, provides)
+                        Instance, Tuple, Bool, Constant, Int, provides)
 import numpy as np
 import matplotlib.pyplot as plt
 import sklearn.mixture
@@ -35,10 +35,11 @@ import cytoflow.views
 import cytoflow.utility as util
 
 from .i_operation import IOperation
-from .import_op import Tube, ImportOp, check_tube, parse_tube
+from .estimator import EstimatorMixin
+from .import_op import check_tube, parse_tube, import_control
 
 @provides(IOperation)
-class ColorTranslationOp(HasStrictTraits):
+class ColorTranslationOp(EstimatorMixin, HasStrictTraits):
     """
     Translate measurements from one color's scale to another, using a two-color
     or three-color control.
@@ -68,6 +69,10 @@ class ColorTranslationOp(HasStrictTraits):
         cells and non-expressing cells (as you would get with a transient
         transfection.)  Make sure you check the diagnostic plots!
         
+    estimate_subsample : PositiveInt (default = 0)
+        If greater than 0, estimate each translation from at most this many
+        events (chosen at random) from its control.
+        
     Notes
     -----
     In the TASBE workflow, this operation happens *after* the application of
@@ -98,12 +103,14 @@ class ColorTranslationOp(HasStrictTraits):
     # traits
     id = Constant('edu.mit.synbio.cytoflow.operations.color_translation')
     friendly_id = Constant("Color translation")
+    row_local = Constant(True)
     
     name = CStr()
 
     translation = Dict(Str, Str)
     controls = Dict(Tuple(Str, Str), File, transient = True)
     mixture_model = Bool(False, transient = True)
+    estimate_subsample = util.PositiveInt(0, allow_zero = True)
 
     # The regression coefficients determined by `estimate()`, used to map 
     # colors between channels.  The keys are tuples of (*from-channel*,
@@ -111,7 +118,10 @@ class ColorTranslationOp(HasStrictTraits):
     # values are lists of Float, the log-log coefficients for the color 
     # translation (determined by `estimate()`). 
     # TODO - why can't i make the value List(Float)?
-    _coefficients = Dict(Tuple(Str, Str), Python)
+    _coefficients = Dict(Tuple(Str, Str), Python, estimate = True)
+    
+    # (from-channel, to-channel) --> (events used, events in the control)
+    _subsampled = Dict(Tuple(Str, Str), Tuple(Int, Int))
 
     def estimate(self, experiment, subset = None): 
         """
@@ -122,6 +132,7 @@ class ColorTranslationOp(HasStrictTraits):
             raise util.CytoflowOpError("No experiment specified")
 
         tubes = {}
+        self._subsampled = {}
 
         for from_channel, to_channel in self.translation.iteritems():
             
@@ -141,13 +152,9 @@ class ColorTranslationOp(HasStrictTraits):
             tube_file = self.controls[(from_channel, to_channel)]
             
             if tube_file not in tubes: 
-                # make a little Experiment
+                # make a little Experiment, with the previous operations applied
                 check_tube(tube_file, experiment)
-                tube_exp = ImportOp(tubes = [Tube(file = tube_file)]).apply()
-                
-                # apply previous operations
-                for op in experiment.history:
-                    tube_exp = op.apply(tube_exp) 
+                tube_exp = import_control(tube_file, experiment)
 
                 # subset the events
                 if subset:
@@ -169,6 +176,11 @@ class ColorTranslationOp(HasStrictTraits):
             data = tubes[tube_file][[from_channel, to_channel]]
             data = data[data[from_channel] > 0]
             data = data[data[to_channel] > 0]
+            
+            num_events = len(data)
+            data = util.subsample(data, self.estimate_subsample)
+            self._subsampled[(from_channel, to_channel)] = (len(data), num_events)
+            
             _ = data.reset_index(drop = True, inplace = True)
 
             if self.mixture_model:    
@@ -177,7 +189,7 @@ class ColorTranslationOp(HasStrictTraits):
     
                 # pick the component with the maximum mean
                 mu_idx = 0 if fit.means_[0][0] > fit.means_[1][0] else 1
-                weights = [x[mu_idx] for x in fit.predict_proba(np.log10(data[from_channel][:, np.newaxis]))]
+                weights = fit.predict_proba(np.log10(data[from_channel][:, np.newaxis]))[:, mu_idx]
             else:
                 weights = [1] * len(data.index)
             
@@ -258,7 +270,7 @@ class ColorTranslationOp(HasStrictTraits):
             
             a = coeff[0]
             b = 10 ** coeff[1]
-            trans_fn = lambda x, a=a, b=b: b * np.power(x, a)
+            trans_fn = util.power_law(a, b)
             
             new_experiment[from_channel] = trans_fn(experiment[from_channel])
             new_experiment.metadata[from_channel]['channel_translation_fn'] = trans_fn
@@ -267,6 +279,20 @@ class ColorTranslationOp(HasStrictTraits):
         new_experiment.history.append(self.clone_traits())
         return new_experiment
     
+    def _get_estimate(self):
+        if not self._coefficients:
+            return None
+        
+        return {"coefficients" : [[from_channel, to_channel, 
+                                   np.asarray(coeff).tolist()]
+                                  for (from_channel, to_channel), coeff
+                                  in self._coefficients.iteritems()]}
+        
+    def _set_estimate(self, estimate):
+        self._coefficients = {(from_channel, to_channel) : np.array(coeff)
+                              for from_channel, to_channel, coeff 
+                              in estimate["coefficients"]}
+    
     def default_view(self, **kwargs):
         """
         Returns a diagnostic plot to see if the bleedthrough spline estimation
@@ -363,6 +389,7 @@ class ColorTranslationDiagnostic(HasStrictTraits):
             data = tubes[tube_file][[from_channel, to_channel]]
             data = data[data[from_channel] > 0]
             data = data[data[to_channel] > 0]
+            data = util.subsample(data, self.op.estimate_subsample)
             _ = data.reset_index(drop = True, inplace = True)
 
             if self.op.mixture_model:    
@@ -379,7 +406,7 @@ class ColorTranslationDiagnostic(HasStrictTraits):
                 fit = gmm.fit(np.log10(data[from_channel][:, np.newaxis]))
     
                 mu_idx = 0 if fit.means_[0][0] > fit.means_[1][0] else 1
-                weights = [x[mu_idx] for x in fit.predict_proba(np.log10(data[from_channel][:, np.newaxis]))]
+                weights = fit.predict_proba(np.log10(data[from_channel][:, np.newaxis]))[:, mu_idx]
                 
                 plt.axvline(10 ** fit.means_[0][0], color = 'r')
                 plt.axvline(10 ** fit.means_[1][0], color = 'r')
@@ -412,4 +439,6 @@ class ColorTranslationDiagnostic(HasStrictTraits):
             p = np.poly1d(lr)
             plt.plot(xs, 10 ** p(np.log10(xs)), "--g")
             
+            util.annotate_subsample(self.op._subsampled.get((from_channel, to_channel)))
+            
             plt_idx = plt_idx + 1
@@ -0,0 +1,114 @@
+#!/usr/bin/env python2.7
+
+# (c) Massachusetts Institute of Technology 2015-2016
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+
+import cytoflow.utility as util
+
+# bump this when an operation's estimate changes in a way old code can't read
+ESTIMATE_VERSION = 1
+
+class EstimatorMixin(object):
+    """
+    Save and restore the state that an operation's `estimate()` fits.
+
+    Data-driven operations keep what `estimate()` fits (mixture models,
+    splines, calibration coefficients) in private traits.  Mix this class
+    into one (before `HasStrictTraits`) to get:
+
+     - `get_estimate()`, which returns the fitted state as a versioned dict
+       of plain values (numbers, strings, lists and dicts), so it can be
+       pickled or written as JSON;
+
+     - `set_estimate()`, which restores it -- so a fitted operation can be
+       applied to new data without running `estimate()` again;
+
+     - pickling (and so saving a workflow) that carries the fitted state in
+       that form, instead of the fitted objects themselves.
+
+    The operation implements `_get_estimate()`, which returns a dict (or
+    `None` if `estimate()` hasn't been run), and `_set_estimate(estimate)`.
+    Traits that hold fitted state are tagged with `estimate = True` metadata;
+    they're left out of the pickled traits (but still copied by
+    `clone_traits()`, so the operations in an `Experiment`'s history keep
+    them.)
+    """
+
+    def get_estimate(self):
+        """
+        Get the state fitted by `estimate()`.
+
+        Returns
+        -------
+        Dict
+            The fitted state, including the operation's `id` and the format's
+            `version`; or `None` if `estimate()` hasn't been run.
+        """
+
+        estimate = self._get_estimate()
+        if estimate is None:
+            return None
+
+        estimate["id"] = self.id
+        estimate["version"] = ESTIMATE_VERSION
+        return estimate
+
+    def set_estimate(self, estimate):
+        """
+        Restore state from `get_estimate()`, instead of running `estimate()`.
+
+        Parameters
+        ----------
+        estimate : Dict
+            The result of `get_estimate()` on an operation of the same type.
+
+        Raises
+        ------
+        CytoflowOpError
+            If `estimate` is from a different type of operation, or from a
+            newer version of cytoflow.
+        """
+
+        if estimate.get("id") != self.id:
+            raise util.CytoflowOpError("Estimate is for {0}, not {1}"
+                                       .format(estimate.get("id"), self.id))
+
+        if estimate.get("version", 0) > ESTIMATE_VERSION:
+            raise util.CytoflowOpError("Estimate version {0} is newer than "
+                                       "this version of cytoflow can read"
+                                       .format(estimate.get("version")))
+
+        self._set_estimate(estimate)
+
+    def __getstate__(self):
+        state = super(EstimatorMixin, self).__getstate__()
+
+        for name in self.trait_names(estimate = True):
+            state.pop(name, None)
+
+        estimate = self.get_estimate()
+        if estimate is not None:
+            state["_estimate"] = estimate
+
+        return state
+
+    def __setstate__(self, state, trait_change_notify = True):
+        estimate = state.pop("_estimate", None)
+        super(EstimatorMixin, self).__setstate__(state, trait_change_notify)
+
+        if estimate is not None:
+            self.set_estimate(estimate)
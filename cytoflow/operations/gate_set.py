@@ -0,0 +1,180 @@
+#!/usr/bin/env python2.7
+
+# (c) Massachusetts Institute of Technology 2015-2016
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import, division
+
+from traits.api import HasStrictTraits, List, Any, Constant, provides
+
+import numpy as np
+import pandas as pd
+
+import cytoflow.utility as util
+
+from .i_operation import IOperation
+
+# the comparisons a gate's bounds can use
+_COMPARISONS = {"<" : np.less,
+                "<=" : np.less_equal,
+                ">" : np.greater,
+                ">=" : np.greater_equal}
+
+@provides(IOperation)
+class GateSetOp(HasStrictTraits):
+    """
+    Apply many rectangular gates to an experiment at once.
+    
+    Applying a `ThresholdOp`, `RangeOp`, `Range2DOp` or `QuadOp` clones
+    the experiment and makes a pass over the data for one new column; a
+    gating tree with a dozen of them makes a dozen clones and passes.
+    `GateSetOp` compiles its `gates` into a list of bounds on their
+    channels, evaluates every gate in one pass over the events (a block of
+    rows at a time, computing each distinct comparison once per block), and
+    adds all the new columns to a single clone.
+    
+    The result is the same as applying the gates one after the other:
+    the same columns (with the same types), the same metadata, and each
+    gate in the new experiment's `history`.
+    
+    Attributes
+    ----------
+    gates : List(IOperation)
+        The gates to apply, in order.  Each must be a `ThresholdOp`,
+        `RangeOp`, `Range2DOp` or `QuadOp` (or anything else that provides
+        a `_compile()` method), with a distinct `name`.
+    
+    block_size : PositiveInt (default = 65536)
+        How many events to gate at a time.
+    
+    Examples
+    --------
+    >>> gates = flow.GateSetOp(gates = [flow.ThresholdOp(name = "Y2_High",
+    ...                                                  channel = "Y2-A",
+    ...                                                  threshold = 200),
+    ...                                 flow.QuadOp(name = "Quad",
+    ...                                             xchannel = "V2-A",
+    ...                                             xthreshold = 100,
+    ...                                             ychannel = "Y2-A",
+    ...                                             ythreshold = 1000)])
+    >>> ex3 = gates.apply(ex2)
+    """
+    
+    # traits
+    id = Constant('edu.mit.synbio.cytoflow.operations.gate_set')
+    friendly_id = Constant("Gate Set")
+    row_local = Constant(True)
+    
+    gates = List(Any)
+    block_size = util.PositiveInt(65536)
+    
+    def apply(self, experiment):
+        """
+        Applies the gates to an experiment.
+        
+        Parameters
+        ----------
+        experiment : Experiment
+            the experiment to which the gates are applied
+        
+        Returns
+        -------
+            a new experiment, the same as `experiment` but with a new
+            column for each gate in `gates`.
+        """
+        
+        if experiment is None:
+            raise util.CytoflowOpError("No experiment specified")
+        
+        if not self.gates:
+            raise util.CytoflowOpError("No gates specified")
+        
+        compiled = []
+        for gate in self.gates:
+            if not hasattr(gate, "_compile"):
+                raise util.CytoflowOpError("{0} isn't a rectangular gate"
+                                           .format(type(gate).__name__))
+            
+            if gate.name in [g.name for g, _, _ in compiled]:
+                raise util.CytoflowOpError("More than one gate is named {0}"
+                                           .format(gate.name))
+            
+            dtype, regions = gate._compile(experiment)
+            compiled.append((gate, dtype, regions))
+        
+        # one output per gate: a bool for "bool" gates, and the index of the
+        # region (or -1 if none) for "category" gates
+        n = len(experiment)
+        out = []
+        for _, dtype, regions in compiled:
+            if dtype == "bool":
+                out.append(np.zeros(n, dtype = np.bool_))
+            else:
+                out.append(np.full(n, -1, dtype = np.int8))
+        
+        channels = set(channel
+                       for _, _, regions in compiled
+                       for _, bounds in regions
+                       for channel, _, _ in bounds)
+        data = {channel : experiment.data[channel].values
+                for channel in channels}
+        
+        for start in range(0, n, self.block_size):
+            s = slice(start, min(start + self.block_size, n))
+            
+            # each distinct (channel, comparison, value) once per block
+            cache = {}
+            def compare(bound):
+                if bound not in cache:
+                    channel, op, value = bound
+                    cache[bound] = _COMPARISONS[op](data[channel][s], value)
+                return cache[bound]
+            
+            for (_, dtype, regions), gate_out in zip(compiled, out):
+                for code, (_, bounds) in enumerate(regions):
+                    inside = compare(bounds[0])
+                    if len(bounds) > 1:
+                        inside = inside.copy()
+                        for bound in bounds[1:]:
+                            inside &= compare(bound)
+                    
+                    if dtype == "bool":
+                        gate_out[s] = inside
+                    else:
+                        gate_out[s][inside] = code
+        
+        new_experiment = experiment.clone()
+        for (gate, dtype, regions), gate_out in zip(compiled, out):
+            if dtype == "bool":
+                values = pd.Series(gate_out, index = experiment.data.index)
+            else:
+                # like a Series of labels (and None) converted to "category":
+                # only the regions that have events are categories.  (this
+                # is remove_unused_categories(), without sorting the codes.)
+                used = np.bincount(gate_out + 1,
+                                   minlength = len(regions) + 1)[1:] > 0
+                if not used.all():
+                    recode = np.full(len(regions) + 1, -1, dtype = np.int8)
+                    recode[1:][used] = np.arange(used.sum())
+                    gate_out = recode.take(gate_out + 1)
+
+                cats = [label for (label, _), u in zip(regions, used) if u]
+                values = pd.Series(pd.Categorical.from_codes(gate_out, cats),
+                                   index = experiment.data.index)
+            
+            new_experiment.add_condition(gate.name, dtype, values)
+            new_experiment.history.append(gate.clone_traits())
+        
+        return new_experiment
@@ -24,7 +24,7 @@ Created on Dec 16, 2015
 from __future__ import division, absolute_import
 
 from traits.api import (HasStrictTraits, Str, CStr, Dict, Any,
-                        Instance, Bool, Constant, Int, Float, List,
+                        Instance, Bool, Constant, Int, Float, List, Tuple,
                         provides, DelegatesTo)
 
 import numpy as np
@@ -38,9 +38,10 @@ import cytoflow.views
 import cytoflow.utility as util
 
 from .i_operation import IOperation
+from .estimator import EstimatorMixin
 
 @provides(IOperation)
-class GaussianMixture2DOp(HasStrictTraits):
+class GaussianMixture2DOp(EstimatorMixin, HasStrictTraits):
     """
     This module fits a 2D Gaussian mixture model with a specified number of
     components to a pair of channels.
@@ -103,6 +104,46 @@ class GaussianMixture2DOp(HasStrictTraits):
         If `True`, add a column named `{Name}_Posterior` giving the posterior
         probability that the event is in the component to which it was
         assigned.  Useful for filtering out low-probability events.
+        
+    estimate_subsample : PositiveInt (default = 0)
+        If greater than 0, fit the model to at most this many events (chosen
+        at random) from each group.  `apply()` still uses all the events.
+        
+    num_workers : PositiveInt (default = 1)
+        How many processes to use to fit the groups' models in `estimate()`.
+        Each group is fit independently (and the same way), so the models
+        don't depend on `num_workers`.  If `estimate()` is called while 
+        other threads are running (as it is in the GUI), the processes 
+        must be started beforehand with `util.start_process_pool()`; 
+        otherwise the groups are fit on threads, with a warning.  (See 
+        `util.process_map()`.)
+        
+    apply_bins : PositiveInt (default = 0)
+        If greater than 0, `apply()` classifies a grid with this many cells
+        along each (scaled) axis, spanning each group's data, and then looks
+        each event up in the grid instead of evaluating the model on every
+        event.  Much faster for large data sets; events within a cell of a
+        component's boundary may be misassigned, so use a fine grid 
+        (1000 or so.)
+        
+    estimate_batch_size : PositiveInt (default = 0)
+        If greater than 0, fit each group's model with incremental EM over
+        batches of this many events, instead of with `mixture.GMM.fit()`.
+        The fit's working memory (the responsibilities and the other
+        per-event temporaries, `num_components` values per event for 
+        `mixture.GMM.fit()`) is bounded by the batch size instead of the 
+        group size, and the parameters are updated after every batch, so
+        large groups converge in fewer passes.  (The model is started from
+        a fit to one batch of randomly chosen events.)  `estimate()` still 
+        makes one scaled copy of the events it fits (two `float64`s per 
+        event), since it hands each group's events to the worker processes
+        whole (see `num_workers`); use `estimate_subsample` to bound that.
+        
+    warm_start : Bool (default = False)
+        If `True` and `estimate()` has already fit a model to a group (with
+        the same `num_components`), start fitting from that model instead of
+        from scratch.  Re-estimating after a small change then takes only a
+        few passes over the data.
     
     Examples
     --------
@@ -129,11 +170,19 @@ class GaussianMixture2DOp(HasStrictTraits):
     by = List(Str)
     
     posteriors = Bool(False)
+    estimate_subsample = util.PositiveInt(0, allow_zero = True)
+    num_workers = util.PositiveInt(1)
+    apply_bins = util.PositiveInt(0, allow_zero = True)
+    estimate_batch_size = util.PositiveInt(0, allow_zero = True)
+    warm_start = Bool(False)
     
     # the key is either a single value or a tuple
-    _gmms = Dict(Any, Instance(mixture.GMM))
-    _xscale = Instance(util.IScale)
-    _yscale = Instance(util.IScale)
+    _gmms = Dict(Any, Instance(mixture.GMM), estimate = True)
+    
+    # group --> (events used to fit the model, events in the group)
+    _subsampled = Dict(Any, Tuple(Int, Int))
+    _xscale = Instance(util.IScale, estimate = True)
+    _yscale = Instance(util.IScale, estimate = True)
     
     def estimate(self, experiment, subset = None):
         """
@@ -162,12 +211,19 @@ class GaussianMixture2DOp(HasStrictTraits):
                                       " accidentally specify a data channel?"
                                       .format(b))
                 
+        # fit the model to at most estimate_subsample events per group
+        data = util.subsample(experiment.data, self.estimate_subsample, self.by)
+                
         if self.by:
-            groupby = experiment.data.groupby(self.by)
+            groupby = data.groupby(self.by)
+            group_sizes = experiment.data.groupby(self.by).size()
         else:
             # use a lambda expression to return a group that contains
             # all the events
-            groupby = experiment.data.groupby(lambda x: True)
+            groupby = data.groupby(lambda x: True)
+            group_sizes = {True : len(experiment.data)}
+            
+        self._subsampled = {}
             
         # get the scale. estimate the scale params for the ENTIRE data set,
         # not subsets we get from groupby().  And we need to save it so that
@@ -175,20 +231,39 @@ class GaussianMixture2DOp(HasStrictTraits):
         self._xscale = util.scale_factory(self.xscale, experiment, self.xchannel)
         self._yscale = util.scale_factory(self.yscale, experiment, self.ychannel)
             
+        groups = []
+        group_data = []
         for group, data_subset in groupby:
+            self._subsampled[group] = (len(data_subset), group_sizes[group])
+            
             x = data_subset.loc[:, [self.xchannel, self.ychannel]]
             x[self.xchannel] = self._xscale(x[self.xchannel])
             x[self.ychannel] = self._yscale(x[self.ychannel])
             
             # drop data that isn't in the scale range
             x = x[~(np.isnan(x[self.xchannel]) | np.isnan(x[self.ychannel]))]
-            x = x.values
             
-            gmm = mixture.GMM(n_components = self.num_components,
-                              covariance_type = "full",
-                              random_state = 1)
-            gmm.fit(x)
+            groups.append(group)
+            group_data.append(x.values)
             
+        num_components = self.num_components
+        batch_size = self.estimate_batch_size
+        
+        # the models to start from, if we're warm-starting
+        inits = []
+        for group in groups:
+            init = self._gmms.get(group) if self.warm_start else None
+            if init is not None and len(init.means_) != num_components:
+                init = None
+            inits.append(init)
+        
+        # fit the groups' models in parallel
+        gmms = util.process_map(_fit_gmm, 
+                                [(x, init, num_components, batch_size)
+                                 for x, init in zip(group_data, inits)], 
+                                self.num_workers)
+            
+        for group, gmm in zip(groups, gmms):
             if not gmm.converged_:
                 raise util.CytoflowOpError("Estimator didn't converge"
                                       " for group {0}"
@@ -275,10 +350,11 @@ class GaussianMixture2DOp(HasStrictTraits):
         if self.sigma < 0.0:
             raise util.CytoflowOpError("sigma must be >= 0.0")
         
-        event_assignments = pd.Series([None] * len(experiment), dtype = "object")
-
-        if self.posteriors:
-            event_posteriors = pd.Series([0.0] * len(experiment))
+        # the component each event is in (-1 for none), and its posterior
+        # big enough for -1 and num_components (the "None" category)
+        predicted = np.full(len(experiment), -1, 
+                            np.min_scalar_type(-(self.num_components + 1)))
+        posteriors = np.zeros(len(experiment))
             
         # what we DON'T want to do is iterate through event-by-event.
         # the more of this we can push into numpy, sklearn and pandas,
@@ -286,93 +362,43 @@ class GaussianMixture2DOp(HasStrictTraits):
         # we don't use Ellipse.contains().  
         
         if self.by:
-            groupby = experiment.data.groupby(self.by)
+            groups = experiment.data.groupby(self.by).indices
         else:
-            # use a lambda expression to return a group that
-            # contains all the events
-            groupby = experiment.data.groupby(lambda x: True)
+            groups = {True : np.arange(len(experiment))}
+            
+        x_data = experiment.data[self.xchannel].values
+        y_data = experiment.data[self.ychannel].values
         
-        for group, data_subset in groupby:
+        for group, group_idx in groups.iteritems():
             gmm = self._gmms[group]
-            x = data_subset.loc[:, [self.xchannel, self.ychannel]]
-            x[self.xchannel] = self._xscale(x[self.xchannel])
-            x[self.ychannel] = self._yscale(x[self.ychannel])
+            x = np.column_stack((self._xscale(x_data[group_idx]),
+                                 self._yscale(y_data[group_idx])))
             
-            # which values are missing?
-            x_na = np.isnan(x[self.xchannel]) | np.isnan(x[self.ychannel])
-            x_na = x_na.values
+            # which values can't be classified (missing, or out of the 
+            # scales' ranges)?
+            x_na = ~np.isfinite(x).all(axis = 1)
             
-            x = x.values
-            group_idx = groupby.groups[group]
-
-            # make a preliminary assignment
-            predicted = np.full(len(x), -1, "int")
-            predicted[~x_na] = gmm.predict(x[~x_na])
+            # the events we can classify
+            idx = group_idx[~x_na]
             
-            # if we're doing sigma-based gating, for each component check
-            # to see if the event is in the sigma gate.
-            if self.sigma > 0.0:
-                
-                # make a quick dataframe with the value and the predicted
-                # component
-                gate_df = pd.DataFrame({"x" : x[:, 0], 
-                                        "y" : x[:, 1],
-                                        "p" : predicted})
-
-                # for each component, get the ellipse that follows the isoline
-                # around the mixture component
-                # cf. http://scikit-learn.org/stable/auto_examples/mixture/plot_gmm.html
-                # and http://www.mathworks.com/matlabcentral/newsreader/view_thread/298389
-                # and http://stackoverflow.com/questions/7946187/point-and-ellipse-rotated-position-test-algorithm
-                # i am not proud of how many tries this took me to get right.
-
-                for c in range(0, self.num_components):
-                    mean = gmm.means_[c]
-                    covar = gmm._get_covars()[c]
-                    
-                    # xc is the center on the x axis
-                    # yc is the center on the y axis
-                    xc = mean[0]  # @UnusedVariable
-                    yc = mean[1]  # @UnusedVariable
-                    
-                    v, w = linalg.eigh(covar)
-                    u = w[0] / linalg.norm(w[0])
-                    
-                    # xl is the length along the x axis
-                    # yl is the length along the y axis
-                    xl = np.sqrt(v[0]) * self.sigma  # @UnusedVariable
-                    yl = np.sqrt(v[1]) * self.sigma  # @UnusedVariable
-                    
-                    # t is the rotation in radians (counter-clockwise)
-                    t = 2 * np.pi - np.arctan(u[1] / u[0])
-                    
-                    sin_t = np.sin(t)  # @UnusedVariable
-                    cos_t = np.cos(t)  # @UnusedVariable
-                                        
-                    # and build an expression with numexpr so it evaluates fast!
-
-                    gate_bool = gate_df.eval("p == @c and "
-                                             "((x - @xc) * @cos_t - (y - @yc) * @sin_t) ** 2 / ((@xl / 2) ** 2) + "
-                                             "((x - @xc) * @sin_t + (y - @yc) * @cos_t) ** 2 / ((@yl / 2) ** 2) <= 1").values
-
-                    predicted[np.logical_and(predicted == c, gate_bool == False)] = -1
+            if self.apply_bins:
+                # classify a grid over the data once, then look events up
+                predicted[idx], posteriors[idx] = \
+                    util.grid_lookup(lambda g: self._classify(gmm, g),
+                                     x[~x_na],
+                                     self.apply_bins)
+            else:
+                predicted[idx], posteriors[idx] = \
+                    self._classify(gmm, x[~x_na])
             
-            predicted_str = pd.Series(["(none)"] * len(predicted))
-            for c in range(0, self.num_components):
-                predicted_str[predicted == c] = "{0}_{1}".format(self.name, c + 1)
-            predicted_str[predicted == -1] = "{0}_None".format(self.name)
-            predicted_str.index = group_idx
-
-            event_assignments.iloc[group_idx] = predicted_str
-                    
-            if self.posteriors:
-                probability = np.full((len(x), self.num_components), 0.0, "float")
-                probability[~x_na, :] = gmm.predict_proba(x[~x_na, :])
-                posteriors = pd.Series([0.0] * len(predicted))
-                for c in range(0, self.num_components):
-                    posteriors[predicted == c] = probability[predicted == c, c]
-                posteriors.index = group_idx
-                event_posteriors.iloc[group_idx] = posteriors
+        # wrap the codes as a categorical; no component is the last
+        # category, name_None
+        predicted[predicted == -1] = self.num_components
+        categories = ["{0}_{1}".format(self.name, c + 1) 
+                      for c in range(self.num_components)]
+        categories.append("{0}_None".format(self.name))
+        event_assignments = pd.Series(pd.Categorical.from_codes(predicted, 
+                                                                categories))
                     
         new_experiment = experiment.clone()
         
@@ -383,11 +409,110 @@ class GaussianMixture2DOp(HasStrictTraits):
             
         if self.posteriors:
             col_name = "{0}_Posterior".format(self.name)
-            new_experiment.add_condition(col_name, "float", event_posteriors)
+            new_experiment.add_condition(col_name, "float", pd.Series(posteriors))
                     
         new_experiment.history.append(self.clone_traits())
         return new_experiment
     
+    def _get_estimate(self):
+        if not self._gmms:
+            return None
+        
+        return {"xscale" : self._xscale.get_state(),
+                "yscale" : self._yscale.get_state(),
+                "gmms" : [{"group" : group,
+                           "weights" : gmm.weights_.tolist(),
+                           "means" : gmm.means_.tolist(),
+                           "covars" : gmm.covars_.tolist()}
+                          for group, gmm in self._gmms.iteritems()]}
+        
+    def _set_estimate(self, estimate):
+        self._xscale = util.scale_from_state(estimate["xscale"])
+        self._yscale = util.scale_from_state(estimate["yscale"])
+        
+        gmms = {}
+        for fit in estimate["gmms"]:
+            gmm = mixture.GMM(n_components = len(fit["weights"]),
+                              covariance_type = "full",
+                              random_state = 1)
+            gmm.weights_ = np.array(fit["weights"])
+            gmm.means_ = np.array(fit["means"])
+            gmm.covars_ = np.array(fit["covars"])
+            gmm.converged_ = True
+            
+            # JSON turns tuples (groups with more than one condition) into
+            # lists
+            group = fit["group"]
+            if isinstance(group, list):
+                group = tuple(group)
+            gmms[group] = gmm
+            
+        self._gmms = gmms
+    
+    def _classify(self, gmm, x):
+        """
+        Assign each row of `x` (an (N, 2) array of scaled values) to a 
+        component of `gmm`, or -1 if it's not in any component's `sigma`
+        gate.  Returns the assignments and the posterior probability of 
+        each event in its component (0.0 if it isn't in one.)
+        """
+        
+        probability = gmm.predict_proba(x)
+        predicted = probability.argmax(axis = 1)
+        
+        # if we're doing sigma-based gating, for each component check
+        # to see if the event is in the sigma gate.
+        if self.sigma > 0.0:
+            
+            # make a quick dataframe with the value and the predicted
+            # component
+            gate_df = pd.DataFrame({"x" : x[:, 0], 
+                                    "y" : x[:, 1],
+                                    "p" : predicted})
+
+            # for each component, get the ellipse that follows the isoline
+            # around the mixture component
+            # cf. http://scikit-learn.org/stable/auto_examples/mixture/plot_gmm.html
+            # and http://www.mathworks.com/matlabcentral/newsreader/view_thread/298389
+            # and http://stackoverflow.com/questions/7946187/point-and-ellipse-rotated-position-test-algorithm
+            # i am not proud of how many tries this took me to get right.
+
+            for c in range(0, self.num_components):
+                mean = gmm.means_[c]
+                covar = gmm._get_covars()[c]
+                
+                # xc is the center on the x axis
+                # yc is the center on the y axis
+                xc = mean[0]  # @UnusedVariable
+                yc = mean[1]  # @UnusedVariable
+                
+                v, w = linalg.eigh(covar)
+                u = w[0] / linalg.norm(w[0])
+                
+                # xl is the length along the x axis
+                # yl is the length along the y axis
+                xl = np.sqrt(v[0]) * self.sigma  # @UnusedVariable
+                yl = np.sqrt(v[1]) * self.sigma  # @UnusedVariable
+                
+                # t is the rotation in radians (counter-clockwise)
+                t = 2 * np.pi - np.arctan(u[1] / u[0])
+                
+                sin_t = np.sin(t)  # @UnusedVariable
+                cos_t = np.cos(t)  # @UnusedVariable
+                                    
+                # and build an expression with numexpr so it evaluates fast!
+
+                gate_bool = gate_df.eval("p == @c and "
+                                         "((x - @xc) * @cos_t - (y - @yc) * @sin_t) ** 2 / ((@xl / 2) ** 2) + "
+                                         "((x - @xc) * @sin_t + (y - @yc) * @cos_t) ** 2 / ((@yl / 2) ** 2) <= 1").values
+
+                predicted[np.logical_and(predicted == c, gate_bool == False)] = -1
+        
+        posteriors = probability[np.arange(len(x)), predicted]
+        posteriors[predicted == -1] = 0.0
+        
+        return predicted, posteriors
+    
     def default_view(self, **kwargs):
         """
         Returns a diagnostic plot of the Gaussian mixture model.
@@ -480,6 +605,8 @@ class GaussianMixture2DView(cytoflow.views.ScatterplotView):
         
         gmm = self.op._gmms[self.group] if self.group else self.op._gmms[True]
         
+        util.annotate_subsample(self.op._subsampled.get(self.group if self.group else True))
+        
         for i, (mean, covar) in enumerate(zip(gmm.means_, gmm._get_covars())):    
             v, w = linalg.eigh(covar)
             u = w[0] / linalg.norm(w[0])
@@ -535,7 +662,137 @@ class GaussianMixture2DView(cytoflow.views.ScatterplotView):
         scaled_path = path.Path(v, tf_path.codes)
         scaled_patch = patches.PathPatch(scaled_path, **kwargs)
         plt.gca().add_patch(scaled_patch)
-            
-             
 
+def _fit_gmm(args):
+    """
+    Fit one group's model; `args` is `(x, init, num_components, batch_size)`.
+    (Module-level, so `util.process_map()` can send it to another process.)
+    """
+    
+    x, init, num_components, batch_size = args
+    if batch_size:
+        return _streaming_gmm(x, num_components, batch_size, init)
+    
+    gmm = mixture.GMM(n_components = num_components,
+                      covariance_type = "full",
+                      random_state = 1)
+    if init is not None:
+        gmm.init_params = ""
+        gmm.weights_ = init.weights_.copy()
+        gmm.means_ = init.means_.copy()
+        gmm.covars_ = init.covars_.copy()
+    gmm.fit(x)
+    return gmm
+
+def _streaming_gmm(x, num_components, batch_size, init = None):
+    """
+    Fit a 2D Gaussian mixture model to `x` with incremental EM (Neal and 
+    Hinton, 1998) over batches of `batch_size` events.  Each batch's 
+    sufficient statistics are kept, and the parameters are re-estimated 
+    after each batch replaces its old statistics with new ones, so the
+    temporaries (beyond `x` itself) are bounded by `batch_size` instead 
+    of `len(x)`.  Uses the same defaults (and the same convergence 
+    criterion) as `mixture.GMM`, and starts from `init` (a fitted 
+    `mixture.GMM`) if it's given.  Returns a fitted `mixture.GMM`.
+    """
+    
+    gmm = mixture.GMM(n_components = num_components,
+                      covariance_type = "full",
+                      random_state = 1)
+    
+    x = np.asarray(x, dtype = np.float64)
+    n, d = x.shape
+    batches = [slice(i, min(i + batch_size, n)) for i in range(0, n, batch_size)]
+    
+    if init is not None:
+        weights = init.weights_.copy()
+        means = init.means_.copy()
+        covars = init.covars_.copy()
+    else:
+        # start from a model fit to one batch of randomly chosen events
+        if n > batch_size:
+            idx = np.random.RandomState(1).choice(n, batch_size, replace = False)
+            start = x[np.sort(idx)]
+        else:
+            start = x
+        start_gmm = mixture.GMM(n_components = num_components,
+                                covariance_type = "full",
+                                random_state = 1)
+        start_gmm.fit(start)
+        weights = start_gmm.weights_
+        means = start_gmm.means_
+        covars = start_gmm.covars_
+    
+    # keep the statistics centered, so the covariances don't lose
+    # precision when they're computed from sums of squares
+    center = np.mean(x, axis = 0)
+    means = means - center
+        
+    eps = np.finfo(np.float64).eps
+    
+    # each batch's sufficient statistics: the sum of the responsibilities,
+    # of the responsibility-weighted events and of their outer products
+    batch_stats = [None] * len(batches)
+    resp_sum = np.zeros(num_components)
+    x_sum = np.zeros((num_components, d))
+    xx_sum = np.zeros((num_components, d, d))
+    
+    log_likelihood = None
+    gmm.converged_ = False
+    
+    for _ in range(gmm.n_iter):
+        pass_log_likelihood = 0.0
+        
+        for i, batch in enumerate(batches):
+            xb = x[batch] - center
+            
+            # E step
+            log_p = np.empty((len(xb), num_components))
+            for k in range(num_components):
+                chol = linalg.cholesky(covars[k], lower = True)
+                sol = linalg.solve_triangular(chol, (xb - means[k]).T, lower = True)
+                log_p[:, k] = (np.log(weights[k])
+                               - 0.5 * (d * np.log(2 * np.pi)
+                                        + 2 * np.sum(np.log(np.diagonal(chol)))
+                                        + np.sum(sol ** 2, axis = 0)))
+            log_p_max = np.max(log_p, axis = 1)
+            log_event = log_p_max + np.log(np.sum(np.exp(log_p - log_p_max[:, np.newaxis]), axis = 1))
+            resp = np.exp(log_p - log_event[:, np.newaxis])
+            pass_log_likelihood += np.sum(log_event)
+            
+            # swap this batch's statistics into the totals
+            stats = (resp.sum(axis = 0),
+                     np.dot(resp.T, xb),
+                     np.array([np.dot(xb.T * resp[:, k], xb) 
+                               for k in range(num_components)]))
+            if batch_stats[i] is not None:
+                resp_sum -= batch_stats[i][0]
+                x_sum -= batch_stats[i][1]
+                xx_sum -= batch_stats[i][2]
+            resp_sum += stats[0]
+            x_sum += stats[1]
+            xx_sum += stats[2]
+            batch_stats[i] = stats
+            
+            # M step, once every batch has been seen
+            if batch_stats[-1] is None:
+                continue
+            
+            weights = resp_sum / (resp_sum.sum() + 10 * eps) + eps
+            means = x_sum / (resp_sum[:, np.newaxis] + 10 * eps)
+            covars = (xx_sum / (resp_sum[:, np.newaxis, np.newaxis] + 10 * eps)
+                      - means[:, :, np.newaxis] * means[:, np.newaxis, :]
+                      + gmm.min_covar * np.eye(d))
+        
+        prev_log_likelihood = log_likelihood
+        log_likelihood = pass_log_likelihood / n
+        if prev_log_likelihood is not None and \
+           abs(log_likelihood - prev_log_likelihood) < gmm.tol:
+            gmm.converged_ = True
+            break
+        
+    gmm.means_ = means + center
+    gmm.covars_ = covars
+    gmm.weights_ = weights
     
+    return gmm
@@ -74,6 +74,7 @@ class HlogTransformOp(HasStrictTraits):
     # traits
     id = Constant('edu.mit.synbio.cytoflow.operations.hlog')
     friendly_id = Constant("Hyperlog")
+    row_local = Constant(True)
     name = Str()
     channels = List(Str)
     b = Dict(Str, Float)
@@ -145,7 +146,6 @@ class HlogTransformOp(HasStrictTraits):
 # thanks, Eugene!
 
 import numpy as np
-import scipy.optimize
 
 _machine_max = 2**18
 _l_mmax = np.log10(_machine_max)
@@ -163,14 +163,47 @@ def hlog_inv(y, b=500, r=_display_max, d=_l_mmax):
         s = 1
     return s*10**(s*aux) + b*aux - s
 
-def _make_hlog_numeric(b, r, d):
+def _hlog_solve(x, b, r, d):
     '''
-    Return a function that numerically computes the hlog transformation for given parameter values.
+    Solve hlog_inv(y, b, r, d) = x for y, for a whole array x at once.
+    
+    hlog_inv is odd, and for y >= 0 it's increasing and convex, so we solve
+    for abs(x) and copy the sign back.  Newton's method on a convex, 
+    increasing function converges monotonically from any starting point 
+    above the root, and each of the two terms of hlog_inv alone gives 
+    such a point: the smaller of the two is also asymptotically exact in 
+    the linear and log regions, so only the values near the transition need
+    more than a few iterations.
     '''
-    hlog_obj = lambda y, x, b, r, d: hlog_inv(y, b, r, d) - x
-    find_inv = np.vectorize(lambda x: scipy.optimize.brentq(hlog_obj, -2*r, 2*r, 
-                                        args=(x, b, r, d)))
-    return find_inv 
+    k = d / r
+    y = np.array(x, dtype = "float64")
+    finite = np.isfinite(y)
+    ax = np.abs(y[finite])
+    
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        y0 = np.fmin(np.log10(ax + 1) / k, ax / (b * k))
+        
+    # only keep iterating on the values that haven't converged.  "converged"
+    # means the step is down to the rounding error in evaluating hlog_inv.
+    eps = np.finfo("float64").eps
+    todo = np.arange(len(y0))
+    for _ in range(100):
+        yt = y0[todo]
+        at = ax[todo]
+        e = 10 ** (k * yt)
+        bky = b * k * yt
+        slope = k * (np.log(10) * e + b)
+        delta = (e + bky - 1 - at) / slope
+        y0[todo] = yt - delta
+        
+        done = np.abs(delta) <= 4 * eps * (yt + (e + bky + 1 + at) / slope)
+        todo = todo[~done]
+        if not len(todo):
+            break
+        
+    # non-finite values are left alone
+    y[finite] = np.copysign(y0, y[finite])
+    return y
 
 def hlog(x, b=500, r=_display_max, d=_l_mmax):
     '''
@@ -193,14 +226,12 @@ def hlog(x, b=500, r=_display_max, d=_l_mmax):
     -------
     Array of transformed values.
     '''
-    hlog_fun = _make_hlog_numeric(b, r, d)
     if not hasattr(x, '__len__'): #if transforming a single number
-        y = hlog_fun(x)
+        y = _hlog_solve(x, b, r, d)
     else:
         n = len(x)
         if not n: #if transforming empty container
             return x
         else:
-            y = hlog_fun(x)
+            y = _hlog_solve(x, b, r, d)
     return y
-
@@ -22,6 +22,13 @@ from traits.api import Interface, Str
 class IOperation(Interface):
     """The basic interface for an operation on cytometry data.
     
+    Data-driven operations that keep what `estimate()` fits in private
+    traits (mixture models, splines, calibration coefficients) also have
+    `get_estimate()` and `set_estimate()`, from `EstimatorMixin`.  They
+    save that state as a versioned dict of plain values and restore it, so
+    a pickled (or saved) operation can be applied to new data without
+    running `estimate()` again.
+    
     Attributes
     ----------
     id : Str
@@ -34,6 +41,22 @@ class IOperation(Interface):
     name : Str
         The name of this IOperation instance (like "Debris Filter").  Useful for
         UI implementations; sometimes used for naming gates' metadata
+        
+    row_local : Bool (optional)
+        If `True`, `apply()` computes each event's result from that event 
+        alone (and the operation's parameters), so applying the operation
+        to some new events and appending them to a previous result is the 
+        same as re-applying it to all the events.  `ImportOp.update()` 
+        relies on this.  Operations that don't define it are assumed not
+        to be row-local.
+        
+    estimate_subsample : PositiveInt (optional)
+        For data-driven operations: if greater than 0, `estimate()` uses at
+        most this many events from each group (each combination of the
+        `by` conditions, or each control), chosen at random with a fixed 
+        seed by `util.subsample()`.  `apply()` still uses every event.  
+        The number of events used and available are kept in `_subsampled`
+        (keyed by group) and reported on the diagnostic plots.
     """
     
     # interface traits
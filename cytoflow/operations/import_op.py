@@ -22,13 +22,16 @@ Created on Mar 20, 2015
 '''
 from __future__ import absolute_import
 
-import warnings
+import warnings, os, math, threading, json, hashlib, shutil, random
+import cPickle as pickle
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 
 from traits.api import (HasTraits, HasStrictTraits, provides, Str, List, Bool, Int, Any,
                         Dict, File, Constant, Enum)
 
-import fcsparser
 import numpy as np
+import pandas as pd
 
 import cytoflow.utility as util
 
@@ -81,7 +84,9 @@ class ImportOp(HasStrictTraits):
     set `coarse` to `True` and `coarse_events` to the number of events from
     each FCS file you want to load.
     
-    Call `apply()` to load the data.
+    Call `apply()` to load the data.  If more tubes are added to `tubes`
+    later, call `update()` to add just those tubes to the `Experiment` (or to
+    an `Experiment` derived from it.)
     
     Attributes
     ----------
@@ -97,15 +102,27 @@ class ImportOp(HasStrictTraits):
         experimental conditions.  Each `Tube` must have a `conditions` dict
         whose keys match `self.conditions.keys()`.
         
-    channels = List(Str)
+    channels : List(Str)
         If you only need a subset of the channels available in the data set,
-        specify them here.
+        specify them here (by their names in the FCS files.)  Only these 
+        channels are read from the FCS files and stored in the `Experiment`.
+        If empty (the default), import every channel.
+        
+    channel_renames : Dict(Str, Str)
+        If you'd like some channels to have different names in the 
+        `Experiment` than in the FCS files, map the FCS names (keys) to the
+        new names (values) here.
         
     coarse_events : Int (default = 0)
         If >= 0, import only a random subset of events of size `coarse_events`. 
         Presumably the analysis will go faster but less precisely; good for
         interactive data exploration.  Then, set `coarse_events = 0` and re-run
-        the analysis non-interactively.
+        the analysis non-interactively.  Only the sampled events are read 
+        from each FCS file.
+        
+    coarse_seed : Int (default = 0)
+        The random seed used to choose the `coarse_events` subset, so that
+        coarse imports are reproducible.
         
     name_metadata : Enum(None, "$PnN", "$PnS") (default = None)
         Which FCS metadata is the channel name?  If `None`, attempt to  
@@ -122,6 +139,17 @@ class ImportOp(HasStrictTraits):
         experiments.  If so, set `ignore_v` to `True` to disable the voltage
         sanity check.  **BE WARNED - THIS WILL BREAK REAL EXPERIMENTS.**
         
+    cache_dir : Str (default = "")
+        If set, cache the decoded tubes in this directory (see `TubeCache`.)
+        The next time a tube is imported with the same `name_metadata`, its
+        events are memory-mapped from the cache instead of being decoded 
+        from the FCS file.  The directory is created if it doesn't exist.
+        
+    num_workers : PositiveInt (default = 1)
+        How many threads to use to validate, read and decode the tubes.  
+        The tubes are still added to the `Experiment` in the order they
+        appear in `tubes`, so the result doesn't depend on `num_workers`.
+        
     Examples
     --------
     >>> tube1 = flow.Tube(file = 'RFP_Well_A3.fcs', conditions = {"Dox" : 10.0})
@@ -143,15 +171,124 @@ class ImportOp(HasStrictTraits):
     
     # which FCS metadata has the channel names in it?
     name_metadata = Enum(None, "$PnN", "$PnS")
+    
+    # which channels to import, and what to call them
+    channels = List(Str)
+    channel_renames = Dict(Str, Str)
 
     # are we subsetting?
     coarse_events = Int(0)
+    coarse_seed = Int(0)
         
     # DON'T DO THIS
     ignore_v = Bool(False)
+    
+    # where to cache decoded tubes (if anywhere)
+    cache_dir = Str
+    
+    # how many threads to read the tubes with
+    num_workers = util.PositiveInt(1)
       
     def apply(self, experiment = None):
         
+        self._check_tubes()
+        
+        experiment = self._new_experiment()
+        seeds = self._seeds()
+        
+        # add all the tubes at once, instead of re-allocating experiment.data
+        # once per tube
+        experiment.add_events_bulk(self._read_tubes(experiment, 
+                                                    self.tubes, 
+                                                    seeds),
+                                   num_workers = self.num_workers)
+        
+        # remember which tubes we imported, so update() can add new ones
+        experiment.metadata["tubes"] = [(tube.file, dict(tube.conditions))
+                                        for tube in self.tubes]
+            
+        return experiment
+    
+    def update(self, experiment):
+        """
+        Add tubes that were appended to `tubes` to an existing `Experiment`.
+        
+        Useful when the tubes land on disk throughout a run: instead of 
+        re-importing every tube and re-running every downstream operation,
+        only the tubes that aren't in `experiment` yet are imported.  The 
+        operations in `experiment.history` are then applied to just the new 
+        events, which are appended to `experiment.data`.
+        
+        This only works if every operation in the history computes each
+        event's result from that event alone (its `row_local` attribute 
+        is `True`): gates, transforms and compensation are fine, but 
+        (for example) `BinningOp` is not.  Data-driven operations keep 
+        the parameters they estimated from the original data.
+        
+        If the new tubes are at the end of `tubes`, the result is the same
+        as re-running the whole analysis with `apply()`.
+        
+        Parameters
+        ----------
+        experiment : Experiment
+            An `Experiment` created by this operation's `apply()` (or a
+            previous `update()`), possibly with more operations applied to it.
+            
+        Returns
+        -------
+        Experiment
+            a new `Experiment` with the new tubes' events appended, or
+            `experiment` itself if there aren't any new tubes.
+            
+        Raises
+        ------
+        CytoflowOpError
+            If `experiment` wasn't created by `ImportOp`, or if an operation
+            in its history isn't row-local.
+        """
+        
+        self._check_tubes()
+        
+        if "tubes" not in experiment.metadata:
+            raise util.CytoflowOpError("This experiment wasn't created by "
+                                       "ImportOp")
+            
+        imported = experiment.metadata["tubes"]
+        new_tubes = [(idx, tube) for idx, tube in enumerate(self.tubes)
+                     if not any(tube.file == f and tube.conditions == c 
+                                for f, c in imported)]
+        
+        if not new_tubes:
+            return experiment
+        
+        for op in experiment.history:
+            if not getattr(op, "row_local", False):
+                raise util.CytoflowOpError("Can't update an experiment that "
+                                           "{0} was applied to"
+                                           .format(op.friendly_id))
+                
+        # use the same random seeds that apply() would have used for 
+        # these tubes
+        seeds = self._seeds()
+                
+        new_experiment = self._new_experiment()
+        new_experiment.add_events_bulk(
+            self._read_tubes(new_experiment, 
+                             [tube for _, tube in new_tubes],
+                             [seeds[idx] for idx, _ in new_tubes]),
+            num_workers = self.num_workers)
+        
+        for op in experiment.history:
+            new_experiment = op.apply(new_experiment)
+        
+        updated = experiment.clone()
+        updated.append(new_experiment)
+        updated.metadata["tubes"] = imported + \
+            [(tube.file, dict(tube.conditions)) for _, tube in new_tubes]
+            
+        return updated
+    
+    def _check_tubes(self):
         if not self.tubes or len(self.tubes) == 0:
             raise util.CytoflowOpError("Must specify some tubes!")
         
@@ -171,6 +308,9 @@ class ImportOp(HasStrictTraits):
                     raise util.CytoflowOpError("The same conditions specified for "
                                           "tube {0} and tube {1}"
                                           .format(i.file, j.file))
+                
+    def _new_experiment(self):
+        """Make an empty Experiment with our conditions and channels"""
         
         experiment = Experiment()
         
@@ -190,9 +330,8 @@ class ImportOp(HasStrictTraits):
             # we'll figure that out below
             with warnings.catch_warnings():
                 warnings.simplefilter("ignore")
-                tube0_meta = fcsparser.parse(self.tubes[0].file,
-                                             meta_data_only = True,
-                                             reformat_meta = True)
+                tube0_meta = parse_fcs(self.tubes[0].file,
+                                       meta_data_only = True)
         except Exception as e:
             raise util.CytoflowOpError("FCS reader threw an error reading metadata "
                                        " for tube {0}: {1}"
@@ -201,7 +340,7 @@ class ImportOp(HasStrictTraits):
         meta_channels = tube0_meta["_channels_"]
         
         if self.name_metadata:
-            experiment.metadata["name_meta"] = self.name_metadata
+            experiment.metadata["name_metadata"] = self.name_metadata
         else:
             # try to autodetect the metadata
             if "$PnN" in meta_channels and not "$PnS" in meta_channels:
@@ -228,47 +367,101 @@ class ImportOp(HasStrictTraits):
         meta_channels.set_index(experiment.metadata["name_metadata"], 
                                 inplace = True)
         
+        if self.channels:
+            for channel in self.channels:
+                if channel not in meta_channels.index:
+                    raise util.CytoflowOpError("Channel {0} isn't in tube {1}"
+                                               .format(channel, 
+                                                       self.tubes[0].file))
+            fcs_channels = self.channels
+        else:
+            fcs_channels = list(meta_channels.index)
+            
+        for channel in self.channel_renames:
+            if channel not in fcs_channels:
+                raise util.CytoflowOpError("Can't rename channel {0}: it isn't "
+                                           "being imported".format(channel))
+                
+        new_names = [self.channel_renames.get(c, c) for c in fcs_channels]
+        if len(set(new_names)) != len(new_names):
+            raise util.CytoflowOpError("Renaming the channels made duplicate "
+                                       "channel names")
+        
         # now that we have the metadata, load it into experiment
 
-        for channel in meta_channels.index:
+        for fcs_channel, channel in zip(fcs_channels, new_names):
             experiment.add_channel(channel)
             
+            # remember where the channel came from, so we can read it from
+            # other tubes (and control files) later
+            experiment.metadata[channel]["fcs_name"] = fcs_channel
+            
             # keep track of the channel's PMT voltage
-            if("$PnV" in meta_channels.ix[channel]):
-                v = meta_channels.ix[channel]['$PnV']
+            if("$PnV" in meta_channels.ix[fcs_channel]):
+                v = meta_channels.ix[fcs_channel]['$PnV']
                 if v: experiment.metadata[channel]["voltage"] = v
             
             # add the maximum possible value for this channel.
-            data_range = meta_channels.ix[channel]['$PnR']
+            data_range = meta_channels.ix[fcs_channel]['$PnR']
             data_range = float(data_range)
             experiment.metadata[channel]['range'] = data_range
+                
+        return experiment
+    
+    def _seeds(self):
+        """
+        Draw each tube's random seed up front, so the subsampling doesn't
+        depend on the order the worker threads run in (or on which tubes
+        are being read.)
+        """
+        return np.random.RandomState(self.coarse_seed) \
+                 .randint(np.iinfo(np.int32).max, size = len(self.tubes))
+    
+    def _read_tubes(self, experiment, tubes, seeds):
+        """Open (and maybe subsample) `tubes`, for add_events_bulk()"""
         
-        for tube in self.tubes:
-            tube_data = parse_tube(tube.file, experiment, self.ignore_v)
-
+        cache = TubeCache(self.cache_dir) if self.cache_dir else None
+        
+        def read_tube(tube, seed):
+            # don't decode the events here; add_events_bulk() will 
+            # copy them straight from the memory-mapped file into the 
+            # experiment.
+            tube_data = open_tube(tube.file, experiment, self.ignore_v, cache)
+            
             if self.coarse_events:
-                tube_data = tube_data.loc[np.random.choice(tube_data.index,
-                                                           self.coarse_events,
-                                                           replace = False)]
+                tube_data = tube_data.sample(self.coarse_events, seed)
 
-            experiment.add_events(tube_data, tube.conditions)
-            
-        return experiment
+            return (tube_data, tube.conditions)
+        
+        if self.num_workers > 1 and len(tubes) > 1:
+            # most of the work is in numpy and file i/o, which release the 
+            # GIL, so threads are enough.  map() returns the results in
+            # tube order.
+            pool = ThreadPool(min(self.num_workers, len(tubes)))
+            try:
+                return pool.map(lambda args: read_tube(*args), 
+                                zip(tubes, seeds))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            return [read_tube(tube, seed) for tube, seed in zip(tubes, seeds)]
 
 
 def check_tube(filename, experiment, ignore_v = False):
     try:
-        tube_meta = fcsparser.parse( filename, 
-                                     channel_naming = experiment.metadata["name_metadata"],
-                                     meta_data_only = True,
-                                     reformat_meta = True)
+        tube_meta = parse_fcs(filename, 
+                              channel_naming = experiment.metadata["name_metadata"],
+                              meta_data_only = True)
     except Exception as e:
         raise util.CytoflowOpError("FCS reader threw an error reading metadata "
                               " for tube {0}: {1}"
                               .format(filename, str(e)))
     
+    fcs_channels = _fcs_channels(experiment)
+    
     # first make sure the tube has the right channels    
-    if set(tube_meta["_channel_names_"]) != set(experiment.channels):
+    if not set(fcs_channels.values()) <= set(tube_meta["_channel_names_"]):
         raise util.CytoflowError("Tube {0} doesn't have the same channels "
                            "as the first tube added".format(filename))
      
@@ -277,35 +470,798 @@ def check_tube(filename, experiment, ignore_v = False):
                             inplace = True)
      
     # next check the per-channel parameters
-    for channel in experiment.channels:        
+    for channel, fcs_channel in fcs_channels.items():        
         # first check voltage
         if "voltage" in experiment.metadata[channel]:    
-            if not "$PnV" in tube_channels.ix[channel]:
+            if not "$PnV" in tube_channels.ix[fcs_channel]:
                 raise util.CytoflowError("Didn't find a voltage for channel {0}" \
                                    "in tube {1}".format(channel, filename))
             
             old_v = experiment.metadata[channel]["voltage"]
-            new_v = tube_channels.ix[channel]['$PnV']
+            new_v = tube_channels.ix[fcs_channel]['$PnV']
             
             if old_v != new_v and not ignore_v:
                 raise util.CytoflowError("Tube {0} doesn't have the same voltages"
                                     .format(filename))
 
         # TODO check the delay -- and any other params?
+        
+def _fcs_channels(experiment):
+    """
+    Map the names of an experiment's channels that were read from FCS files
+    to their names in the files.  (`ImportOp` can import a subset of the
+    channels, and rename them.)
+    """
+    
+    channels = [c for c in experiment.channels 
+                if "fcs_name" in experiment.metadata[c]]
+    
+    if channels:
+        return OrderedDict((c, experiment.metadata[c]["fcs_name"]) 
+                           for c in channels)
+    else:
+        # an Experiment from before we kept track
+        return OrderedDict((c, c) for c in experiment.channels)
             
 
 # module-level, so we can reuse it in other modules
-def parse_tube(filename, experiment, ignore_v = False):   
+def parse_tube(filename, experiment, ignore_v = False, cache = None):   
+    
+    tube_file = open_tube(filename, experiment, ignore_v, cache)
     
-    check_tube(filename, experiment, ignore_v)
-         
     try:
-        _, tube_data = fcsparser.parse(
-                            filename, 
-                            channel_naming = experiment.metadata["name_metadata"])
+        tube_data = tube_file.data
     except Exception as e:
         raise util.CytoflowOpError("FCS reader threw an error reading data for tube "
                               "{0}: {1}".format(filename, str(e)))
             
     return tube_data
 
+def open_tube(filename, experiment, ignore_v = False, cache = None):
+    """
+    Like `parse_tube`, but returns the (memory-mapped) `FCSFile` instead
+    of decoding the events into a `pandas.DataFrame`.  If `cache` is a 
+    `TubeCache`, look for the tube there first (and add it if it's missing),
+    in which case the result is a `CachedTube` instead.
+    """
+    
+    check_tube(filename, experiment, ignore_v)
+    
+    channel_naming = experiment.metadata["name_metadata"]
+    
+    tube_file = None
+    if cache is not None:
+        try:
+            tube_file = cache.get(filename, channel_naming)
+        except (IOError, OSError) as e:
+            warnings.warn("Couldn't use the tube cache for {0}: {1}"
+                          .format(filename, str(e)),
+                          util.CytoflowOpWarning)
+            cache = None
+    
+    if tube_file is None:
+        try:
+            tube_file = FCSFile(filename, channel_naming = channel_naming)
+        except Exception as e:
+            raise util.CytoflowOpError("FCS reader threw an error reading data for tube "
+                                  "{0}: {1}".format(filename, str(e)))
+            
+        if cache is not None:
+            try:
+                cache.put(filename, channel_naming, tube_file)
+            except (IOError, OSError) as e:
+                warnings.warn("Couldn't cache tube {0}: {1}".format(filename, str(e)),
+                              util.CytoflowOpWarning)
+                
+    # only read the channels that are in the experiment
+    fcs_channels = _fcs_channels(experiment)
+    if list(fcs_channels.keys()) == tube_file.columns and \
+       list(fcs_channels.values()) == tube_file.columns:
+        return tube_file
+    else:
+        return _ChannelSubset(tube_file, fcs_channels)
+    
+
+# how many processed control tubes to keep in the control cache (see 
+# `import_control()`.)  the least-recently used ones are evicted first.
+control_cache_size = 64
+
+_control_cache = OrderedDict()
+_control_cache_lock = threading.Lock()
+
+def clear_control_cache():
+    """Empty the cache of processed control tubes used by `import_control`"""
+    with _control_cache_lock:
+        _control_cache.clear()
+        
+def import_control(filename, experiment):
+    """
+    Import a control tube and apply the operations in `experiment.history`
+    to it, the way the operations that are estimated from controls (like
+    `AutofluorescenceOp` and `BleedthroughLinearOp`) do.  The tube is 
+    imported the way `experiment`'s tubes were: with the same channel 
+    naming, the same subset of the channels, and the same renames.
+    
+    The results are cached for the whole process, keyed by the file's path,
+    size and modification time, those import settings, and a fingerprint of
+    each operation in the history.  The longest prefix of the history that's already been applied
+    to the tube is reused, so estimating a chain of operations from the 
+    same controls imports each control once, and each operation is only
+    applied to it once.  (An operation that can't be pickled, and so can't
+    be fingerprinted, is applied every time, as are the ones after it.)
+    
+    Parameters
+    ----------
+    filename : File
+        The control tube.  The caller should already have checked it with
+        `check_tube()`.
+        
+    experiment : Experiment
+        The experiment whose `history` to apply to the tube.
+        
+    Returns
+    -------
+    Experiment
+        The processed control.  It's a clone of the cached `Experiment`, so
+        you can add columns to it or apply operations to it -- but its 
+        columns share their buffers with the cache (see 
+        `Experiment.clone()`), so don't modify its data in place.
+    """
+    
+    try:
+        stat = os.stat(filename)
+    except OSError as e:
+        raise util.CytoflowOpError("Couldn't read control tube {0}: {1}"
+                                   .format(filename, str(e)))
+    
+    # the control is imported with the experiment's import settings, so
+    # they're part of the key too
+    settings = (experiment.metadata.get("name_metadata"),
+                experiment.metadata.get("ignore_v", False),
+                tuple(sorted(_fcs_channels(experiment).items())))
+    keys = [(os.path.abspath(filename), stat.st_size, stat.st_mtime, settings)]
+    for op in experiment.history:
+        fingerprint = _fingerprint(op)
+        if fingerprint is None:
+            break
+        keys.append(keys[-1] + (fingerprint,))
+    
+    tube_exp = None
+    with _control_cache_lock:
+        for done in range(len(keys) - 1, -1, -1):
+            if keys[done] in _control_cache:
+                tube_exp = _control_cache.pop(keys[done])
+                _control_cache[keys[done]] = tube_exp
+                break
+            
+    if tube_exp is None:
+        tube_exp = _import_control_tube(filename, experiment)
+        done = 0
+        _cache_control(keys[0], tube_exp)
+        
+    for idx in range(done, len(experiment.history)):
+        tube_exp = experiment.history[idx].apply(tube_exp)
+        if idx + 1 < len(keys):
+            _cache_control(keys[idx + 1], tube_exp)
+            
+    return tube_exp.clone()
+
+def _import_control_tube(filename, experiment):
+    """
+    Import a control tube the way `experiment`'s tubes were imported: with
+    the same channel naming, the same subset of the channels, and the same
+    renames.
+    """
+    
+    control = Experiment()
+    for key in ["name_metadata", "ignore_v"]:
+        if key in experiment.metadata:
+            control.metadata[key] = experiment.metadata[key]
+    
+    channel_naming = experiment.metadata["name_metadata"]
+    tube_meta = parse_fcs(filename, 
+                          channel_naming = channel_naming,
+                          meta_data_only = True)
+    file_channels = list(tube_meta["_channel_names_"])
+    tube_channels = tube_meta["_channels_"].set_index(channel_naming)
+    
+    # add the channels in the order they're in the file, like ImportOp
+    fcs_channels = _fcs_channels(experiment)
+    channels = sorted(fcs_channels, 
+                      key = lambda c: file_channels.index(fcs_channels[c]))
+    
+    for channel in channels:
+        fcs_channel = fcs_channels[channel]
+        control.add_channel(channel)
+        control.metadata[channel]["fcs_name"] = fcs_channel
+        if "voltage" in experiment.metadata[channel]:
+            control.metadata[channel]["voltage"] = \
+                experiment.metadata[channel]["voltage"]
+        control.metadata[channel]["range"] = \
+            float(tube_channels.ix[fcs_channel]["$PnR"])
+    
+    tube_data = open_tube(filename, control, control.metadata.get("ignore_v", False))
+    control.add_events_bulk([(tube_data, {})])
+    return control
+
+def _cache_control(key, tube_exp):
+    with _control_cache_lock:
+        _control_cache[key] = tube_exp
+        while len(_control_cache) > control_cache_size:
+            _control_cache.popitem(last = False)
+
+def _fingerprint(op):
+    """A hash of op's class and traits, or None if they can't be pickled"""
+    
+    try:
+        state = pickle.dumps((op.__class__.__module__, 
+                              op.__class__.__name__,
+                              sorted(op.trait_get().items())),
+                             pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return None
+    
+    return hashlib.sha1(state).hexdigest()
+
+# how many files' HEADER and TEXT segments to keep in the metadata cache.
+# the least-recently used ones are evicted first.
+metadata_cache_size = 1000
+
+_metadata_cache = OrderedDict()
+_metadata_cache_lock = threading.Lock()
+
+def clear_metadata_cache():
+    """Empty the FCS metadata cache used by `FCSFile` and `parse_fcs`"""
+    with _metadata_cache_lock:
+        _metadata_cache.clear()
+    
+def parse_fcs(filename, channel_naming = "$PnS", meta_data_only = False):
+    """
+    Parse an FCS 2.0, 3.0 or 3.1 file.
+    
+    A drop-in replacement for ``fcsparser.parse(..., reformat_meta = True)``.
+    
+    Parameters
+    ----------
+    filename : Str
+        The FCS file to parse
+        
+    channel_naming : Enum("$PnS", "$PnN") (default = "$PnS")
+        Which keyword names the channels?  If the channels' names aren't
+        unique (or are missing), the other keyword is used instead.
+        
+    meta_data_only : Bool (default = False)
+        If `True`, only parse the HEADER and TEXT segments.
+        
+    Returns
+    -------
+    If `meta_data_only` is `True`, the metadata dict; otherwise, a tuple of
+    the metadata dict and a `pandas.DataFrame` containing the events (as 
+    `float64`.)  See `FCSFile` for the contents of the metadata dict.
+    """
+    
+    fcs = FCSFile(filename, 
+                  channel_naming = channel_naming, 
+                  meta_data_only = meta_data_only)
+    
+    if meta_data_only:
+        return fcs.meta
+    else:
+        return fcs.meta, fcs.data
+    
+
+class _TubeEvents(object):
+    """
+    The parts of a tube's events that `Experiment.add_events_bulk` and
+    `parse_tube` need: the channel names in `columns`, the number of events
+    from `len()`, each channel as an array from `[]`, and the whole thing as
+    a `float64` `pandas.DataFrame` from `data`.  Subclasses set `columns` 
+    and implement `__len__` and `_column(i, rows)`, which returns the `i`th
+    channel's events (or just the events at the sorted indices `rows`, if 
+    it's not `None`.)
+    """
+    
+    def __getitem__(self, channel):
+        return self._column(self.columns.index(channel), None)
+    
+    @property
+    def data(self):
+        values = np.empty((len(self.columns), len(self)), dtype = "float64")
+        for i in range(len(self.columns)):
+            values[i] = self._column(i, None)
+        return pd.DataFrame(values.T, columns = self.columns)
+    
+    def sample(self, num_events, seed = None):
+        """
+        Return a random subset of `num_events` events (or all of them, if 
+        there are fewer than that.)  The subset is chosen without reading
+        any events, and then only those events are read.
+        """
+        
+        if num_events >= len(self):
+            return self
+        
+        # when num_events is small compared to the tube, random.sample() 
+        # only keeps the chosen indices around, so this costs O(num_events)
+        # memory.  when it's a large fraction of the tube (somewhere between
+        # a twelfth and a third, depending on num_events), random.sample() 
+        # copies the population instead, so it's O(len(self)) -- still only
+        # indices, not events.  (numpy's 
+        # choice(replace = False) always permutes the whole population.)
+        rows = random.Random(int(seed) if seed is not None else None) \
+                 .sample(xrange(len(self)), num_events)
+        rows = np.sort(np.array(rows, dtype = np.intp))
+        return _EventSubset(self, rows)
+    
+    
+class _ChannelSubset(_TubeEvents):
+    """
+    Some of another `_TubeEvents`' channels, possibly renamed.  
+    `channels` maps the new names to the names in `events`.
+    """
+    
+    def __init__(self, events, channels):
+        self._events = events
+        self.columns = list(channels.keys())
+        self._sources = [events.columns.index(c) for c in channels.values()]
+        
+    def __len__(self):
+        return len(self._events)
+    
+    def _column(self, i, rows):
+        return self._events._column(self._sources[i], rows)
+    
+    
+class _EventSubset(_TubeEvents):
+    """
+    Some of another `_TubeEvents`' events: the ones at the (sorted) indices
+    in `rows`.
+    """
+    
+    def __init__(self, events, rows):
+        self._events = events
+        self._rows = rows
+        self.columns = events.columns
+        
+    def __len__(self):
+        return len(self._rows)
+    
+    def _column(self, i, rows):
+        if rows is not None:
+            rows = self._rows[rows]
+        else:
+            rows = self._rows
+        return self._events._column(i, rows)
+    
+    
+class FCSFile(_TubeEvents):
+    """
+    A memory-mapped FCS 2.0, 3.0 or 3.1 file.
+    
+    Reads the HEADER and TEXT segments, then maps the DATA segment into 
+    memory as a `numpy` structured array whose layout comes from `$DATATYPE`,
+    `$BYTEORD` and `$PnB`.  Nothing is decoded until it's asked for: 
+    indexing the file by channel name returns a (read-only) view of that 
+    channel's events, still in the file's own type and byte order, so copying
+    it into a `float64` buffer decodes it in one pass.
+    
+    Only list-mode (`$MODE = L`) files with `$DATATYPE` of `F`, `D` or `I` 
+    and a `$PnB` of 8, 16, 32 or 64 are supported.  Integer parameters are 
+    masked with the smallest all-ones bitmask that covers `$PnR`, as the 
+    standard specifies.
+    
+    Attributes
+    ----------
+    meta : Dict
+        The TEXT segment's keywords (the standard `$` keywords are converted
+        to upper case), organized like ``fcsparser.parse(..., reformat_meta 
+        = True)``: the per-parameter keywords are moved to a 
+        `pandas.DataFrame` in `_channels_` (indexed by parameter number, with 
+        columns `$PnN`, `$PnS`, `$PnR`, etc), the channel names are in
+        `_channel_names_`, and the HEADER offsets are in `__header__`.
+        
+    columns : List(Str)
+        The channel names, in parameter order.
+        
+    data : pandas.DataFrame
+        All of the events, decoded to `float64`.
+        
+    Examples
+    --------
+    >>> fcs = FCSFile('RFP_Well_A3.fcs')
+    >>> len(fcs)
+    10000
+    >>> fsc = np.array(fcs["FSC-A"], dtype = "float64")
+    """
+    
+    def __init__(self, filename, channel_naming = "$PnS", meta_data_only = False):
+        if channel_naming not in ("$PnS", "$PnN"):
+            raise util.CytoflowError("channel_naming must be either '$PnS' or "
+                                     "'$PnN'")
+        
+        self.filename = filename
+        self._events = None
+        
+        header, text = self._read_segments()
+        
+        self.meta = self._reformat_meta(header, text, channel_naming)
+        self.columns = list(self.meta["_channel_names_"])
+        
+        if not meta_data_only:
+            self._map_data(header, text)
+            
+    def __len__(self):
+        return self.meta["$TOT"]
+    
+    def _column(self, i, rows):
+        if self._events is None:
+            raise util.CytoflowError("The DATA segment of {0} wasn't read"
+                                     .format(self.filename))
+        
+        column = self._events[self._fields[i]]
+        if rows is not None:
+            column = column[rows]
+        if self._bitmasks[i] is not None:
+            column = np.bitwise_and(column, self._bitmasks[i])
+        return column
+    
+    def _read_segments(self):
+        # the HEADER and TEXT segments are cached, keyed by the file's 
+        # path, size and modification time, so validating a tube and then
+        # reading it (or re-reading it in the GUI) only parses them once.
+        # the cached dicts are never modified; the metadata that callers
+        # get is rebuilt from them each time.
+        
+        stat = os.stat(self.filename)
+        key = (os.path.abspath(self.filename), stat.st_size, stat.st_mtime)
+        
+        with _metadata_cache_lock:
+            if key in _metadata_cache:
+                segments = _metadata_cache.pop(key)
+                _metadata_cache[key] = segments
+                return segments
+            
+        with open(self.filename, 'rb') as f:
+            header = self._read_header(f)
+            text = self._read_text(f, header)
+            
+        with _metadata_cache_lock:
+            _metadata_cache[key] = (header, text)
+            while len(_metadata_cache) > metadata_cache_size:
+                _metadata_cache.popitem(last = False)
+                
+        return header, text
+    
+    def _read_header(self, f):
+        version = f.read(6)
+        if version not in (b"FCS2.0", b"FCS3.0", b"FCS3.1"):
+            raise util.CytoflowError("{0} isn't an FCS 2.0, 3.0 or 3.1 file"
+                                     .format(self.filename))
+        f.read(4)
+        
+        header = {"FCS format" : version.decode("ascii")}
+        for field in ["text start", "text end", "data start", "data end",
+                      "analysis start", "analysis end"]:
+            try:
+                header[field] = int(f.read(8))
+            except ValueError:
+                header[field] = 0
+                
+        if header["text start"] == 0 or header["text end"] <= header["text start"]:
+            raise util.CytoflowError("Can't find the TEXT segment in {0}"
+                                     .format(self.filename))
+            
+        return header
+    
+    def _read_text(self, f, header):
+        f.seek(header["text start"])
+        raw = f.read(header["text end"] - header["text start"] + 1)
+        try:
+            raw = raw.decode("utf-8")
+        except UnicodeDecodeError:
+            raw = raw.decode("latin-1")
+            
+        # keywords and values are separated by the delimiter character, 
+        # which is the first character in the segment.  a doubled delimiter
+        # is an escaped delimiter in a keyword or value.
+        delim = raw[0]
+        tokens = []
+        token = []
+        start = 1
+        while True:
+            end = raw.find(delim, start)
+            if end == -1:
+                break
+            if raw[end + 1 : end + 2] == delim:
+                token.append(raw[start : end + 1])
+                start = end + 2
+                continue
+            token.append(raw[start:end])
+            tokens.append("".join(token))
+            token = []
+            start = end + 1
+            
+        text = {}
+        for key, value in zip(tokens[0::2], tokens[1::2]):
+            if key.startswith("$"):
+                key = key.upper()
+            text[key] = value
+            
+        for key in ["$PAR", "$TOT"]:
+            if key not in text:
+                raise util.CytoflowError("Keyword {0} is missing from {1}"
+                                         .format(key, self.filename))
+            text[key] = int(text[key])
+            
+        if "$NEXTDATA" in text:
+            text["$NEXTDATA"] = int(text["$NEXTDATA"])
+            
+        return text
+    
+    def _reformat_meta(self, header, text, channel_naming):
+        meta = {"__header__" : dict(header)}
+        params = {}
+        
+        num_params = text["$PAR"]
+        for key, value in text.items():
+            if key.startswith("$P") and key[2:3].isdigit():
+                i = 2
+                while key[i:i+1].isdigit():
+                    i += 1
+                n = int(key[2:i])
+                if 1 <= n <= num_params and i < len(key):
+                    params.setdefault("$Pn" + key[i:], {})[n] = value
+                    continue
+            meta[key] = value
+            
+        if "$PnB" in params:
+            params["$PnB"] = {n : int(b) for n, b in params["$PnB"].items()}
+        if "$PnE" in params:
+            params["$PnE"] = {n : e.split(",") for n, e in params["$PnE"].items()}
+            
+        index = range(1, num_params + 1)
+        channels = pd.DataFrame({p : [params[p].get(n) for n in index]
+                                 for p in params},
+                                index = index)
+        channels.index.name = "Channel Number"
+        meta["_channels_"] = channels
+        
+        # same rules as fcsparser: use the requested names if they're all
+        # there and they're unique; otherwise, use the other ones.
+        names = {}
+        for naming in ["$PnS", "$PnN"]:
+            if naming in params and len(params[naming]) == num_params:
+                names[naming] = tuple(params[naming][n] for n in index)
+            else:
+                names[naming] = ()
+                
+        alternate = "$PnN" if channel_naming == "$PnS" else "$PnS"
+        channel_names = names[channel_naming]
+        if not channel_names:
+            channel_names = names[alternate]
+        if len(set(channel_names)) != len(channel_names):
+            warnings.warn("The channel names in {0} (from {1}) weren't unique; "
+                          "using {2} instead"
+                          .format(self.filename, channel_naming, alternate),
+                          util.CytoflowWarning)
+            channel_names = names[alternate]
+            
+        meta["_channel_names_"] = channel_names
+        return meta
+    
+    def _map_data(self, header, text):
+        if text.get("$MODE", "L") != "L":
+            raise util.CytoflowError("Only list-mode FCS files are supported")
+        
+        if text.get("$NEXTDATA", 0) != 0:
+            raise util.CytoflowError("FCS files with more than one data set "
+                                     "aren't supported")
+        
+        datatype = text.get("$DATATYPE", "").upper()
+        if datatype not in ("F", "D", "I"):
+            raise util.CytoflowError("$DATATYPE {0} isn't supported"
+                                     .format(datatype))
+        
+        byteord = [int(x) for x in text.get("$BYTEORD", "").split(",")
+                   if x.strip()]
+        if byteord == sorted(byteord):
+            endian = "<"
+        elif byteord == sorted(byteord, reverse = True):
+            endian = ">"
+        else:
+            raise util.CytoflowError("$BYTEORD {0} isn't supported"
+                                     .format(text.get("$BYTEORD")))
+            
+        channels = self.meta["_channels_"]
+        self._fields = []
+        self._bitmasks = []
+        dtype = []
+        for n in channels.index:
+            bits = channels.loc[n, "$PnB"] if "$PnB" in channels else None
+            bits = int(bits) if bits and bits == bits else 0
+            if bits not in (8, 16, 32, 64):
+                raise util.CytoflowError("$P{0}B = {1} isn't supported; "
+                                         "parameters must be 8, 16, 32 or "
+                                         "64 bits".format(n, bits))
+            
+            if datatype == "I":
+                kind = "u"
+            else:
+                kind = "f"
+                if bits != (32 if datatype == "F" else 64):
+                    raise util.CytoflowError("$P{0}B = {1} doesn't match "
+                                             "$DATATYPE {2}"
+                                             .format(n, bits, datatype))
+                    
+            field = "p{0}".format(n)
+            self._fields.append(field)
+            dtype.append((field, "{0}{1}{2}".format(endian, kind, bits // 8)))
+            self._bitmasks.append(self._bitmask(channels, n, bits) 
+                                  if datatype == "I" else None)
+            
+        dtype = np.dtype(dtype)
+        
+        data_start = header["data start"]
+        data_end = header["data end"]
+        if data_start == 0 or data_end == 0:
+            # FCS 3.0+ files > 100 MB store the DATA offsets in the TEXT segment
+            data_start = int(text.get("$BEGINDATA", 0))
+            data_end = int(text.get("$ENDDATA", 0))
+            
+        num_events = text["$TOT"]
+        if (data_end - data_start + 1 < num_events * dtype.itemsize or
+            data_start + num_events * dtype.itemsize > os.path.getsize(self.filename)):
+            raise util.CytoflowError("The DATA segment of {0} is truncated"
+                                     .format(self.filename))
+        
+        if num_events == 0:
+            self._events = np.empty(0, dtype = dtype)
+        else:
+            self._events = np.memmap(self.filename, 
+                                     dtype = dtype, 
+                                     mode = "r", 
+                                     offset = data_start, 
+                                     shape = (num_events,))
+    
+    @staticmethod
+    def _bitmask(channels, n, bits):
+        try:
+            data_range = float(channels.loc[n, "$PnR"])
+        except (KeyError, TypeError, ValueError):
+            return None
+        
+        if data_range <= 1:
+            return None
+        
+        # the smallest power of two >= $PnR, less one.  (math.log() can be
+        # off by a bit for large powers of two.)
+        mask = 2 ** (int(math.ceil(data_range)) - 1).bit_length() - 1
+        if mask >= 2 ** bits - 1:
+            return None
+        
+        return np.array(mask, dtype = "u{0}".format(bits // 8))
+        
+
+class TubeCache(object):
+    """
+    An on-disk cache of decoded tubes.
+    
+    Each tube is stored in its own subdirectory of `directory` as one `.npy`
+    file per channel (already decoded to `float64`), which `CachedTube` 
+    memory-maps.  Entries are keyed by a hash of the FCS file's contents and
+    the channel naming, so a cached tube is found again even if the FCS 
+    file is moved or copied.  Because hashing a large file means reading all
+    of it, the hash of each (path, size, modification time) is remembered 
+    in the cache too.
+    
+    Nothing is ever evicted; delete `directory` to empty the cache.
+    
+    Examples
+    --------
+    >>> import_op = flow.ImportOp(conditions = {"Dox" : "float"},
+    ...                           tubes = [tube1, tube2],
+    ...                           cache_dir = "/tmp/cytoflow-cache")
+    >>> ex = import_op.apply()   # decodes the FCS files and caches them
+    >>> ex = import_op.apply()   # maps the cached tubes
+    """
+    
+    def __init__(self, directory):
+        self.directory = directory
+        
+    def get(self, filename, channel_naming):
+        """Return the cached `CachedTube` for `filename`, or `None`"""
+        path = self._tube_path(filename, channel_naming)
+        if not os.path.isdir(path):
+            return None
+        
+        try:
+            return CachedTube(path)
+        except (IOError, OSError, ValueError):
+            return None
+        
+    def put(self, filename, channel_naming, tube_events):
+        """Decode `tube_events` (usually an `FCSFile`) into the cache"""
+        path = self._tube_path(filename, channel_naming)
+        if os.path.isdir(path):
+            return
+        
+        # write into a temporary directory and then rename it, so a partly
+        # written tube is never visible to readers
+        tmp_path = "{0}.{1}.{2}.tmp".format(path, os.getpid(), 
+                                            threading.current_thread().ident)
+        os.makedirs(tmp_path)
+        for i, channel in enumerate(tube_events.columns):
+            np.save(os.path.join(tmp_path, "{0}.npy".format(i)),
+                    np.asarray(tube_events[channel], dtype = "float64"))
+        with open(os.path.join(tmp_path, "columns.json"), "w") as f:
+            json.dump({"columns" : tube_events.columns, 
+                       "length" : len(tube_events)}, f)
+                
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # someone else cached it first
+            shutil.rmtree(tmp_path, ignore_errors = True)
+            
+    def _tube_path(self, filename, channel_naming):
+        return os.path.join(self.directory, 
+                            "{0}-{1}".format(self._content_hash(filename), 
+                                             channel_naming.strip("$")))
+        
+    def _content_hash(self, filename):
+        stat = os.stat(filename)
+        stat_key = "{0}|{1}|{2!r}".format(os.path.abspath(filename),
+                                          stat.st_size,
+                                          stat.st_mtime)
+        index_path = os.path.join(self.directory, "index",
+                                  hashlib.sha1(stat_key.encode("utf-8")).hexdigest())
+        
+        try:
+            with open(index_path, "r") as f:
+                return f.read().strip()
+        except (IOError, OSError):
+            pass
+        
+        content_hash = hashlib.sha1()
+        with open(filename, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                content_hash.update(block)
+        content_hash = content_hash.hexdigest()
+        
+        # remembering the hash is only an optimization; if we can't write 
+        # to the cache, just hash the file again next time.
+        try:
+            if not os.path.isdir(os.path.dirname(index_path)):
+                os.makedirs(os.path.dirname(index_path))
+            with open(index_path, "w") as f:
+                f.write(content_hash)
+        except (IOError, OSError):
+            pass
+            
+        return content_hash
+    
+    
+class CachedTube(_TubeEvents):
+    """
+    A tube from a `TubeCache`.  Its channels are memory-mapped from the 
+    cache's `.npy` files.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "columns.json"), "r") as f:
+            index = json.load(f)
+        self.columns = index["columns"]
+        self._length = index["length"]
+        
+    def __len__(self):
+        return self._length
+    
+    def _column(self, i, rows):
+        if self._length == 0:
+            return np.empty(0, dtype = "float64")
+        column = np.load(os.path.join(self.path, "{0}.npy".format(i)),
+                         mmap_mode = "r")
+        if rows is not None:
+            column = column[rows]
+        return column
@@ -0,0 +1,284 @@
+#!/usr/bin/env python2.7
+
+# (c) Massachusetts Institute of Technology 2015-2016
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import absolute_import
+
+import os, time, fnmatch, threading, warnings
+
+from traits.api import HasStrictTraits, Instance, List, Str, Directory, \
+                       Callable, Float, Any, Dict
+
+import cytoflow.utility as util
+
+from ..experiment import Experiment
+from .import_op import ImportOp, Tube, FCSFile
+
+class ImportWatcher(HasStrictTraits):
+    """
+    Watch for new FCS files and add them to a running analysis as they
+    finish.
+    
+    On a screening line, wells land on disk throughout a run.  An
+    `ImportWatcher` polls either a directory (for new files that match
+    `pattern`) or a manifest of the tubes you expect (a list of `Tube`s
+    whose files may not exist yet.)  A file is only imported once it has
+    stopped changing for `settle_time` seconds and its DATA segment is
+    complete, so partially-written files are never read.
+    
+    Finished tubes are added to `op.tubes`, and then imported with
+    `ImportOp.update()`: only the new tubes are read (with `op.num_workers`
+    threads), the operations in `experiment.history` are applied to just
+    their events, and the new events are appended to `experiment`.  (So
+    every operation in the analysis must be row-local; see
+    `ImportOp.update()`.)  The first time there are tubes to import, the
+    `Experiment` is created with `op.apply()` and then `operations` are
+    applied to it, in order.
+    
+    Each time new tubes are imported, `experiment` is set to the new
+    `Experiment`; listen for changes to it (with `on_trait_change`) to
+    re-plot your views as the wells finish.  When the watcher is running in
+    the background (see `start()`), the listeners are called on the
+    watcher's thread.
+    
+    Attributes
+    ----------
+    op : ImportOp
+        The operation to add the tubes to.  Its `conditions` and import
+        options are used to import them.  Any tubes already in `op.tubes`
+        are imported the first time new tubes are found.
+    
+    directory : Directory
+        The directory to watch for new FCS files.
+    
+    pattern : Str (default = "*.fcs")
+        Only import the files in `directory` that match this (shell-style)
+        pattern.
+    
+    tube_conditions : Callable
+        A function that takes the path of a new file in `directory` and
+        returns its conditions (a dict whose keys are `op.conditions`.)
+        Required if you're watching `directory`.
+    
+    manifest : List(Tube)
+        Instead of (or as well as) watching `directory`, wait for these tubes'
+        files to be written.
+    
+    operations : List(IOperation)
+        The operations to apply to the `Experiment` when it's first created.
+    
+    settle_time : Float (default = 2.0)
+        How long (in seconds) a file's size and modification time must stay
+        the same before it's imported.
+    
+    poll_interval : Float (default = 1.0)
+        How often (in seconds) the background thread looks for new files.
+    
+    experiment : Experiment
+        The result of the analysis on the tubes imported so far.  If you
+        already have one (from `op.apply()` and some row-local operations),
+        set it before you start watching.
+    
+    errors : Dict(Str, Str)
+        The files that couldn't be imported, and why.  They aren't retried.
+    
+    Examples
+    --------
+    >>> import_op = flow.ImportOp(conditions = {"Well" : "category"})
+    >>> watcher = flow.ImportWatcher(
+    ...     op = import_op,
+    ...     directory = "plate1",
+    ...     tube_conditions = lambda f: {"Well" : os.path.basename(f)[0:-4]},
+    ...     operations = [flow.ThresholdOp(name = "Y2_High",
+    ...                                    channel = "Y2-A",
+    ...                                    threshold = 200)])
+    >>> watcher.on_trait_change(replot, "experiment")
+    >>> watcher.start()
+    """
+    
+    op = Instance(ImportOp)
+    
+    directory = Directory
+    pattern = Str("*.fcs")
+    tube_conditions = Callable
+    
+    manifest = List(Tube)
+    
+    operations = List(Any)
+    
+    settle_time = Float(2.0)
+    poll_interval = util.PositiveFloat(1.0)
+    
+    experiment = Instance(Experiment)
+    errors = Dict(Str, Str)
+    
+    # path --> (size, mtime, when we first saw that size and mtime)
+    _pending = Dict
+    
+    _thread = Instance(threading.Thread)
+    _stop = Instance(threading.Event, args = ())
+    
+    def poll(self):
+        """
+        Look for finished files once, and import any that are new.
+        
+        Returns
+        -------
+        List(Tube)
+            The tubes that were imported (possibly empty.)
+        
+        Raises
+        ------
+        CytoflowOpError
+            If the watcher isn't set up correctly, or if the new tubes
+            couldn't be added to `experiment`.
+        """
+        
+        if not self.op:
+            raise util.CytoflowOpError("op is not set")
+        
+        if not self.directory and not self.manifest:
+            raise util.CytoflowOpError("Must set directory or manifest")
+        
+        if self.directory and not self.tube_conditions:
+            raise util.CytoflowOpError("Must set tube_conditions to watch "
+                                       "a directory")
+        
+        now = time.time()
+        new_tubes = []
+        imported = set(tube.file for tube in self.op.tubes)
+        
+        for path, conditions in self._candidates():
+            if path in imported or path in self.errors:
+                continue
+            
+            if not self._is_finished(path, now):
+                continue
+            
+            if conditions is None:
+                try:
+                    conditions = self.tube_conditions(path)
+                except Exception as e:
+                    self.errors[path] = str(e)
+                    continue
+            
+            new_tubes.append(Tube(file = path, conditions = conditions))
+        
+        if not new_tubes:
+            return []
+        
+        tubes = self.op.tubes + new_tubes
+        self.op.tubes = tubes
+        
+        try:
+            if self.experiment is None:
+                experiment = self.op.apply()
+                for op in self.operations:
+                    experiment = op.apply(experiment)
+            else:
+                experiment = self.op.update(self.experiment)
+        except Exception as e:
+            # don't keep trying to import these tubes
+            self.op.tubes = tubes[0:-len(new_tubes)]
+            for tube in new_tubes:
+                self.errors[tube.file] = str(e)
+            raise util.CytoflowOpError("Couldn't import {0}: {1}"
+                                       .format(", ".join(t.file for t in new_tubes),
+                                               str(e)))
+        
+        for tube in new_tubes:
+            self._pending.pop(tube.file, None)
+        
+        self.experiment = experiment
+        return new_tubes
+    
+    def start(self):
+        """
+        Start polling in a background thread, every `poll_interval` seconds.
+        Errors are reported with a `CytoflowOpWarning` (and in `errors`)
+        instead of stopping the thread.
+        """
+        
+        if self._thread and self._thread.is_alive():
+            return
+        
+        self._stop.clear()
+        self._thread = threading.Thread(target = self._run)
+        self._thread.daemon = True
+        self._thread.start()
+    
+    def stop(self):
+        """Stop the background thread, and wait for it to finish."""
+        
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+    
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            # whatever goes wrong (a file that vanished, a tube that's too
+            # big to import), keep polling.
+            try:
+                self.poll()
+            except util.CytoflowError as e:
+                warnings.warn(str(e), util.CytoflowOpWarning)
+            except Exception as e:
+                warnings.warn("Error polling for new files: {0}: {1}"
+                              .format(type(e).__name__, str(e)), 
+                              util.CytoflowOpWarning)
+    
+    def _candidates(self):
+        """Yield (path, conditions-or-None) for the files we might import"""
+        
+        for tube in self.manifest:
+            yield (tube.file, tube.conditions)
+        
+        if self.directory and os.path.isdir(self.directory):
+            for name in sorted(os.listdir(self.directory)):
+                if fnmatch.fnmatch(name, self.pattern):
+                    yield (os.path.join(self.directory, name), None)
+    
+    def _is_finished(self, path, now):
+        """
+        Has `path` stopped changing for `settle_time` seconds, and is its
+        DATA segment all there?
+        """
+        
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        
+        size_mtime = (st.st_size, st.st_mtime)
+        pending = self._pending.get(path)
+        if pending is None or pending[0:2] != size_mtime:
+            self._pending[path] = size_mtime + (now,)
+            if self.settle_time > 0:
+                return False
+        elif now - pending[2] < self.settle_time:
+            return False
+        
+        # the instrument may pause while it's writing; make sure the
+        # file is complete.
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                FCSFile(path)
+        except Exception:
+            return False
+
+        return True
@@ -67,6 +67,7 @@ class LogTransformOp(HasStrictTraits):
     # traits
     id = Constant('edu.mit.synbio.cytoflow.operations.log')
     friendly_id = Constant("Log10")
+    row_local = Constant(True)
 
     name = Str()
     channels = List(Str)
@@ -68,6 +68,7 @@ class PolygonOp(HasStrictTraits):
     # traits
     id = Constant('edu.mit.synbio.cytoflow.operations.polygon')
     friendly_id = Constant("Polygon")
+    row_local = Constant(True)
     
     name = CStr()
     xchannel = Str()
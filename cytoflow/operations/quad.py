@@ -24,13 +24,11 @@ from matplotlib.widgets import Cursor
 import matplotlib.pyplot as plt
 from matplotlib.lines import Line2D
 
-import numpy as np
-import pandas as pd
-
 import cytoflow.utility as util
 import cytoflow.views
 
 from .i_operation import IOperation
+from .gate_set import GateSetOp
 
 @provides(IOperation)
 class QuadOp(HasStrictTraits):
@@ -77,6 +75,7 @@ class QuadOp(HasStrictTraits):
     # traits
     id = Constant('edu.mit.synbio.cytoflow.operations.quad')
     friendly_id = Constant("Quadrant Gate")
+    row_local = Constant(True)
     
     name = CStr()
     
@@ -107,6 +106,14 @@ class QuadOp(HasStrictTraits):
             
         """
         
+        return GateSetOp(gates = [self]).apply(experiment)
+    
+    def _compile(self, experiment):
+        """
+        Check the gate against `experiment`, and return it as a `dtype` and
+        a list of (label, bounds) regions (see `GateSetOp`.)
+        """
+        
         # make sure name got set!
         if not self.name:
             raise util.CytoflowOpError("You have to set the gate's name "
@@ -132,34 +139,19 @@ class QuadOp(HasStrictTraits):
         if not self.ythreshold:
             raise util.CytoflowOpError('ythreshold must be set!')
 
-        gate = pd.Series([None] * len(experiment))
-        
-        # perhaps there's some more pythonic way to do this?
-        
-        # upper-left
-        ul = np.logical_and(experiment[self.xchannel] < self.xthreshold,
-                            experiment[self.ychannel] > self.ythreshold)
-        gate.loc[ul] = self.name + '_1'
-
-        # upper-right
-        ur = np.logical_and(experiment[self.xchannel] > self.xthreshold,
-                            experiment[self.ychannel] > self.ythreshold)
-        gate.loc[ur] = self.name + '_2'
-        
-        # lower-right
-        lr = np.logical_and(experiment[self.xchannel] > self.xthreshold,
-                            experiment[self.ychannel] < self.ythreshold)
-        gate.loc[lr] = self.name + '_3'
-
-        # lower-left
-        ll = np.logical_and(experiment[self.xchannel] < self.xthreshold,
-                            experiment[self.ychannel] < self.ythreshold)
-        gate.loc[ll] = self.name + '_4'
-
-        new_experiment = experiment.clone()
-        new_experiment.add_condition(self.name, "category", gate)
-        new_experiment.history.append(self.clone_traits())
-        return new_experiment
+        # clockwise from upper-left.  events on a threshold aren't in any
+        # quadrant.
+        x = self.xchannel
+        y = self.ychannel
+        return ("category",
+                [(self.name + '_1', [(x, "<", self.xthreshold),
+                                     (y, ">", self.ythreshold)]),
+                 (self.name + '_2', [(x, ">", self.xthreshold),
+                                     (y, ">", self.ythreshold)]),
+                 (self.name + '_3', [(x, ">", self.xthreshold),
+                                     (y, "<", self.ythreshold)]),
+                 (self.name + '_4', [(x, "<", self.xthreshold),
+                                     (y, "<", self.ythreshold)])])
     
     def default_view(self, **kwargs):
         return QuadSelection(op = self, **kwargs)
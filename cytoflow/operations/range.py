@@ -28,6 +28,7 @@ import cytoflow.utility as util
 import cytoflow.views
 
 from .i_operation import IOperation
+from .gate_set import GateSetOp
 
 @provides(IOperation)
 class RangeOp(HasStrictTraits):
@@ -72,6 +73,7 @@ class RangeOp(HasStrictTraits):
     # traits
     id = Constant('edu.mit.synbio.cytoflow.operations.range')
     friendly_id = Constant('Range')
+    row_local = Constant(True)
     
     name = CStr()
     channel = Str()
@@ -94,6 +96,14 @@ class RangeOp(HasStrictTraits):
             less than self.high; it is False otherwise.
         """
 
+        return GateSetOp(gates = [self]).apply(experiment)
+    
+    def _compile(self, experiment):
+        """
+        Check the gate against `experiment`, and return it as a `dtype` and
+        a list of (label, bounds) regions (see `GateSetOp`.)
+        """
+        
         if not experiment:
             raise util.CytoflowOpError("No experiment specified")
         
@@ -123,12 +133,8 @@ class RangeOp(HasStrictTraits):
             raise util.CytoflowOpError("range low must be < {0}"
                                   .format(experiment[self.channel].max()))
         
-        gate = experiment[self.channel].between(self.low, self.high)
-        new_experiment = experiment.clone()
-        new_experiment.add_condition(self.name, "bool", gate)
-        new_experiment.history.append(self.clone_traits())
-            
-        return new_experiment
+        return ("bool", [(True, [(self.channel, ">=", self.low),
+                                 (self.channel, "<=", self.high)])])
     
     def default_view(self, **kwargs):
         return RangeSelection(op = self, **kwargs)
@@ -17,8 +17,6 @@
 
 from __future__ import division, absolute_import
 
-import pandas as pd
-
 from traits.api import HasStrictTraits, CFloat, Str, CStr, Bool, Instance, \
     provides, on_trait_change, DelegatesTo, Any, Constant
 
@@ -30,6 +28,7 @@ import cytoflow.utility as util
 import cytoflow.views
 
 from .i_operation import IOperation
+from .gate_set import GateSetOp
 
 @provides(IOperation)
 class Range2DOp(HasStrictTraits):
@@ -80,6 +79,7 @@ class Range2DOp(HasStrictTraits):
     # traits
     id = Constant('edu.mit.synbio.cytoflow.operations.range2d')
     friendly_id = Constant("2D Range")
+    row_local = Constant(True)
     
     name = CStr()
     
@@ -107,6 +107,14 @@ class Range2DOp(HasStrictTraits):
             less than self.high; it is False otherwise.
         """
         
+        return GateSetOp(gates = [self]).apply(experiment)
+    
+    def _compile(self, experiment):
+        """
+        Check the gate against `experiment`, and return it as a `dtype` and
+        a list of (label, bounds) regions (see `GateSetOp`.)
+        """
+        
         # make sure name got set!
         if not self.name:
             raise util.CytoflowOpError("You have to set the gate's name "
@@ -140,14 +148,10 @@ class Range2DOp(HasStrictTraits):
             raise util.CytoflowOpError("y channel range low must be < {0}"
                                   .format(experiment[self.ychannel].max()))
         
-        x = experiment[self.xchannel].between(self.xlow, self.xhigh)
-        y = experiment[self.ychannel].between(self.ylow, self.yhigh)
-        gate = pd.Series(x & y)
-        
-        new_experiment = experiment.clone() 
-        new_experiment.add_condition(self.name, "bool", gate)   
-        new_experiment.history.append(self.clone_traits())    
-        return new_experiment
+        return ("bool", [(True, [(self.xchannel, ">=", self.xlow),
+                                 (self.xchannel, "<=", self.xhigh),
+                                 (self.ychannel, ">=", self.ylow),
+                                 (self.ychannel, "<=", self.yhigh)])])
     
     def default_view(self, **kwargs):
         return RangeSelection2D(op = self, **kwargs)
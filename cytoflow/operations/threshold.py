@@ -20,8 +20,6 @@ from __future__ import absolute_import, division
 from traits.api import (HasStrictTraits, CFloat, Str, CStr, Instance, 
                         Bool, on_trait_change, provides, DelegatesTo, Any, 
                         Constant)
-    
-import pandas as pd
 
 from matplotlib.widgets import Cursor
 import matplotlib.pyplot as plt
@@ -31,6 +29,7 @@ import cytoflow.utility as util
 import cytoflow.views
 
 from .i_operation import IOperation
+from .gate_set import GateSetOp
 
 @provides(IOperation)
 class ThresholdOp(HasStrictTraits):
@@ -75,6 +74,7 @@ class ThresholdOp(HasStrictTraits):
     # traits
     id = Constant('edu.mit.synbio.cytoflow.operations.threshold')
     friendly_id = Constant("Threshold")
+    row_local = Constant(True)
     
     name = CStr()
     channel = Str()
@@ -96,6 +96,14 @@ class ThresholdOp(HasStrictTraits):
             it is False otherwise.
         """
         
+        return GateSetOp(gates = [self]).apply(experiment)
+    
+    def _compile(self, experiment):
+        """
+        Check the gate against `experiment`, and return it as a `dtype` and
+        a list of (label, bounds) regions (see `GateSetOp`.)
+        """
+        
         if not experiment:
             raise util.CytoflowOpError("No experiment specified")
         
@@ -113,12 +121,7 @@ class ThresholdOp(HasStrictTraits):
             raise util.CytoflowOpError("{0} isn't a channel in the experiment"
                                   .format(self.channel))
 
-        gate = pd.Series(experiment[self.channel] > self.threshold)
-
-        new_experiment = experiment.clone()
-        new_experiment.add_condition(self.name, "bool", gate)
-        new_experiment.history.append(self.clone_traits())
-        return new_experiment
+        return ("bool", [(True, [(self.channel, ">", self.threshold)])])
     
     def default_view(self, **kwargs):
         return ThresholdSelection(op = self, **kwargs)
@@ -74,6 +74,14 @@ class TestBeads(unittest.TestCase):
         self.assertAlmostEqual(self.op._calibration_functions["PE-Tx-Red-YG-A"](100000),
                                881251.765, delta = 100)
         
+    def testEstimateState(self):
+        import pickle
+        
+        op = pickle.loads(pickle.dumps(self.op))
+        self.assertEqual(op.get_estimate(), self.op.get_estimate())
+        self.assertAlmostEqual(op._calibration_functions["PE-Tx-Red-YG-A"](100),
+                               908.2389, delta = 0.1)
+        
     def testApply(self):
         # this is just to make sure the code doesn't crash;
         # nothing about correctness.
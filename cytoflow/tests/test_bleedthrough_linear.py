@@ -0,0 +1,133 @@
+#!/usr/bin/env python2.7
+
+# (c) Massachusetts Institute of Technology 2015-2016
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import os
+import warnings
+
+import matplotlib
+matplotlib.use('Agg')
+
+import numpy as np
+
+import cytoflow as flow
+import cytoflow.utility as util
+import cytoflow.operations.bleedthrough_linear as bleedthrough_linear
+
+class Test(unittest.TestCase):
+    
+    def setUp(self):
+        self.cwd = os.path.dirname(os.path.abspath(__file__)) + "/data/tasbe/"
+        self.ex = flow.ImportOp(tubes = [flow.Tube(file = self.cwd + 'rby.fcs')]).apply()
+        self.raw = self.ex.data.values.copy()
+        
+        self.op = flow.BleedthroughLinearOp(
+                    controls = {"FITC-A" : self.cwd + 'eyfp.fcs',
+                                "PE-Tx-Red-YG-A" : self.cwd + 'mkate.fcs',
+                                "Pacific Blue-A" : self.cwd + 'ebfp.fcs'})
+        
+    def testEstimate(self):
+        self.op.estimate(self.ex)
+        self.assertEqual(len(self.op.spillover), 6)
+        
+        ex2 = self.op.apply(self.ex)
+        
+        channels = list(set([x for (x, _) in self.op.spillover.keys()]))
+        a = [[self.op.spillover[(y, x)] if x != y else 1.0 for x in channels]
+             for y in channels]
+        compensated = np.dot(self.ex.data[channels], np.linalg.pinv(a))
+        
+        np.testing.assert_allclose(ex2.data[channels].values, compensated)
+        self.assertFalse(np.allclose(compensated, self.ex.data[channels].values))
+        
+        # the original experiment is unchanged
+        np.testing.assert_array_equal(self.ex.data.values, self.raw)
+        
+    def testChunks(self):
+        self.op.estimate(self.ex)
+        ex2 = self.op.apply(self.ex)
+        
+        chunk_size = bleedthrough_linear._CHUNK_SIZE
+        try:
+            bleedthrough_linear._CHUNK_SIZE = 1000
+            self.op.num_workers = 3
+            ex3 = self.op.apply(self.ex)
+            
+            self.op.single_precision = True
+            ex4 = self.op.apply(self.ex)
+        finally:
+            bleedthrough_linear._CHUNK_SIZE = chunk_size
+        
+        np.testing.assert_array_equal(ex2.data.values, ex3.data.values)
+        np.testing.assert_allclose(ex2.data.values, ex4.data.values, 
+                                   rtol = 1e-5, atol = 1e-2)
+        self.assertEqual(ex4["FITC-A"].dtype, np.float64)
+        
+    def testLoadSpillover(self):
+        self.op.load_spillover(self.cwd + 'rby.fcs', self.ex)
+        
+        # 6 channels, no spillover recorded
+        self.assertEqual(len(self.op.spillover), 30)
+        self.assertIn(("FITC-A", "Pacific Blue-A"), self.op.spillover)
+        self.assertTrue(all(v == 0.0 for v in self.op.spillover.values()))
+        
+        ex2 = self.op.apply(self.ex)
+        np.testing.assert_allclose(ex2.data.values, self.ex.data.values)
+        
+    def testLoadSpilloverRenamed(self):
+        ex = flow.ImportOp(tubes = [flow.Tube(file = self.cwd + 'rby.fcs')],
+                           channel_renames = {"FITC-A" : "YFP"}).apply()
+        self.op.load_spillover(self.cwd + 'rby.fcs', ex)
+        
+        self.assertEqual(len(self.op.spillover), 30)
+        self.assertIn(("YFP", "Pacific Blue-A"), self.op.spillover)
+        self.assertNotIn(("FITC-A", "Pacific Blue-A"), self.op.spillover)
+        
+        ex2 = self.op.apply(ex)
+        np.testing.assert_allclose(ex2.data.values, ex.data.values)
+        
+    def testLoadSpilloverSubset(self):
+        ex = flow.ImportOp(tubes = [flow.Tube(file = self.cwd + 'rby.fcs')],
+                           channels = ["FITC-A", "Pacific Blue-A", 
+                                       "PE-Tx-Red-YG-A"]).apply()
+        with warnings.catch_warnings(record = True) as w:
+            warnings.simplefilter("always")
+            self.op.load_spillover(self.cwd + 'rby.fcs', ex)
+        self.assertTrue(any(issubclass(x.category, util.CytoflowOpWarning)
+                            for x in w))
+        
+        self.assertEqual(len(self.op.spillover), 6)
+        self.assertIn(("FITC-A", "Pacific Blue-A"), self.op.spillover)
+        
+        ex2 = self.op.apply(ex)
+        np.testing.assert_allclose(ex2.data.values, ex.data.values)
+        
+        ex = flow.ImportOp(tubes = [flow.Tube(file = self.cwd + 'rby.fcs')],
+                           channels = ["FITC-A", "FSC-A"]).apply()
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            with self.assertRaises(util.CytoflowOpError):
+                self.op.load_spillover(self.cwd + 'rby.fcs', ex)
+        
+    def testNoSpillover(self):
+        with self.assertRaises(util.CytoflowOpError):
+            self.op.load_spillover(os.path.dirname(self.cwd[0:-1]) + 
+                                   "/data/Plate01/RFP_Well_A3.fcs")
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testLoadSpillover']
+    unittest.main()
@@ -46,7 +46,67 @@ class Test(unittest.TestCase):
         self.op.estimate(self.ex)
         self.op.apply(self.ex)
         self.op.default_view().plot(self.ex)
+        
+    def testEstimateState(self):
+        import json
+        
+        self.op.estimate(self.ex)
+        ex2 = self.op.apply(self.ex)
+        
+        op = flow.BleedthroughPiecewiseOp(controls = self.op.controls)
+        op.set_estimate(json.loads(json.dumps(self.op.get_estimate())))
+        self.assertTrue(ex2.data.equals(op.apply(self.ex).data))
+        
+    def testApplyWorkers(self):
+        self.op.estimate(self.ex)
+        num_workers = self.op._interpolator.num_workers
+        ex2 = self.op.apply(self.ex)
+        
+        self.op.num_workers = 4
+        self.assertTrue(ex2.data.equals(self.op.apply(self.ex).data))
+        self.assertEqual(self.op._interpolator.num_workers, num_workers)
+        
+    def testCorrectMesh(self):
+        import numpy as np
+        from cytoflow.operations.bleedthrough_piecewise import \
+            _correct_bleedthrough, _correct_row
+            
+        self.op.estimate(self.ex)
+        channels = self.op._channels
+        
+        mesh = np.array([[-100.0, 50.0], [10.0, 1000.0], [50000.0, 20.0], 
+                         [1e5, 1e5]])
+        x = _correct_bleedthrough(mesh, channels, self.op._splines)
+        
+        for row in range(len(mesh)):
+            np.testing.assert_allclose(x[row], 
+                                       _correct_row(mesh[row], 
+                                                    channels, 
+                                                    self.op._splines),
+                                       rtol = 1e-6)
 
+    
+    def testGridInterpolator(self):
+        import numpy as np
+        import scipy.interpolate
+        import cytoflow.utility as util
+        
+        axes = [np.array([-10.0, 0.0, 1.0, 100.0, 1000.0]),
+                np.array([-5.0, 10.0, 20.0])]
+        values = np.random.rand(5, 3, 2)
+        x = np.column_stack((np.random.uniform(-20, 1100, 1000),
+                             np.random.uniform(-10, 25, 1000)))
+        
+        interp = util.GridInterpolator(axes, values, chunk_size = 64, 
+                                       num_workers = 2)
+        out = interp(x)
+        
+        for idx in range(2):
+            rgi = scipy.interpolate.RegularGridInterpolator(points = axes,
+                                                            values = values[..., idx],
+                                                            bounds_error = False,
+                                                            fill_value = 0.0)
+            np.testing.assert_allclose(out[:, idx], rgi(x), atol = 1e-12)
 
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
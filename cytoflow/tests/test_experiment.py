@@ -23,6 +23,9 @@ Created on Dec 1, 2015
 import unittest
 import os
 
+import numpy as np
+import fcsparser
+
 import matplotlib
 matplotlib.use('Agg')
 
@@ -43,6 +46,49 @@ class Test(unittest.TestCase):
         
     def testAddCondition(self):
         pass
+    
+    def testAddEventsBulk(self):
+        _, tube1 = fcsparser.parse(self.cwd + 'RFP_Well_A3.fcs')
+        _, tube2 = fcsparser.parse(self.cwd + 'CFP_Well_A4.fcs')
+        
+        ex1 = flow.Experiment()
+        ex1.add_condition("Dox", "float")
+        ex1.add_condition("Strain", "category")
+        for channel in tube1.columns:
+            ex1.add_channel(channel)
+        ex2 = ex1.clone()
+        
+        ex1.add_events(tube1, {"Dox" : 10.0, "Strain" : "BL21"})
+        ex1.add_events(tube2, {"Dox" : 1.0, "Strain" : "Top10G"})
+        
+        ex2.add_events_bulk([(tube1, {"Dox" : 10.0, "Strain" : "BL21"}),
+                             (tube2, {"Dox" : 1.0, "Strain" : "Top10G"})])
+        
+        self.assertEqual(set(ex1.data.columns), set(ex2.data.columns))
+        self.assertEqual(set(ex1.data["Strain"].cat.categories),
+                         set(ex2.data["Strain"].cat.categories))
+        for col in ex1.data.columns:
+            np.testing.assert_array_equal(ex1.data[col].values, 
+                                          ex2.data[col].values)
+        
+    def testClone(self):
+        ex2 = self.ex.clone()
+        
+        # unchanged columns share storage with the parent
+        self.assertTrue(np.may_share_memory(ex2.data["V2-A"].values,
+                                            self.ex.data["V2-A"].values))
+        
+        ex2.add_condition("V2-A+", "bool", ex2.data["V2-A"] > 100)
+        ex2["Y2-A"] = ex2.data["Y2-A"] * 2
+        
+        # writes don't propagate back to the parent
+        self.assertNotIn("V2-A+", self.ex.data)
+        self.assertFalse(np.may_share_memory(ex2.data["Y2-A"].values,
+                                             self.ex.data["Y2-A"].values))
+        np.testing.assert_array_equal(ex2.data["Y2-A"].values,
+                                      self.ex.data["Y2-A"].values * 2)
+        self.assertEqual(list(ex2.data.columns[:-1]), 
+                         list(self.ex.data.columns))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,126 @@
+#!/usr/bin/env python2.7
+
+# (c) Massachusetts Institute of Technology 2015-2016
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import os
+
+import numpy as np
+import pandas as pd
+
+import cytoflow as flow
+import cytoflow.utility as util
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.path.dirname(os.path.abspath(__file__)) + "/data/Plate01/"
+        tube1 = flow.Tube(file = self.cwd + 'RFP_Well_A3.fcs', conditions = {"Dox" : 10.0})
+        tube2 = flow.Tube(file= self.cwd + 'CFP_Well_A4.fcs', conditions = {"Dox" : 1.0})
+        import_op = flow.ImportOp(conditions = {"Dox" : "float"},
+                                  tubes = [tube1, tube2])
+        self.ex = import_op.apply()
+
+        self.gates = [flow.ThresholdOp(name = "Y2_High",
+                                       channel = "Y2-A",
+                                       threshold = 200),
+                      flow.RangeOp(name = "V2_Mid",
+                                   channel = "V2-A",
+                                   low = 50,
+                                   high = 500),
+                      flow.Range2DOp(name = "Box",
+                                     xchannel = "V2-A",
+                                     xlow = 10,
+                                     xhigh = 1000,
+                                     ychannel = "Y2-A",
+                                     ylow = 100,
+                                     yhigh = 10000),
+                      flow.QuadOp(name = "Quad",
+                                  xchannel = "V2-A",
+                                  xthreshold = 100,
+                                  ychannel = "Y2-A",
+                                  ythreshold = 1000),
+                      # only one quadrant has events
+                      flow.QuadOp(name = "Corner",
+                                  xchannel = "V2-A",
+                                  xthreshold = 1e9,
+                                  ychannel = "Y2-A",
+                                  ythreshold = -1e9)]
+
+    def testExpected(self):
+        # events that are missing, or right on a gate's bounds
+        y2 = self.ex.data["Y2-A"].values
+        v2 = self.ex.data["V2-A"].values
+        y2[0:4] = [np.nan, 200.0, 1000.0, 100.0]
+        v2[4:9] = [np.nan, 50.0, 500.0, 100.0, 10.0]
+        
+        x = self.ex.data["V2-A"]
+        y = self.ex.data["Y2-A"]
+        expected = {"Y2_High" : y > 200,
+                    "V2_Mid" : x.between(50, 500),
+                    "Box" : x.between(10, 1000) & y.between(100, 10000),
+                    "Quad_1" : (x < 100) & (y > 1000),
+                    "Quad_2" : (x > 100) & (y > 1000),
+                    "Quad_3" : (x > 100) & (y < 1000),
+                    "Quad_4" : (x < 100) & (y < 1000),
+                    "Corner_1" : (x < 1e9) & (y > -1e9)}
+        
+        for block_size in [7, 65536]:
+            ex = flow.GateSetOp(gates = self.gates, 
+                                block_size = block_size).apply(self.ex)
+            
+            for name in ["Y2_High", "V2_Mid", "Box"]:
+                self.assertTrue((ex[name] == expected[name]).all())
+                
+            for name, quads in [("Quad", ["Quad_1", "Quad_2", "Quad_3", "Quad_4"]),
+                                ("Corner", ["Corner_1"])]:
+                none = np.ones(len(ex), dtype = np.bool_)
+                for quad in quads:
+                    self.assertTrue(((ex[name] == quad) == expected[quad]).all())
+                    none &= ~expected[quad].values
+                self.assertTrue(ex[name].isnull().equals(pd.Series(none)))
+                
+        # events on a quad's threshold, or missing, aren't in any quadrant
+        self.assertTrue(ex["Quad"][[0, 2, 4, 7]].isnull().all())
+        self.assertTrue(ex["Corner"][[0, 4]].isnull().all())
+        self.assertFalse(ex["Y2_High"][1])
+        self.assertTrue(ex["V2_Mid"][5] and ex["V2_Mid"][6])
+        
+    def testSequential(self):
+        # the gates' own apply()s use GateSetOp too, so this only checks 
+        # that one set is the same as a chain of them; see testExpected()
+        ex_seq = self.ex
+        for gate in self.gates:
+            ex_seq = gate.apply(ex_seq)
+
+        ex_set = flow.GateSetOp(gates = self.gates, block_size = 3000).apply(self.ex)
+
+        self.assertTrue(ex_set.data.equals(ex_seq.data))
+        self.assertTrue((ex_set.data.dtypes == ex_seq.data.dtypes).all())
+        self.assertEqual(ex_set.metadata, ex_seq.metadata)
+        self.assertEqual([op.name for op in ex_set.history],
+                         [op.name for op in ex_seq.history])
+        self.assertEqual(list(ex_set["Corner"].cat.categories), ["Corner_1"])
+
+    def testDuplicateName(self):
+        op = flow.GateSetOp(gates = [self.gates[0], self.gates[0]])
+        with self.assertRaises(util.CytoflowOpError):
+            op.apply(self.ex)
+
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testSequential']
+    unittest.main()
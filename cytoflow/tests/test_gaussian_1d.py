@@ -22,11 +22,16 @@ Created on Dec 1, 2015
 '''
 import os
 import unittest
+import threading
+import warnings
 
 import matplotlib
 matplotlib.use('Agg')
 
+import numpy as np
+
 import cytoflow as flow
+import cytoflow.utility as util
 
 class Test(unittest.TestCase):
 
@@ -59,6 +64,36 @@ class Test(unittest.TestCase):
         self.assertAlmostEqual(self.gate._gmms[10.0].means_[0][0], 0.133235845266, places = 3)
         self.assertAlmostEqual(self.gate._gmms[10.0].means_[1][0], 0.618998444886, places = 3) 
         
+    def testEstimateParallel(self):
+        self.gate.by = ["Dox"]
+        self.gate.estimate(self.ex)
+        gmms = self.gate._gmms
+        
+        self.gate.num_workers = 2
+        for mode in ["fork", "pool", "threads"]:
+            self.gate._gmms = {}
+            if mode == "fork":
+                self.gate.estimate(self.ex)
+            else:
+                # with other threads running, the groups are fit in the 
+                # process pool if there is one, and with threads if not
+                if mode == "pool":
+                    util.start_process_pool(2)
+                try:
+                    with warnings.catch_warnings(record = True):
+                        warnings.simplefilter("always", util.CytoflowWarning)
+                        t = threading.Thread(target = self.gate.estimate, 
+                                             args = (self.ex,))
+                        t.start()
+                        t.join()
+                finally:
+                    util.stop_process_pool()
+                
+            self.assertEqual(sorted(gmms.keys()), sorted(self.gate._gmms.keys()))
+            for group in gmms:
+                self.assertTrue((gmms[group].means_ == self.gate._gmms[group].means_).all())
+                self.assertTrue((gmms[group].covars_ == self.gate._gmms[group].covars_).all())
+        
     def testApply(self):
         self.gate.estimate(self.ex)
         ex2 = self.gate.apply(self.ex)
@@ -82,6 +117,80 @@ class Test(unittest.TestCase):
         self.assertAlmostEqual(ex2.data.groupby(["Gauss", "Dox"]).size().loc["Gauss_None", 10], 5165, delta = 3)        
 
     
+    def testApplyGrid(self):
+        self.gate.by = ["Dox"]
+        self.gate.estimate(self.ex)
+        ex2 = self.gate.apply(self.ex)
+        
+        self.gate.apply_bins = 10000
+        ex3 = self.gate.apply(self.ex)
+        
+        # only events right at a boundary can change
+        self.assertLess((ex2.data["Gauss"] != ex3.data["Gauss"]).sum(), 10)
+    
+    def testApplyGridInfinite(self):
+        self.gate.scale = "linear"
+        self.gate.apply_bins = 1000
+        self.gate.estimate(self.ex)
+        ex2 = self.gate.apply(self.ex)
+        
+        # an infinite value can't be classified, and doesn't move the grid
+        self.ex.data["Y2-A"].values[0] = np.inf
+        ex3 = self.gate.apply(self.ex)
+        self.assertEqual(ex3.data["Gauss"][0], "Gauss_None")
+        self.assertTrue((ex2.data["Gauss"][1:] == ex3.data["Gauss"][1:]).all())
+        
+        with self.assertRaises(ValueError):
+            util.grid_lookup(lambda g: (g,), [[0.0], [np.inf]], 10)
+        
+    def testManyComponents(self):
+        self.gate.estimate(self.ex)
+        
+        # more components than an int8 can count, spread across the data
+        n = 130
+        scaled = self.gate._scale(self.ex["Y2-A"].values)[:, np.newaxis]
+        means = np.percentile(scaled, np.linspace(0.5, 99.5, n))
+        estimate = self.gate.get_estimate()
+        estimate["gmms"][0].update(weights = [1.0 / n] * n,
+                                   means = [[m] for m in means],
+                                   covars = [[1e-4]] * n)
+        self.gate.num_components = n
+        self.gate.sigma = 0.0
+        self.gate.set_estimate(estimate)
+        ex2 = self.gate.apply(self.ex)
+        
+        expected = self.gate._gmms[True].predict(scaled)
+        self.assertEqual(len(ex2["Gauss"].cat.categories), n + 1)
+        np.testing.assert_array_equal(ex2["Gauss"].cat.codes, expected)
+        
+    def testEstimateBinned(self):
+        self.gate.by = ["Dox"]
+        self.gate.estimate_bins = 1024
+        self.gate.estimate(self.ex)
+        self.assertAlmostEqual(self.gate._gmms[1.0].means_[0][0], 0.14084352777, places = 3)
+        self.assertAlmostEqual(self.gate._gmms[10.0].means_[0][0], 0.133235845266, places = 3)
+        self.assertAlmostEqual(self.gate._gmms[10.0].means_[1][0], 0.618998444886, places = 3)
+        self.assertAlmostEqual(self.gate._gmms[10.0].weights_[0], 0.56064436, places = 3)
+        
+    def testEstimateSubsample(self):
+        self.gate.by = ["Dox"]
+        self.gate.estimate_subsample = 2000
+        self.gate.estimate(self.ex)
+        self.assertEqual(self.gate._subsampled, {1.0 : (2000, 10000),
+                                                 10.0 : (2000, 10000)})
+        self.assertAlmostEqual(self.gate._gmms[10.0].means_[0][0], 0.133235845266, places = 1)
+        self.assertAlmostEqual(self.gate._gmms[10.0].means_[1][0], 0.618998444886, places = 1) 
+        
+        # the subsample is the same every time
+        means = self.gate._gmms[1.0].means_.copy()
+        self.gate.estimate(self.ex)
+        self.assertTrue((means == self.gate._gmms[1.0].means_).all())
+        
+        # but all the events are classified
+        ex2 = self.gate.apply(self.ex)
+        self.assertEqual(len(ex2), 20000)
+        self.gate.default_view().plot(self.ex)
+    
     def testPlot(self):
         self.gate.estimate(self.ex)
         self.gate.default_view().plot(self.ex)
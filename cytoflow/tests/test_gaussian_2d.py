@@ -23,6 +23,8 @@ Created on Dec 1, 2015
 import unittest
 import os
 
+import numpy as np
+
 import matplotlib
 matplotlib.use('Agg')
 
@@ -67,6 +69,57 @@ class Test(unittest.TestCase):
         self.assertAlmostEqual(self.gate._gmms[10.0].means_[1][0], 0.230731659893)
         self.assertAlmostEqual(self.gate._gmms[10.0].means_[1][1], 0.618217911538)
     
+    def testEstimateParallel(self):
+        self.gate.by = ["Dox"]
+        self.gate.estimate(self.ex)
+        gmms = self.gate._gmms
+        
+        self.gate.num_workers = 2
+        self.gate.estimate(self.ex)
+        self.assertEqual(sorted(gmms.keys()), sorted(self.gate._gmms.keys()))
+        for group in gmms:
+            self.assertTrue((gmms[group].means_ == self.gate._gmms[group].means_).all())
+            self.assertTrue((gmms[group].covars_ == self.gate._gmms[group].covars_).all())
+        
+    def testEstimateStreaming(self):
+        self.gate.by = ["Dox"]
+        self.gate.estimate_batch_size = 2000
+        self.gate.estimate(self.ex)
+        self.assertTrue(self.gate._gmms[10.0].converged_)
+        self.assertAlmostEqual(self.gate._gmms[10.0].means_[0][0], 0.166408870403, places = 2)
+        self.assertAlmostEqual(self.gate._gmms[10.0].means_[0][1], 0.132633502267, places = 2)        
+        self.assertAlmostEqual(self.gate._gmms[10.0].means_[1][0], 0.230731659893, places = 2)
+        self.assertAlmostEqual(self.gate._gmms[10.0].means_[1][1], 0.618217911538, places = 2)
+        
+    def testEstimateWarmStart(self):
+        self.gate.by = ["Dox"]
+        self.gate.estimate(self.ex)
+        means = self.gate._gmms[10.0].means_.copy()
+        
+        self.gate.warm_start = True
+        self.gate.estimate_batch_size = 2000
+        self.gate.estimate(self.ex)
+        self.assertTrue(self.gate._gmms[10.0].converged_)
+        self.assertTrue(np.allclose(self.gate._gmms[10.0].means_, means, atol = 0.01))
+        
+    def testEstimateState(self):
+        import json, pickle
+        
+        self.gate.by = ["Dox"]
+        self.gate.estimate(self.ex)
+        ex2 = self.gate.apply(self.ex)
+        
+        # restore a saved estimate into a new op, without estimate()
+        estimate = json.loads(json.dumps(self.gate.get_estimate()))
+        gate = self.gate.clone_traits()
+        gate._gmms = {}
+        gate.set_estimate(estimate)
+        self.assertTrue(ex2.data.equals(gate.apply(self.ex).data))
+        
+        # pickling carries the estimate
+        gate = pickle.loads(pickle.dumps(self.gate))
+        self.assertTrue(ex2.data.equals(gate.apply(self.ex).data))
+        
     def testApply(self):
         self.gate.estimate(self.ex)
         ex2 = self.gate.apply(self.ex) 
@@ -89,6 +142,41 @@ class Test(unittest.TestCase):
         self.assertEqual(ex2.data.groupby(["Gauss", "Dox"]).size().loc["Gauss_None", 1], 4848)        
         self.assertEqual(ex2.data.groupby(["Gauss", "Dox"]).size().loc["Gauss_None", 10], 5150)        
     
+    def testApplyCategories(self):
+        self.gate.estimate(self.ex)
+        ex2 = self.gate.apply(self.ex)
+        
+        self.assertEqual(list(ex2.data["Gauss"].cat.categories), 
+                         ["Gauss_1", "Gauss_2", "Gauss_None"])
+        self.assertEqual(ex2.data["Gauss"].cat.codes.dtype, "int8")
+        self.assertEqual((ex2.data["Gauss_Posterior"] > 0).sum(),
+                         (ex2.data["Gauss"] != "Gauss_None").sum())
+        
+    def testApplyGrid(self):
+        self.gate.by = ["Dox"]
+        self.gate.estimate(self.ex)
+        ex2 = self.gate.apply(self.ex)
+        
+        self.gate.apply_bins = 1000
+        ex3 = self.gate.apply(self.ex)
+        
+        # only events right at a boundary can change
+        self.assertLess((ex2.data["Gauss"] != ex3.data["Gauss"]).sum(), 100)
+        self.assertLess((ex2.data["Gauss_Posterior"] - ex3.data["Gauss_Posterior"]).abs().median(), 0.001)
+    
+    def testApplyGridInfinite(self):
+        self.gate.xscale = "linear"
+        self.gate.yscale = "linear"
+        self.gate.apply_bins = 100
+        self.gate.estimate(self.ex)
+        ex2 = self.gate.apply(self.ex)
+        
+        # an infinite value can't be classified, and doesn't move the grid
+        self.ex.data["V2-A"].values[0] = -np.inf
+        ex3 = self.gate.apply(self.ex)
+        self.assertEqual(ex3.data["Gauss"][0], "Gauss_None")
+        self.assertTrue((ex2.data["Gauss"][1:] == ex3.data["Gauss"][1:]).all())
+    
     def testPlot(self):
         self.gate.estimate(self.ex)
         self.gate.default_view().plot(self.ex)
@@ -27,7 +27,7 @@ import numpy as np
 from numpy.testing import assert_almost_equal
 
 import cytoflow as flow
-from cytoflow.operations.hlog import hlog
+from cytoflow.operations.hlog import hlog, hlog_inv
 
 class Test(unittest.TestCase):
 
@@ -73,6 +73,15 @@ class Test(unittest.TestCase):
         d = (hlpos_large - tlpos_large) / hlpos_large
         assert_almost_equal(d, np.zeros(len(d)), decimal=2)
         
+    def test_hlog_inverse(self):
+        x = np.r_[-np.logspace(-3, 6, 1000), 0, np.logspace(-3, 6, 1000)]
+        for b in [0.5, 10, 500]:
+            y = hlog(x, b = b)
+            np.testing.assert_allclose(hlog_inv(y, b = b), x, 
+                                       rtol = 1e-14, atol = 1e-12)
+            
+        self.assertTrue(np.isnan(hlog([np.nan])[0]))
+        
         
 
 _machine_max = 2**18
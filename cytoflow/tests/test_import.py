@@ -23,7 +23,53 @@ Created on Dec 1, 2015
 
 import unittest
 import os
+import tempfile
+import shutil
+import stat
+import warnings
+
+import numpy as np
+import fcsparser
+
 import cytoflow as flow
+import cytoflow.utility as util
+from cytoflow.operations.import_op import parse_fcs
+
+def write_int_fcs(filename, data, bits, ranges, byteord = "4,3,2,1"):
+    """Write a minimal FCS 3.0 file with $DATATYPE I"""
+    
+    endian = ">" if byteord.startswith("4") else "<"
+    dtype = np.dtype([("p{0}".format(i), "{0}u{1}".format(endian, b // 8))
+                      for i, b in enumerate(bits)])
+    events = np.empty(len(data), dtype = dtype)
+    for i in range(len(bits)):
+        events["p{0}".format(i)] = data[:, i]
+    raw = events.tobytes()
+    
+    keywords = [("$BYTEORD", byteord), ("$DATATYPE", "I"), ("$MODE", "L"),
+                ("$NEXTDATA", "0"), ("$PAR", str(len(bits))), 
+                ("$TOT", str(len(data)))]
+    for i, (b, r) in enumerate(zip(bits, ranges)):
+        keywords += [("$P{0}B".format(i + 1), str(b)),
+                     ("$P{0}E".format(i + 1), "0,0"),
+                     ("$P{0}N".format(i + 1), "Ch{0}".format(i + 1)),
+                     ("$P{0}R".format(i + 1), str(r))]
+    
+    # leave room for the $BEGINDATA and $ENDDATA values
+    text_start = 58
+    text = "/" + "/".join("{0}/{1}".format(k, v) for k, v in keywords) + \
+           "/$BEGINDATA/{0:>10}/$ENDDATA/{1:>10}/"
+    data_start = text_start + len(text.format(0, 0))
+    data_end = data_start + len(raw) - 1
+    text = text.format(data_start, data_end)
+    header = "FCS3.0    {0:>8}{1:>8}{2:>8}{3:>8}{4:>8}{5:>8}" \
+             .format(text_start, text_start + len(text) - 1, 
+                     data_start, data_end, 0, 0)
+             
+    with open(filename, "wb") as f:
+        f.write(header.encode("ascii"))
+        f.write(text.encode("ascii"))
+        f.write(raw)
 
 class Test(unittest.TestCase):
     
@@ -60,6 +106,305 @@ class Test(unittest.TestCase):
                                   tubes = [tube1, tube2])
         with self.assertRaises(RuntimeError):
             import_op.apply()
+
+    def testChannelSubset(self):
+        tube1 = flow.Tube(file = self.cwd + '/data/Plate01/RFP_Well_A3.fcs', conditions = {"Dox" : 10.0})
+        tube2 = flow.Tube(file= self.cwd + '/data/Plate01/CFP_Well_A4.fcs', conditions = {"Dox" : 1.0})
+        import_op = flow.ImportOp(conditions = {"Dox" : "float"},
+                                  tubes = [tube1, tube2])
+        ex1 = import_op.apply()
+        
+        import_op.channels = ["Y2-A", "V2-A"]
+        import_op.channel_renames = {"Y2-A" : "mCherry"}
+        ex2 = import_op.apply()
+        
+        self.assertEqual(set(ex2.channels), set(["mCherry", "V2-A"]))
+        self.assertEqual(ex2.metadata["mCherry"]["range"], 
+                         ex1.metadata["Y2-A"]["range"])
+        self.assertEqual(ex2.metadata["mCherry"]["fcs_name"], "Y2-A")
+        np.testing.assert_array_equal(ex2.data["mCherry"], ex1.data["Y2-A"])
+        np.testing.assert_array_equal(ex2.data["V2-A"], ex1.data["V2-A"])
+        
+        import_op.channels = ["Y2-A", "not-a-channel"]
+        with self.assertRaises(flow.utility.CytoflowOpError):
+            import_op.apply()
+        
+    def testCoarse(self):
+        tube1 = flow.Tube(file = self.cwd + '/data/Plate01/RFP_Well_A3.fcs', conditions = {"Dox" : 10.0})
+        tube2 = flow.Tube(file= self.cwd + '/data/Plate01/CFP_Well_A4.fcs', conditions = {"Dox" : 1.0})
+        import_op = flow.ImportOp(conditions = {"Dox" : "float"},
+                                  tubes = [tube1, tube2])
+        ex = import_op.apply()
+        
+        import_op.coarse_events = 1000
+        ex1 = import_op.apply()
+        ex2 = import_op.apply()
+        
+        self.assertEqual(len(ex1), 2000)
+        self.assertTrue(ex1.data.equals(ex2.data))
+        
+        # every sampled event is a real event from the right tube
+        for dox in [1.0, 10.0]:
+            full = ex.data[ex.data["Dox"] == dox]
+            coarse = ex1.data[ex1.data["Dox"] == dox]
+            self.assertEqual(len(coarse), 1000)
+            self.assertTrue(set(coarse["Y2-A"]) <= set(full["Y2-A"]))
+            
+        import_op.coarse_seed = 1
+        ex3 = import_op.apply()
+        self.assertFalse(ex1.data.equals(ex3.data))
+        
+    def testNumWorkers(self):
+        tubes = [flow.Tube(file = self.cwd + '/data/Plate01/' + f, 
+                           conditions = {"Well" : f})
+                 for f in ['RFP_Well_A3.fcs', 'CFP_Well_A4.fcs', 
+                           'YFP_Well_A7.fcs', 'RFP_Well_B3.fcs']]
+        import_op = flow.ImportOp(conditions = {"Well" : "category"},
+                                  tubes = tubes)
+        ex1 = import_op.apply()
+        
+        import_op.num_workers = 3
+        ex2 = import_op.apply()
+        
+        self.assertTrue(ex1.data.equals(ex2.data))
+
+    def testUpdate(self):
+        tubes = [flow.Tube(file = self.cwd + '/data/Plate01/' + f,
+                           conditions = {"Well" : f})
+                 for f in ['RFP_Well_A3.fcs', 'CFP_Well_A4.fcs',
+                           'YFP_Well_A7.fcs']]
+        import_op = flow.ImportOp(conditions = {"Well" : "category"},
+                                  tubes = tubes[0:2],
+                                  coarse_events = 1000)
+        thresh_op = flow.ThresholdOp(name = "Y2_High", channel = "Y2-A",
+                                     threshold = 200)
+        hlog_op = flow.HlogTransformOp(channels = ["V2-A", "Y2-A"])
+        
+        ex = hlog_op.apply(thresh_op.apply(import_op.apply()))
+        
+        # no new tubes
+        self.assertIs(import_op.update(ex), ex)
+        
+        import_op.tubes = tubes
+        ex_update = import_op.update(ex)
+        ex_full = hlog_op.apply(thresh_op.apply(import_op.apply()))
+        
+        self.assertEqual(len(ex), 2000)
+        self.assertTrue(ex_update.data.equals(ex_full.data))
+        self.assertEqual(ex_update.metadata["tubes"],
+                         ex_full.metadata["tubes"])
+        
+        # binning isn't row-local
+        bin_op = flow.BinningOp(name = "Bin", channel = "Y2-A",
+                                scale = "linear", bin_width = 100)
+        import_op.tubes = tubes[0:2]
+        ex = bin_op.apply(import_op.apply())
+        import_op.tubes = tubes
+        with self.assertRaises(flow.utility.CytoflowOpError):
+            import_op.update(ex)
+
+    def testTubeCache(self):
+        tube1 = flow.Tube(file = self.cwd + '/data/Plate01/RFP_Well_A3.fcs', conditions = {"Dox" : 10.0})
+        tube2 = flow.Tube(file= self.cwd + '/data/Plate01/CFP_Well_A4.fcs', conditions = {"Dox" : 1.0})
+        cache_dir = tempfile.mkdtemp()
+        try:
+            import_op = flow.ImportOp(conditions = {"Dox" : "float"},
+                                      tubes = [tube1, tube2],
+                                      cache_dir = cache_dir)
+            ex1 = import_op.apply()
+            self.assertEqual(len([d for d in os.listdir(cache_dir) 
+                                  if d.endswith("-PnS")]), 2)
+            
+            ex2 = import_op.apply()
+            self.assertTrue(ex1.data.equals(ex2.data))
+        finally:
+            shutil.rmtree(cache_dir)
+            
+    def testUnwritableTubeCache(self):
+        tube1 = flow.Tube(file = self.cwd + '/data/Plate01/RFP_Well_A3.fcs', conditions = {"Dox" : 10.0})
+        tube2 = flow.Tube(file= self.cwd + '/data/Plate01/CFP_Well_A4.fcs', conditions = {"Dox" : 1.0})
+        ex1 = flow.ImportOp(conditions = {"Dox" : "float"},
+                            tubes = [tube1, tube2]).apply()
+        
+        root = tempfile.mkdtemp()
+        try:
+            os.chmod(root, stat.S_IRUSR | stat.S_IXUSR)
+            cache_dir = os.path.join(root, "cache")
+            
+            # a read-only directory doesn't stop root, but a directory
+            # that can't be created stops everyone
+            if os.access(root, os.W_OK):
+                blocker = os.path.join(root, "not-a-directory")
+                open(blocker, "w").close()
+                cache_dir = os.path.join(blocker, "cache")
+            
+            import_op = flow.ImportOp(conditions = {"Dox" : "float"},
+                                      tubes = [tube1, tube2],
+                                      cache_dir = cache_dir)
+            with warnings.catch_warnings(record = True) as w:
+                warnings.simplefilter("always")
+                ex2 = import_op.apply()
+            
+            self.assertTrue(ex1.data.equals(ex2.data))
+            self.assertTrue(any(issubclass(x.category, util.CytoflowOpWarning)
+                                for x in w))
+        finally:
+            os.chmod(root, stat.S_IRWXU)
+            shutil.rmtree(root)
+        
+    def testMetadataCache(self):
+        import cytoflow.operations.import_op as import_op
+        
+        f = self.cwd + '/data/Plate01/RFP_Well_A3.fcs'
+        import_op.clear_metadata_cache()
+        meta1 = parse_fcs(f, meta_data_only = True)
+        self.assertEqual(len(import_op._metadata_cache), 1)
+        
+        # callers get their own copy of the metadata
+        meta1["_channels_"].set_index("$PnN", inplace = True)
+        meta2 = parse_fcs(f, meta_data_only = True)
+        self.assertEqual(len(import_op._metadata_cache), 1)
+        self.assertEqual(meta2["_channels_"].index.name, "Channel Number")
+        
+        # least-recently used files are evicted first
+        old_size = import_op.metadata_cache_size
+        import_op.metadata_cache_size = 1
+        try:
+            parse_fcs(self.cwd + '/data/Plate01/CFP_Well_A4.fcs',
+                      meta_data_only = True)
+            self.assertEqual(len(import_op._metadata_cache), 1)
+            self.assertNotIn(f, [k[0] for k in import_op._metadata_cache])
+        finally:
+            import_op.metadata_cache_size = old_size
+        
+    def testControlCache(self):
+        import cytoflow.operations.import_op as import_op
+        
+        blank = self.cwd + '/data/tasbe/blank.fcs'
+        ex = flow.ImportOp(tubes = [flow.Tube(file = self.cwd + '/data/tasbe/rby.fcs')]).apply()
+        af_op = flow.AutofluorescenceOp(channels = ["FITC-A", "Pacific Blue-A"],
+                                        blank_file = blank)
+        import_op.clear_control_cache()
+        af_op.estimate(ex)
+        self.assertEqual(len(import_op._control_cache), 1)
+        
+        # the next op's control reuses the imported blank tube, and caches
+        # it with the autofluorescence correction applied
+        ex2 = af_op.apply(ex)
+        thresh_op = flow.ThresholdOp(name = "T", channel = "FITC-A", threshold = 0)
+        ex3 = thresh_op.apply(ex2)
+        blank_exp = import_op.import_control(blank, ex3)
+        self.assertEqual(len(import_op._control_cache), 3)
+        
+        manual = thresh_op.apply(af_op.apply(flow.ImportOp(tubes = [flow.Tube(file = blank)]).apply()))
+        self.assertTrue(blank_exp.data.equals(manual.data))
+        
+        # the same parameters have the same fingerprint
+        self.assertEqual(import_op._fingerprint(ex3.history[-1]),
+                         import_op._fingerprint(thresh_op))
+        thresh_op.threshold = 10
+        self.assertNotEqual(import_op._fingerprint(ex3.history[-1]),
+                            import_op._fingerprint(thresh_op))
+        
+        # the same file, imported with different channels, isn't shared
+        ex_subset = flow.ImportOp(tubes = [flow.Tube(file = self.cwd + '/data/tasbe/rby.fcs')],
+                                  channels = ["FITC-A", "Pacific Blue-A"]).apply()
+        blank_subset = import_op.import_control(blank, ex_subset)
+        self.assertEqual(len(import_op._control_cache), 4)
+        self.assertEqual(set(blank_subset.channels), 
+                         set(["FITC-A", "Pacific Blue-A"]))
+
+    def testRenamedControls(self):
+        tasbe = self.cwd + '/data/tasbe/'
+        ex = flow.ImportOp(tubes = [flow.Tube(file = tasbe + 'rby.fcs')]).apply()
+        ex_renamed = flow.ImportOp(tubes = [flow.Tube(file = tasbe + 'rby.fcs')],
+                                   channels = ["FITC-A", "PE-Tx-Red-YG-A"],
+                                   channel_renames = {"FITC-A" : "YFP"}).apply()
+
+        # the controls are imported with the same channels and names as
+        # the experiment
+        af = flow.AutofluorescenceOp(channels = ["FITC-A", "PE-Tx-Red-YG-A"],
+                                     blank_file = tasbe + 'blank.fcs')
+        af_renamed = flow.AutofluorescenceOp(channels = ["YFP", "PE-Tx-Red-YG-A"],
+                                             blank_file = tasbe + 'blank.fcs')
+        af.estimate(ex)
+        af_renamed.estimate(ex_renamed)
+        self.assertEqual(af_renamed._af_median["YFP"], af._af_median["FITC-A"])
+
+        ex = af.apply(ex)
+        ex_renamed = af_renamed.apply(ex_renamed)
+
+        bl = flow.BleedthroughLinearOp(
+                    controls = {"FITC-A" : tasbe + 'eyfp.fcs',
+                                "PE-Tx-Red-YG-A" : tasbe + 'mkate.fcs'})
+        bl_renamed = flow.BleedthroughLinearOp(
+                    controls = {"YFP" : tasbe + 'eyfp.fcs',
+                                "PE-Tx-Red-YG-A" : tasbe + 'mkate.fcs'})
+        bl.estimate(ex)
+        bl_renamed.estimate(ex_renamed)
+        self.assertEqual(bl_renamed.spillover[("YFP", "PE-Tx-Red-YG-A")],
+                         bl.spillover[("FITC-A", "PE-Tx-Red-YG-A")])
+
+    def testParseFCS(self):
+        for f in [self.cwd + '/data/Plate01/RFP_Well_A3.fcs',   # little-endian
+                  self.cwd + '/data/tasbe/blank.fcs']:          # big-endian
+            meta1, data1 = fcsparser.parse(f, reformat_meta = True)
+            meta2, data2 = parse_fcs(f)
+            
+            self.assertEqual(meta1["_channel_names_"], meta2["_channel_names_"])
+            self.assertEqual(list(meta1["_channels_"]["$PnR"]),
+                             list(meta2["_channels_"]["$PnR"]))
+            self.assertEqual(list(data1.columns), list(data2.columns))
+            np.testing.assert_array_equal(data1.values, data2.values)
+            
+    def testParseIntegerFCS(self):
+        data = np.array([[1, 70000, 3],
+                         [1023, 65535, 0xFFFF],
+                         [0xFC05, 0, 0x1FF]])
+        
+        fd, filename = tempfile.mkstemp(suffix = ".fcs")
+        os.close(fd)
+        try:
+            for byteord in ["4,3,2,1", "1,2,3,4"]:
+                write_int_fcs(filename, data, 
+                              bits = [16, 32, 16], 
+                              ranges = [1024, 262144, 65536],
+                              byteord = byteord)
+                meta, fcs_data = parse_fcs(filename, channel_naming = "$PnN")
+                self.assertEqual(meta["_channel_names_"], ("Ch1", "Ch2", "Ch3"))
+                
+                # parameter 1 has a range of 1024, so it's masked with 0x3FF
+                np.testing.assert_array_equal(fcs_data["Ch1"], [1, 1023, 5])
+                np.testing.assert_array_equal(fcs_data["Ch2"], data[:, 1])
+                np.testing.assert_array_equal(fcs_data["Ch3"], data[:, 2])
+        finally:
+            os.remove(filename)
+            
+    def testParseIntegerFCSLargeRange(self):
+        data = np.array([[0xE0000001, 0xC0000002],
+                         [0x1FFFFFFF, 0x7FFFFFFF]])
+        
+        fd, filename = tempfile.mkstemp(suffix = ".fcs")
+        os.close(fd)
+        try:
+            write_int_fcs(filename, data, 
+                          bits = [32, 32], 
+                          ranges = [2 ** 29, 2 ** 31])
+            meta, fcs_data = parse_fcs(filename, channel_naming = "$PnN")
+            np.testing.assert_array_equal(fcs_data["Ch1"], 
+                                          [1, 0x1FFFFFFF])
+            np.testing.assert_array_equal(fcs_data["Ch2"], 
+                                          [0x40000002, 0x7FFFFFFF])
+            
+            # 24-bit parameters are byte-aligned, but numpy has no such type
+            with open(filename, "rb") as f:
+                raw = f.read()
+            with open(filename, "wb") as f:
+                f.write(raw.replace(b"/$P1B/32/", b"/$P1B/24/"))
+            with self.assertRaises(util.CytoflowError):
+                parse_fcs(filename, channel_naming = "$PnN")
+        finally:
+            os.remove(filename)
     
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
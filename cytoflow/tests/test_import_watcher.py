@@ -0,0 +1,145 @@
+#!/usr/bin/env python2.7
+
+# (c) Massachusetts Institute of Technology 2015-2016
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import os
+import tempfile
+import shutil
+import time
+import warnings
+
+from traits.api import HasStrictTraits, Bool
+
+import cytoflow as flow
+import cytoflow.utility as util
+
+class Test(unittest.TestCase):
+    
+    def setUp(self):
+        self.cwd = os.path.dirname(os.path.abspath(__file__)) + "/data/Plate01/"
+        self.dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+    
+    def testWatchDirectory(self):
+        for f in ['RFP_Well_A3.fcs', 'CFP_Well_A4.fcs']:
+            shutil.copy(self.cwd + f, self.dir)
+        
+        # a file that's still being written
+        with open(self.cwd + 'YFP_Well_A7.fcs', 'rb') as f:
+            contents = f.read()
+        with open(os.path.join(self.dir, 'YFP_Well_A7.fcs'), 'wb') as f:
+            f.write(contents[0:len(contents) // 2])
+        
+        import_op = flow.ImportOp(conditions = {"Well" : "category"})
+        thresh_op = flow.ThresholdOp(name = "Y2_High", channel = "Y2-A",
+                                     threshold = 200)
+        watcher = flow.ImportWatcher(
+            op = import_op,
+            directory = self.dir,
+            tube_conditions = lambda f: {"Well" : os.path.basename(f)},
+            operations = [thresh_op],
+            settle_time = 0)
+        
+        self.assertEqual(len(watcher.poll()), 2)
+        self.assertEqual(len(watcher.experiment), 20000)
+        self.assertEqual(watcher.poll(), [])
+        
+        with open(os.path.join(self.dir, 'YFP_Well_A7.fcs'), 'wb') as f:
+            f.write(contents)
+        
+        self.assertEqual(len(watcher.poll()), 1)
+        
+        ex = thresh_op.apply(import_op.apply())
+        self.assertTrue(watcher.experiment.data.equals(ex.data))
+    
+    def testSettleTime(self):
+        tube = flow.Tube(file = os.path.join(self.dir, 'RFP_Well_A3.fcs'),
+                         conditions = {"Dox" : 10.0})
+        watcher = flow.ImportWatcher(op = flow.ImportOp(conditions = {"Dox" : "float"}),
+                                     manifest = [tube],
+                                     settle_time = 60)
+        
+        self.assertEqual(watcher.poll(), [])
+        shutil.copy(self.cwd + 'RFP_Well_A3.fcs', self.dir)
+        self.assertEqual(watcher.poll(), [])
+        self.assertIsNone(watcher.experiment)
+        
+        watcher.settle_time = 0
+        self.assertEqual(len(watcher.poll()), 1)
+        self.assertEqual(len(watcher.experiment), 10000)
+    def testPollError(self):
+        shutil.copy(self.cwd + 'RFP_Well_A3.fcs', self.dir)
+        
+        class BrokenOp(HasStrictTraits):
+            def apply(self, experiment):
+                raise IOError("disk went away")
+        
+        import_op = flow.ImportOp(conditions = {"Well" : "category"})
+        watcher = flow.ImportWatcher(
+            op = import_op,
+            directory = self.dir,
+            tube_conditions = lambda f: {"Well" : os.path.basename(f)},
+            operations = [BrokenOp()],
+            settle_time = 0)
+        
+        # the tube isn't left half-imported
+        with self.assertRaises(util.CytoflowOpError):
+            watcher.poll()
+        self.assertEqual(import_op.tubes, [])
+        self.assertEqual(len(watcher.errors), 1)
+        self.assertIsNone(watcher.experiment)
+    
+    def testBackgroundError(self):
+        shutil.copy(self.cwd + 'RFP_Well_A3.fcs', self.dir)
+        
+        class FlakyWatcher(flow.ImportWatcher):
+            failed = Bool(False)
+            
+            def _is_finished(self, path, now):
+                if not self.failed:
+                    self.failed = True
+                    raise IOError("disk went away")
+                return super(FlakyWatcher, self)._is_finished(path, now)
+        
+        watcher = FlakyWatcher(
+            op = flow.ImportOp(conditions = {"Well" : "category"}),
+            directory = self.dir,
+            tube_conditions = lambda f: {"Well" : os.path.basename(f)},
+            settle_time = 0,
+            poll_interval = 0.05)
+        
+        with warnings.catch_warnings(record = True) as w:
+            warnings.simplefilter("always")
+            watcher.start()
+            try:
+                for _ in range(200):
+                    if watcher.experiment is not None:
+                        break
+                    time.sleep(0.05)
+            finally:
+                watcher.stop()
+        
+        # the error was reported, and the thread kept polling
+        self.assertTrue(any(issubclass(x.category, util.CytoflowOpWarning)
+                            for x in w))
+        self.assertEqual(len(watcher.experiment), 10000)
+
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testWatchDirectory']
+    unittest.main()
@@ -17,7 +17,10 @@
 
 import unittest
 
+import numpy as np
+
 import cytoflow as flow
+from cytoflow.utility.logicle_ext.Logicle import Logicle, FastLogicle
 
 class TestLogicle(unittest.TestCase):
     
@@ -45,6 +48,16 @@ class TestLogicle(unittest.TestCase):
         self.assertAlmostEqual(el.A['Y2-A'], 0.0)
         self.assertAlmostEqual(el.W['Y2-A'], 0.533191950161284)
         
+    def test_logicle_estimate_state(self):
+        el = flow.LogicleTransformOp(name = "Logicle", channels = ["Y2-A"])
+        self.assertIsNone(el.get_estimate())
+        
+        el.estimate(self.ex)
+        el2 = flow.LogicleTransformOp(name = "Logicle", channels = ["Y2-A"])
+        el2.set_estimate(el.get_estimate())
+        self.assertEqual(el2.W, el.W)
+        self.assertEqual(el2.A, el.A)
+        
     ### TODO - test the estimator failure modes
         
     def test_logicle_apply(self):
@@ -59,6 +72,67 @@ class TestLogicle(unittest.TestCase):
         el.estimate(self.ex)
         el.apply(self.ex)
         
+    def test_logicle_array(self):
+        """
+        Make sure the array entry points match the one-value-at-a-time ones
+        """
+        
+        logicle = Logicle(self.ex.metadata['Y2-A']['range'], 0.5, 4.5, 0.0)
+        data = self.ex['Y2-A'].values
+        
+        scaled = np.empty_like(data)
+        logicle.scale_array(data, scaled)
+        np.testing.assert_array_equal(scaled, [logicle.scale(x) for x in data])
+        
+        inverted = np.empty_like(data)
+        logicle.inverse_array(scaled, inverted)
+        np.testing.assert_allclose(inverted, data, atol = 1e-6)
+        
+        # in place, and NaN passes through
+        values = np.array([-10.0, np.nan, 10.0])
+        logicle.scale_array(values, values)
+        self.assertTrue(np.isnan(values[1]))
+        self.assertEqual(values[2], logicle.scale(10.0))
+        
+        with self.assertRaises(TypeError):
+            logicle.scale_array(np.arange(3), np.empty(3))
+            
+        with self.assertRaises(ValueError):
+            logicle.scale_array(np.empty(3), np.empty(4))
+        
+    def test_logicle_fast(self):
+        """
+        The lookup table is close to the exact transform, and handles values
+        outside the display range
+        """
+        
+        T = self.ex.metadata['Y2-A']['range']
+        logicle = Logicle(T, 0.5, 4.5, 0.0)
+        fast = FastLogicle(T, 0.5, 4.5, 0.0, 4096)
+        
+        data = np.concatenate([self.ex['Y2-A'].values, [-1e6, 2 * T]])
+        exact = np.empty_like(data)
+        logicle.scale_array(data, exact)
+        approx = np.empty_like(data)
+        fast.scale_array(data, approx)
+        np.testing.assert_allclose(approx, exact, atol = 1e-4)
+        
+        el = flow.LogicleTransformOp(channels = ['Y2-A'], 
+                                     W = {'Y2-A' : 0.5}, 
+                                     A = {'Y2-A' : 0.0},
+                                     fast = True)
+        ex2 = el.apply(self.ex)
+        np.testing.assert_allclose(ex2['Y2-A'], exact[0:-2], atol = 1e-4)
+        
+    def test_logicle_bins(self):
+        from traits.api import TraitError
+        from cytoflow.utility.logicle_scale import LogicleScale
+        
+        with self.assertRaises(TraitError):
+            flow.LogicleTransformOp(bins = 0)
+        with self.assertRaises(TraitError):
+            LogicleScale(bins = 0)
+        
     ### TODO - test the apply function error checking
     
 if __name__ == "__main__":
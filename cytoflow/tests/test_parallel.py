@@ -0,0 +1,114 @@
+#!/usr/bin/env python2.7
+
+# (c) Massachusetts Institute of Technology 2015-2016
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import os
+import time
+import threading
+import warnings
+import multiprocessing
+
+import cytoflow.utility as util
+import cytoflow.utility.parallel as parallel
+
+def _pid(x):
+    return os.getpid()
+
+def _spin(n):
+    # pure Python, so it holds the GIL the whole time
+    total = 0
+    for i in xrange(n):
+        total += i
+    return total
+
+def _in_thread(fn, *args):
+    result = []
+    t = threading.Thread(target = lambda: result.append(fn(*args)))
+    t.start()
+    t.join()
+    return result[0]
+
+class Test(unittest.TestCase):
+    
+    def tearDown(self):
+        util.stop_process_pool()
+        
+    def testSerial(self):
+        self.assertEqual(util.process_map(_pid, range(4), 1), 
+                         [os.getpid()] * 4)
+        
+    def testFork(self):
+        pids = util.process_map(_pid, range(4), 2)
+        self.assertNotIn(os.getpid(), pids)
+        
+        # closures are fine when the workers are forked
+        offset = 10
+        self.assertEqual(util.process_map(lambda x: x + offset, range(4), 2),
+                         [10, 11, 12, 13])
+        
+    def testPool(self):
+        util.start_process_pool(2)
+        
+        pids = _in_thread(util.process_map, _pid, range(4), 2)
+        self.assertNotIn(os.getpid(), pids)
+        self.assertEqual(_in_thread(util.process_map, _spin, range(10), 2),
+                         [_spin(i) for i in range(10)])
+        
+    def testPoolTooLate(self):
+        t = threading.Thread(target = time.sleep, args = (0.5,))
+        t.start()
+        try:
+            with self.assertRaises(util.CytoflowError):
+                util.start_process_pool(2)
+        finally:
+            t.join()
+        
+    def testThreads(self):
+        # python 2 won't repeat a warning that's already been issued from 
+        # the same place, even with the "always" filter
+        vars(parallel).pop("__warningregistry__", None)
+        
+        with warnings.catch_warnings(record = True) as w:
+            warnings.simplefilter("always")
+            pids = _in_thread(util.process_map, _pid, range(4), 2)
+            
+        self.assertEqual(pids, [os.getpid()] * 4)
+        self.assertTrue(any(issubclass(x.category, util.CytoflowWarning)
+                            for x in w))
+        
+    @unittest.skipIf(multiprocessing.cpu_count() < 2, "needs 2 CPUs")
+    def testSpeedup(self):
+        args = [5000000] * 4
+        
+        start = time.time()
+        util.process_map(_spin, args, 1)
+        serial = time.time() - start
+        
+        # from the main thread, the workers are forked
+        start = time.time()
+        util.process_map(_spin, args, 2)
+        self.assertLess(time.time() - start, 0.75 * serial)
+        
+        # from another thread, they're the pool's processes
+        util.start_process_pool(2)
+        start = time.time()
+        _in_thread(util.process_map, _spin, args, 2)
+        self.assertLess(time.time() - start, 0.75 * serial)
+        
+if __name__ == "__main__":
+    #import sys;sys.argv = ['', 'Test.testPool']
+    unittest.main()
@@ -18,8 +18,12 @@
 from __future__ import absolute_import
 
 from .util_functions import cartesian, iqr, geom_mean, num_hist_bins, sanitize_identifier
+from .util_functions import subsample, subsample_note, annotate_subsample, \
+                            grid_lookup, power_law
+from .grid_interpolator import GridInterpolator
+from .parallel import process_map, start_process_pool, stop_process_pool
 from .cytoflow_errors import CytoflowError, CytoflowOpError, CytoflowViewError
 from .cytoflow_errors import CytoflowWarning, CytoflowOpWarning, CytoflowViewWarning
 
-from .scale import scale_factory, IScale
+from .scale import scale_factory, scale_from_state, IScale
 from .custom_traits import PositiveInt, PositiveFloat, ScaleEnum
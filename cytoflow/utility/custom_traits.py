@@ -24,13 +24,17 @@ Created on Oct 12, 2015
 from __future__ import absolute_import
 
 from traits.api import BaseInt, BaseFloat, BaseEnum
-from . import scale
 
 class PositiveInt(BaseInt):
     
     allow_zero = False
     info_text = 'a positive integer'
     
+    def __init__(self, *args, **metadata):
+        # eg PositiveInt(0, allow_zero = True)
+        self.allow_zero = metadata.pop('allow_zero', False)
+        super(PositiveInt, self).__init__(*args, **metadata)
+    
     def validate(self, obj, name, value):
         value = super(PositiveInt, self).validate(obj, name, value)
         if (value > 0 or (self.allow_zero and value >= 0)):
@@ -44,6 +48,11 @@ class PositiveFloat(BaseFloat):
     allow_zero = False
     info_text = 'a positive float'
     
+    def __init__(self, *args, **metadata):
+        # eg PositiveFloat(0.0, allow_zero = True)
+        self.allow_zero = metadata.pop('allow_zero', False)
+        super(PositiveFloat, self).__init__(*args, **metadata)
+    
     def validate(self, obj, name, value):
         value = super(PositiveFloat, self).validate(obj, name, value)
         if (value > 0.0 or (self.allow_zero and value >= 0.0)):
@@ -57,6 +66,9 @@ class ScaleEnum(BaseEnum):
     def __init__ ( self, *args, **metadata ):
         """ Returns an Enum trait with values from the registered scales
         """
+        # imported here because the scales themselves use the traits above
+        from . import scale
+        
         self.name = ''
         self.values = scale._scale_mapping.keys()
         self.init_fast_validator( 5, self.values )
@@ -70,4 +82,5 @@ class ScaleEnum(BaseEnum):
         return (7, (self._get_default_value, (), None))
     
     def _get_default_value(self):
+        from . import scale
         return scale._scale_default
@@ -0,0 +1,159 @@
+#!/usr/bin/env python2.7
+
+# (c) Massachusetts Institute of Technology 2015-2016
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+class GridInterpolator(object):
+    """
+    Multilinear interpolation on a rectilinear grid, for many points and
+    (optionally) many outputs at once.
+
+    Like `scipy.interpolate.RegularGridInterpolator` with `method = "linear"`
+    and `bounds_error = False`, but:
+
+     - the values at each grid point can be vectors, so one call
+       interpolates every output channel.  The bracketing cell (and the
+       weights of its corners) are found once per point and shared by all
+       the outputs.
+
+     - the points are processed in chunks of `chunk_size`, so the
+       temporaries stay in cache and memory use doesn't grow with the
+       number of points.  The chunks can be spread across `num_workers`
+       threads (the work is all in numpy, which releases the GIL.)
+
+    Parameters
+    ----------
+    points : List(array-like)
+        The (strictly increasing) grid coordinates along each axis.
+
+    values : array-like
+        The values at the grid points.  The first `len(points)` dimensions
+        must match the lengths of `points`; any remaining dimensions are
+        the shape of each output.
+
+    fill_value : Float (default = 0.0)
+        The value to return for points outside the grid.
+
+    chunk_size : Int (default = 65536)
+        How many points to interpolate at a time.
+
+    num_workers : Int (default = 1)
+        How many threads to use.
+
+    Examples
+    --------
+    >>> interp = GridInterpolator([x_axis, y_axis], values)  # (nx, ny, 2)
+    >>> out = interp(data[["x", "y"]])                       # (len(data), 2)
+    """
+
+    def __init__(self, points, values, fill_value = 0.0,
+                 chunk_size = 65536, num_workers = 1):
+        self.points = [np.asarray(p, dtype = np.float64) for p in points]
+        self.values = np.asarray(values, dtype = np.float64)
+        self.fill_value = fill_value
+        self.chunk_size = chunk_size
+        self.num_workers = num_workers
+
+        ndim = len(self.points)
+        shape = tuple(len(p) for p in self.points)
+
+        if self.values.shape[0:ndim] != shape:
+            raise ValueError("values has shape {0}, but the grid has shape {1}"
+                             .format(self.values.shape, shape))
+
+        for p in self.points:
+            if len(p) < 2 or np.any(np.diff(p) <= 0):
+                raise ValueError("Grid axes must have at least two strictly "
+                                 "increasing points")
+
+        # the flattened values, one row per grid point, and the offsets
+        # of the 2 ** ndim corners of a cell from its lowest corner
+        self._flat_values = self.values.reshape((np.prod(shape), -1))
+        strides = np.cumprod((shape + (1,))[:0:-1])[::-1]
+        self._strides = strides
+        self._corners = [np.array(corner, dtype = np.intp)
+                         for corner in np.ndindex(*((2,) * ndim))]
+        self._corner_offsets = [int(np.dot(corner, strides))
+                                for corner in self._corners]
+
+    def __call__(self, x, num_workers = None):
+        """
+        Interpolate at the points in `x`, an (N, len(points)) array-like
+        (a `DataFrame` is fine.)  Returns an array with shape
+        (N,) + the shape of the outputs.  If `num_workers` is given, it
+        overrides the `num_workers` the interpolator was built with (for
+        this call only.)
+        """
+
+        x = np.asarray(x, dtype = np.float64)
+        if x.ndim != 2 or x.shape[1] != len(self.points):
+            raise ValueError("x must have shape (N, {0})"
+                             .format(len(self.points)))
+
+        out = np.empty((len(x), self._flat_values.shape[1]))
+        chunks = [slice(i, min(i + self.chunk_size, len(x)))
+                  for i in range(0, len(x), self.chunk_size)]
+
+        def do_chunk(s):
+            out[s] = self._interpolate(x[s])
+
+        if num_workers is None:
+            num_workers = self.num_workers
+
+        if num_workers > 1 and len(chunks) > 1:
+            pool = ThreadPool(min(num_workers, len(chunks)))
+            try:
+                pool.map(do_chunk, chunks)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for s in chunks:
+                do_chunk(s)
+
+        return out.reshape((len(x),) + self.values.shape[len(self.points):])
+
+    def _interpolate(self, x):
+        n = len(x)
+        base = np.zeros(n, dtype = np.intp)
+        frac = np.empty_like(x)
+        outside = np.zeros(n, dtype = np.bool_)
+
+        # find the cell containing each point (once, for every output)
+        for k, axis in enumerate(self.points):
+            xk = x[:, k]
+            idx = np.searchsorted(axis, xk, side = 'right') - 1
+            np.clip(idx, 0, len(axis) - 2, out = idx)
+
+            lo = axis[idx]
+            frac[:, k] = (xk - lo) / (axis[idx + 1] - lo)
+            outside |= (xk < axis[0]) | (xk > axis[-1])
+            base += idx * self._strides[k]
+
+        ret = np.zeros((n, self._flat_values.shape[1]))
+        for corner, offset in zip(self._corners, self._corner_offsets):
+            weight = np.ones(n)
+            for k, c in enumerate(corner):
+                weight *= frac[:, k] if c else 1.0 - frac[:, k]
+            ret += weight[:, np.newaxis] * self._flat_values.take(base + offset, axis = 0)
+
+        ret[outside] = self.fill_value
+        return ret
@@ -41,5 +41,8 @@ class LinearScale(HasTraits):
     
     def inverse(self, data):
         return data
+    
+    def get_state(self):
+        return {"name" : self.name, "channel" : self.channel}
 
 register_scale(LinearScale)
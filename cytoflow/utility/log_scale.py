@@ -61,5 +61,11 @@ class LogScale(HasTraits):
 
     def inverse(self, data):
         return np.power(10, data)
+    
+    def get_state(self):
+        return {"name" : self.name,
+                "channel" : self.channel,
+                "mode" : self.mode,
+                "threshold" : self.threshold}
 
 register_scale(LogScale)
@@ -2,7 +2,105 @@
 %module Logicle
 %{
 #define SWIG_FILE_WITH_INIT
+#include <cstring>
+#include <string>
 #include "logicle.h"
+
+// is this buffer native-endian float64?
+static bool logicle_is_double (const Py_buffer * buffer)
+{
+        const char * format = buffer->format;
+        if (format && (format[0] == '@' || format[0] == '='))
+                ++format;
+        return buffer->itemsize == sizeof(double) 
+               && format && std::strcmp(format, "d") == 0;
+}
+
+// get C-contiguous float64 buffers from values (read-only) and result 
+// (writable), which must be the same size.  returns false (with a Python 
+// exception set) if we can't.
+static bool logicle_get_buffers (PyObject * values, PyObject * result,
+                                 Py_buffer * in, Py_buffer * out)
+{
+        if (PyObject_GetBuffer(values, in, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) < 0)
+                return false;
+
+        if (PyObject_GetBuffer(result, out, 
+                               PyBUF_C_CONTIGUOUS | PyBUF_FORMAT | PyBUF_WRITABLE) < 0)
+        {
+                PyBuffer_Release(in);
+                return false;
+        }
+
+        if (!logicle_is_double(in) || !logicle_is_double(out))
+                PyErr_SetString(PyExc_TypeError, 
+                                "values and result must be float64 arrays");
+        else if (in->len != out->len)
+                PyErr_SetString(PyExc_ValueError, 
+                                "values and result must be the same size");
+        else
+                return true;
+
+        PyBuffer_Release(in);
+        PyBuffer_Release(out);
+        return false;
+}
+
+// apply logicle->scale() (or inverse()) to each value in values, writing 
+// the results to result.  NaN maps to NaN.  the GIL is released while we 
+// work.  a FastLogicle's lookup table only covers the display range, so
+// values outside it are computed exactly instead.
+static void logicle_apply (const Logicle * logicle, bool inverse,
+                           PyObject * values, PyObject * result)
+{
+        Py_buffer in, out;
+        if (!logicle_get_buffers(values, result, &in, &out))
+                return;
+
+        const double * x = (const double *) in.buf;
+        double * y = (double *) out.buf;
+        Py_ssize_t n = in.len / sizeof(double);
+        std::string error;
+
+        Py_BEGIN_ALLOW_THREADS
+        try
+        {
+                const FastLogicle * fast = dynamic_cast<const FastLogicle *>(logicle);
+
+                // the table covers [lookup[0], lookup[bins]) in data space,
+                // which is [0, 1) in scale space
+                double lo = 0.0, hi = 1.0;
+                if (fast && !inverse)
+                {
+                        lo = fast->Logicle::inverse(0.0);
+                        hi = fast->Logicle::inverse(1.0);
+                }
+
+                for (Py_ssize_t i = 0; i < n; ++i)
+                {
+                        if (x[i] != x[i])
+                                y[i] = x[i];
+                        else if (fast && (x[i] < lo || x[i] >= hi))
+                                y[i] = inverse ? fast->Logicle::inverse(x[i])
+                                               : fast->Logicle::scale(x[i]);
+                        else if (inverse)
+                                y[i] = logicle->inverse(x[i]);
+                        else
+                                y[i] = logicle->scale(x[i]);
+                }
+        }
+        catch (const Logicle::Exception & e)
+        {
+                error = e.message();
+        }
+        Py_END_ALLOW_THREADS
+
+        PyBuffer_Release(&in);
+        PyBuffer_Release(&out);
+
+        if (!error.empty())
+                PyErr_SetString(PyExc_RuntimeError, error.c_str());
+}
 %}
 
 class Logicle
@@ -137,3 +235,39 @@ private:
         friend class TestLogicle;
 };
 
+%exception scale_array {
+        $action
+        if (PyErr_Occurred()) SWIG_fail;
+}
+
+%exception inverse_array {
+        $action
+        if (PyErr_Occurred()) SWIG_fail;
+}
+
+%feature("docstring") Logicle::scale_array
+"scale_array(self, values, result)
+
+Scale every value in the float64 array values, and write the results to
+result, which must be a writable float64 array of the same size (it may be
+values itself.)  NaNs are passed through.  A FastLogicle interpolates its 
+lookup table for values in the display range, and computes the others 
+exactly."
+
+%feature("docstring") Logicle::inverse_array
+"inverse_array(self, values, result)
+
+Like scale_array(), but applies the inverse of the scale."
+
+%extend Logicle
+{
+        void scale_array (PyObject * values, PyObject * result)
+        {
+                logicle_apply($self, false, values, result);
+        }
+
+        void inverse_array (PyObject * values, PyObject * result)
+        {
+                logicle_apply($self, true, values, result);
+        }
+};
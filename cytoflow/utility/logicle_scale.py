@@ -27,7 +27,8 @@ import math
 from warnings import warn
 
 from traits.api import HasTraits, Float, Property, Instance, Str, \
-                       cached_property, Undefined, provides, Constant, Dict
+                       cached_property, Undefined, provides, Constant, Dict, \
+                       Bool, Any
                        
 import numpy as np
 
@@ -37,7 +38,8 @@ from matplotlib.ticker import NullFormatter, LogFormatterMathtext
 from matplotlib.ticker import Locator
 
 from .scale import IScale, register_scale
-from .logicle_ext.Logicle import Logicle
+from .custom_traits import PositiveInt
+from .logicle_ext.Logicle import Logicle, FastLogicle
 from .cytoflow_errors import CytoflowError, CytoflowWarning
 
 @provides(IScale)
@@ -60,15 +62,28 @@ class LogicleScale(HasTraits):
     Attributes
     ----------
     range : Float
-        the input range of the channel.  no default!
+        the input range of the channel.  no default!  taken from `experiment`
+        unless it's set.
     W : Float (default = 0.5)
         for each channel, the width of the linear range, in log10 decades.  
-        can estimate, or use a fixed value like 0.5.
+        estimated from `experiment` unless it's set (to a fixed value like
+        0.5, or to a previous estimate.)
     M : Float (default = 4.5)
         The width of the entire display, in log10 decades
     A : Float (default = 0.0)
         for each channel, additional decades of negative data to include.  
         the display usually captures all the data, so 0 is fine to start.
+    fast : Bool (default = False)
+        if `True`, scale the data by interpolating a lookup table (with 
+        `FastLogicle`) instead of computing every value exactly.  The error 
+        is at most about 1e-4 of the display's width (where the display is 
+        [0, 1]) with the default `bins`, and about 1e-3 with 1024 bins.  
+        Values outside the display range are always computed exactly.  
+        Plots (the matplotlib transforms and tick locations) always use the 
+        lookup table: at that accuracy, the difference is a fraction of a 
+        pixel.
+    bins : PositiveInt (default = 4096)
+        the number of bins in the lookup table.
     
     References
     ----------
@@ -94,15 +109,27 @@ class LogicleScale(HasTraits):
     experiment = Instance("cytoflow.Experiment")
     channel = Str
 
-    range = Property(Float, depends_on = "[experiment, channel]")
-    W = Property(Float, depends_on = "[experiment, channel, r]")
+    range = Property(Float, depends_on = "[experiment, channel, _range]")
+    W = Property(Float, depends_on = "[experiment, channel, r, _W]")
     M = Float(4.5, desc = "the width of the display in log10 decades")
     A = Float(0.0, desc = "additional decades of negative data to include.")
     r = Float(0.05, desc = "quantile to use for estimating the W parameter.")
     
-    logicle = Property(Instance(Logicle), depends_on = "[range, W, M, A]")
+    fast = Bool(False, desc = "use a lookup table instead of exact values?")
+    bins = PositiveInt(4096, desc = "the size of the lookup table")
+    
+    logicle = Property(Instance(Logicle), 
+                       depends_on = "[range, W, M, A, fast, bins]")
+    
+    # the lookup table, for plotting
+    fast_logicle = Property(Instance(FastLogicle),
+                            depends_on = "[range, W, M, A, bins]")
 
-    mpl_params = Property(Dict, depends_on = "logicle")
+    mpl_params = Property(Dict, depends_on = "fast_logicle")
+    
+    # values of range and W that were set, instead of from experiment
+    _range = Any(Undefined)
+    _W = Any(Undefined)
 
     def __call__(self, data):
         """
@@ -111,25 +138,48 @@ class LogicleScale(HasTraits):
         Careful!  May return `NaN` if the scale domain doesn't match the data 
         (ie, applying a log10 scale to negative numbers.)
         """
-        scale_fn = np.vectorize(self.logicle.scale)
-        return scale_fn(data)
+        data = np.array(data, dtype = "float64", order = "C")
+        self.logicle.scale_array(data, data)
+        return data
         
     def inverse(self, data):
         """
         Transforms 'data' using the inverse of this scale.
         """
-        inverse = np.vectorize(self.logicle.inverse)
-        return inverse(data)
+        data = np.array(data, dtype = "float64", order = "C")
+        self.logicle.inverse_array(data, data)
+        return data
+    
+    def get_state(self):
+        return {"name" : self.name,
+                "channel" : self.channel,
+                "range" : float(self.range),
+                "W" : float(self.W),
+                "M" : self.M,
+                "A" : self.A,
+                "fast" : self.fast,
+                "bins" : self.bins}
+    
+    def _set_range(self, value):
+        self._range = value
     
     @cached_property
     def _get_range(self):
-        if self.experiment and self.channel:
+        if self._range is not Undefined:
+            return self._range
+        elif self.experiment and self.channel:
             return self.experiment.metadata[self.channel]["range"]
         else:
             return Undefined
         
+    def _set_W(self, value):
+        self._W = value
+        
     @cached_property
     def _get_W(self):
+        if self._W is not Undefined:
+            return self._W
+        
         if not (self.experiment and self.channel):
             return Undefined
         
@@ -173,12 +223,29 @@ class LogicleScale(HasTraits):
         if (-self.A > self.W or self.A + self.W > self.M - self.W):
             raise CytoflowError("Logicle param A is too large.")
         
-         
-        return Logicle(self.range, self.W, self.M, self.A)
+        if self.fast:
+            return self.fast_logicle
+        else:
+            return Logicle(self.range, self.W, self.M, self.A)
+        
+    @cached_property
+    def _get_fast_logicle(self):
+        if self.range is Undefined or self.W is Undefined:
+            return Undefined
+        
+        if self.bins <= 0:
+            raise CytoflowError("Logicle param bins must be > 0")
+        
+        # the parameters are checked by _get_logicle()
+        return FastLogicle(self.range, self.W, self.M, self.A, self.bins)
     
     @cached_property
     def _get_mpl_params(self):
-        return {"logicle" : self.logicle}
+        # make sure the parameters are valid
+        if self.logicle is Undefined:
+            return {"logicle" : Undefined}
+        
+        return {"logicle" : self.fast_logicle}
     
 register_scale(LogicleScale)
         
@@ -237,8 +304,9 @@ class MatplotlibLogicleScale(HasTraits, matplotlib.scale.ScaleBase):
             HasTraits.__init__(self, **kwargs)
         
         def transform_non_affine(self, values):
-            scale = np.vectorize(self.logicle.scale)
-            return scale(values)
+            values = np.array(values, dtype = "float64", order = "C")
+            self.logicle.scale_array(values, values)
+            return values
 
         def inverted(self):
             return MatplotlibLogicleScale.InvertedLogicleTransform(logicle = self.logicle)
@@ -257,8 +325,9 @@ class MatplotlibLogicleScale(HasTraits, matplotlib.scale.ScaleBase):
             HasTraits.__init__(self, **kwargs)
         
         def transform_non_affine(self, values):
-            inverse = np.vectorize(self.logicle.inverse)
-            return inverse(values)
+            values = np.array(values, dtype = "float64", order = "C")
+            self.logicle.inverse_array(values, values)
+            return values
         
         def inverted(self):
             return MatplotlibLogicleScale.LogicleTransform(logicle = self.logicle)
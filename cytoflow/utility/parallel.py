@@ -0,0 +1,178 @@
+#!/usr/bin/env python2.7
+
+# (c) Massachusetts Institute of Technology 2015-2016
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+# 
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import absolute_import
+
+import os, threading, warnings
+import collections
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+from .cytoflow_errors import CytoflowError, CytoflowWarning
+
+# the function and arguments for the current process_map(), inherited by 
+# the worker processes when they're forked.
+_work = None
+_work_lock = threading.Lock()
+
+# a pool of worker processes started by start_process_pool(), if any
+_pool = None
+_pool_lock = threading.Lock()
+
+def start_process_pool(num_workers = None):
+    """
+    Start a pool of worker processes for `process_map()` to use.
+    
+    `process_map()` usually forks new worker processes for each call, which 
+    isn't safe once a program has started other threads (like a GUI does):
+    `fork()` only copies the thread that calls it, so a lock that another
+    thread held at that moment (in logging, traits or the BLAS) stays 
+    locked in the child.  A program that will call `process_map()` from a 
+    thread should call this first, before it starts any threads; 
+    `process_map()` then sends the work to these processes instead.
+    
+    Parameters
+    ----------
+    num_workers : Int (default = the number of CPUs)
+        How many processes to start.
+        
+    Raises
+    ------
+    CytoflowError
+        If this process is already running more than one thread.
+    """
+    
+    global _pool
+    
+    with _pool_lock:
+        if _pool is not None:
+            return
+        
+        if hasattr(os, 'fork') and threading.active_count() > 1:
+            raise CytoflowError("start_process_pool() must be called before "
+                                "any other threads are started")
+            
+        _pool = multiprocessing.Pool(num_workers)
+        
+def stop_process_pool():
+    """
+    Stop the worker processes started by `start_process_pool()`.
+    """
+    
+    global _pool
+    
+    with _pool_lock:
+        if _pool is None:
+            return
+        
+        _pool.close()
+        _pool.join()
+        _pool = None
+
+def process_map(fn, args, num_workers = 1):
+    """
+    Return `[fn(arg) for arg in args]`, computed on `num_workers` processes.
+    
+    Meant for CPU-bound work that holds the GIL (like fitting a model to
+    each group of events.)  The worker processes are forked after `fn` and
+    `args` are set aside, so they share `args` (copy-on-write) instead of
+    having them pickled and sent over a pipe; only each argument's index
+    goes to a worker, and only the result comes back.
+    
+    The results are in the same order as `args`, so they don't depend on 
+    `num_workers` as long as `fn` doesn't have side effects.  Exceptions
+    raised by `fn` are re-raised here.
+    
+    Forking a process that is running more than one thread can deadlock 
+    (see `start_process_pool()`.)  So if other threads are running, and 
+    `start_process_pool()` was called, the work goes to its processes 
+    instead: `fn` and each argument are pickled and sent to them, so `fn`
+    must be a module-level function, and at most as many processes as the
+    pool has are used.  If other threads are running and there's no pool,
+    or on platforms without `fork()`, `fn` is called on `num_workers` 
+    threads instead, with a `CytoflowWarning`.
+    
+    Parameters
+    ----------
+    fn : Callable
+        The function to call on each argument.  It must be picklable if
+        the work may go to the processes started by `start_process_pool()`.
+        
+    args : List
+        The arguments.
+        
+    num_workers : Int (default = 1)
+        How many processes to use.  If it's 1, or there's only one argument,
+        `fn` is called in this process.
+        
+    Returns
+    -------
+    List
+        The results.
+    """
+    
+    global _work
+    
+    args = list(args)
+    num_workers = min(num_workers, len(args))
+    
+    if num_workers <= 1:
+        return [fn(arg) for arg in args]
+    
+    if hasattr(os, 'fork') and threading.active_count() == 1:
+        with _work_lock:
+            _work = (fn, args)
+            try:
+                pool = multiprocessing.Pool(num_workers)
+                try:
+                    # chunksize = 1 so one slow group doesn't hold up a batch
+                    return pool.map(_do_work, range(len(args)), chunksize = 1)
+                finally:
+                    pool.close()
+                    pool.join()
+            finally:
+                _work = None
+                
+    pool = _pool
+    if pool is not None:
+        # keep at most num_workers arguments in the pool at once
+        results = []
+        pending = collections.deque()
+        for arg in args:
+            if len(pending) == num_workers:
+                results.append(pending.popleft().get())
+            pending.append(pool.apply_async(fn, (arg,)))
+        results.extend(r.get() for r in pending)
+        return results
+    
+    warnings.warn("process_map() is using threads instead of processes, "
+                  "because other threads are running (or this platform "
+                  "can't fork.)  Call start_process_pool() before starting "
+                  "any threads to use processes.",
+                  CytoflowWarning)
+    
+    pool = ThreadPool(num_workers)
+    try:
+        return pool.map(fn, args)
+    finally:
+        pool.close()
+        pool.join()
+            
+def _do_work(idx):
+    fn, args = _work
+    return fn(args[idx])
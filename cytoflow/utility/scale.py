@@ -62,6 +62,12 @@ class IScale(Interface):
         """
         Transforms 'data' using the inverse of this scale.
         """
+        
+    def get_state(self):
+        """
+        The scale's parameters (including any estimated from `experiment`) 
+        as a dict of plain values, for `scale_from_state()`.
+        """
     
 # maps name -> scale object
 _scale_mapping = {}
@@ -75,6 +81,21 @@ def scale_factory(scale, experiment, channel):
          
     return _scale_mapping[scale](experiment = experiment, channel = channel)
  
+def scale_from_state(state):
+    """
+    Make a scale from the parameters returned by its `get_state()`.  The
+    scale doesn't need an `experiment`: the parameters that were estimated
+    from one are fixed.
+    """
+    
+    state = dict(state)
+    scale = state.pop("name")
+    
+    if scale not in _scale_mapping:
+        raise CytoflowError("Unknown scale type {0}".format(scale))
+    
+    return _scale_mapping[scale](**state)
+ 
 def register_scale(scale_class):
     _scale_mapping[scale_class.name] = scale_class
     
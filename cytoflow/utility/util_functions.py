@@ -22,6 +22,8 @@ Created on Mar 5, 2015
 """
 from __future__ import division
 
+import functools
+
 import numpy as np
 from scipy import stats
 
@@ -32,6 +34,185 @@ def iqr(a):
     q3 = np.nanpercentile(a, 75)
     return q3 - q1
 
+def subsample(data, max_events, by = None, seed = 1):
+    """
+    Randomly choose at most `max_events` events from each group of `data`.
+    
+    Parameters
+    ----------
+    data : pandas.DataFrame
+        The events to choose from.
+        
+    max_events : Int
+        The most events to keep from each group.  If 0, keep all of them.
+        
+    by : List(Str)
+        The columns to group the events by.  If empty, `data` is one group.
+        
+    seed : Int (default = 1)
+        The random seed.  Each group is sampled with a new generator seeded
+        with `seed`, so the events chosen from a group don't depend on the
+        other groups.
+        
+    Returns
+    -------
+    pandas.DataFrame
+        The chosen events, in their original order.  If no group has more
+        than `max_events` events, `data` itself.
+    """
+    
+    if not max_events or len(data) <= max_events:
+        return data
+    
+    if by:
+        groups = data.groupby(by).indices.values()
+    else:
+        groups = [np.arange(len(data))]
+        
+    if all(len(idx) <= max_events for idx in groups):
+        return data
+        
+    keep = []
+    for idx in groups:
+        if len(idx) > max_events:
+            idx = np.random.RandomState(seed).choice(idx, 
+                                                     max_events, 
+                                                     replace = False)
+        keep.append(idx)
+        
+    return data.iloc[np.sort(np.concatenate(keep))]
+
+def subsample_note(events):
+    """
+    Describe how much an estimate was subsampled, for a diagnostic plot.
+    
+    Parameters
+    ----------
+    events : Tuple(Int, Int)
+        The number of events the estimate used, and the number of events
+        there were.
+        
+    Returns
+    -------
+    Str
+        Something like "Estimated from 10000 of 51234 events", or `None` if 
+        all the events were used.
+    """
+    
+    if not events or events[0] >= events[1]:
+        return None
+    
+    return "Estimated from {0} of {1} events".format(*events)
+
+def annotate_subsample(events):
+    """
+    Note how much an estimate was subsampled (see `subsample_note`) in the
+    upper-left corner of the current axes.  Does nothing if all the events
+    were used.
+    
+    Parameters
+    ----------
+    events : Tuple(Int, Int)
+        The number of events the estimate used, and the number of events
+        there were.
+    """
+    
+    note = subsample_note(events)
+    if not note:
+        return
+    
+    import matplotlib.pyplot as plt
+    plt.annotate(note, 
+                 xy = (0.02, 0.98), 
+                 xycoords = 'axes fraction',
+                 va = 'top',
+                 fontsize = 'small')
+
+def grid_lookup(fn, x, bins):
+    """
+    Approximate `fn` by evaluating it once on a regular grid, and then look
+    up each row of `x` in the grid.
+    
+    The grid has `bins` cells along each column of `x`, spanning that
+    column's range; `fn` is evaluated at the cell centres, and each row of
+    `x` gets the values of the cell it falls in.  So the error is controlled
+    by `bins`, and the cost for a large `x` is about that of one pass over
+    its columns (plus `bins ** x.shape[1]` evaluations of `fn`.)
+    
+    Parameters
+    ----------
+    fn : Callable
+        Takes an (M, D) array of points and returns a tuple of arrays, each
+        with M rows.
+        
+    x : array-like
+        An (N, D) array of points to look up.  Must be finite.
+        
+    bins : Int
+        How many grid cells along each dimension.
+        
+    Returns
+    -------
+    List(numpy.ndarray)
+        The outputs of `fn`, each with N rows.
+        
+    Raises
+    ------
+    ValueError
+        If `x` has a `NaN` or an infinite value (which would make the grid
+        meaningless.)
+    """
+    
+    x = np.asarray(x, dtype = np.float64)
+    if len(x) == 0:
+        return list(fn(x))
+    
+    if not np.isfinite(x).all():
+        raise ValueError("grid_lookup() needs finite values")
+    
+    lo = x.min(axis = 0)
+    width = (x.max(axis = 0) - lo) / bins
+    width[width == 0] = 1.0
+    
+    grid = cartesian([lo[k] + (np.arange(bins) + 0.5) * width[k]
+                      for k in range(x.shape[1])])
+    tables = fn(grid)
+    
+    # the (flattened) cell that each row falls in
+    cell = np.zeros(len(x), dtype = np.intp)
+    for k in range(x.shape[1]):
+        i = ((x[:, k] - lo[k]) / width[k]).astype(np.intp)
+        np.clip(i, 0, bins - 1, out = i)
+        cell *= bins
+        cell += i
+    
+    return [np.asarray(t).take(cell, axis = 0) for t in tables]
+
+def power_law(a, b):
+    """
+    Make the function `y = b * x ** a`.
+    
+    Unlike a lambda (or a closure), the function can be pickled, so it can
+    be kept in an operation's traits or an `Experiment`'s metadata.
+    
+    Parameters
+    ----------
+    a, b : Float
+        The exponent and the coefficient.
+        
+    Returns
+    -------
+    Callable
+        A function of one (array-like) argument.
+    """
+    
+    return functools.partial(_power_law, a = a, b = b)
+
+def _power_law(x, a, b):
+    if a == 1.0:
+        return b * x
+    return b * np.power(x, a)
+
 def num_hist_bins(a):
     """Calculate number of hist bins using Freedman-Diaconis rule."""
     # From http://stats.stackexchange.com/questions/798/
@@ -143,7 +324,7 @@ def cartesian(arrays, out=None):
     if out is None:
         out = np.zeros([n, len(arrays)], dtype=dtype)
 
-    m = n / arrays[0].size
+    m = n // arrays[0].size
     out[:,0] = np.repeat(arrays[0], m)
     if arrays[1:]:
         cartesian(arrays[1:], out=out[0:m,1:])
@@ -242,6 +242,13 @@ class FlowTask(Task):
         wi = self.model.workflow[0]
         while True:
             wi.status = "invalid"
+            
+            # operations that were saved with their estimates don't have to
+            # be fit again: their inputs are the same as when they were saved
+            wi.estimate_loaded = \
+                (hasattr(wi.operation, "get_estimate") and
+                 wi.operation.get_estimate() is not None)
+                
             with self.worker_lock:
                 self.to_update.put_nowait((self.model.workflow.index(wi), wi))
             if wi.next:
@@ -403,6 +410,7 @@ class FlowTask(Task):
         wi = self.model.selected
         while True:
             wi.status = "invalid"
+            wi.estimate_loaded = False
             with self.worker_lock:
                 self.to_update.put_nowait((self.model.workflow.index(wi), wi))
             if wi.next:
@@ -52,11 +52,9 @@ from traitsui.table_column import ObjectColumn
 
 from cytoflow import Tube as CytoflowTube
 from cytoflow import Experiment, ImportOp
-from cytoflow.operations.import_op import check_tube
+from cytoflow.operations.import_op import check_tube, parse_fcs
 import cytoflow.utility as util
 
-import fcsparser
-
 def not_true ( value ):
     return (value is not True)
 
@@ -210,9 +208,7 @@ class ExperimentDialogModel(HasTraits):
             
             # first load the tube's metadata and set special columns
             try:
-                tube_meta = fcsparser.parse(op_tube.file, 
-                                            meta_data_only = True, 
-                                            reformat_meta = True)
+                tube_meta = parse_fcs(op_tube.file, meta_data_only = True)
                 #tube_channels = tube_meta["_channels_"].set_index("$PnN")
             except Exception as e:
                 error(None, "FCS reader threw an error on tube {0}: {1}"\
@@ -416,9 +412,7 @@ class ExperimentDialogHandler(Controller):
         
         for path in file_dialog.paths:
             try:
-                tube_meta = fcsparser.parse(path, 
-                                            meta_data_only = True, 
-                                            reformat_meta = True)
+                tube_meta = parse_fcs(path, meta_data_only = True)
                 #tube_channels = tube_meta["_channels_"].set_index("$PnN")
             except Exception as e:
                 raise RuntimeError("FCS reader threw an error on tube {0}: {1}"\
@@ -44,10 +44,16 @@ from view_plugins import HistogramPlugin, HexbinPlugin, ScatterplotPlugin, \
                          
 import sys
 
+import cytoflow.utility as util
+
 def run_gui():
     
     logging.basicConfig(level=logging.DEBUG)
     
+    # the operations' estimate()s run on a worker thread, so start the worker
+    # processes for util.process_map() before there are any other threads
+    util.start_process_pool()
+    
     debug = ("--debug" in sys.argv)
 
     plugins = [CorePlugin(), TasksPlugin(), FlowTaskPlugin(debug = debug),
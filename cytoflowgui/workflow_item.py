@@ -25,7 +25,7 @@ import warnings
 
 from traits.api import HasStrictTraits, Instance, List, DelegatesTo, Enum, \
                        Property, cached_property, on_trait_change, \
-                       Str, Dict
+                       Str, Dict, Bool
 from traitsui.api import View, Item, Handler
 from pyface.qt import QtGui
 from pyface.tasks.api import Task
@@ -95,6 +95,11 @@ class WorkflowItem(HasStrictTraits):
     # MAGIC: first value is the default
     status = Enum("invalid", "estimating", "applying", "valid", transient = True)
     
+    # was the operation loaded (from a saved workflow) with the state its
+    # estimate() fit, with the same input it was fit to?  if so, the next
+    # update() doesn't fit it again.
+    estimate_loaded = Bool(False, transient = True)
+    
     # if we errored out, what was the error string?
     error = Str(transient = True)
     
@@ -121,10 +126,15 @@ class WorkflowItem(HasStrictTraits):
         
         prev_result = self.previous.result if self.previous else None
         
+        # skip estimate() only on the first update after loading
+        estimate_loaded = self.estimate_loaded
+        self.estimate_loaded = False
+        
         with warnings.catch_warnings(record = True) as w:
             try:
                 if (hasattr(self.operation, "estimate") and
-                    callable(getattr(self.operation, "estimate"))):
+                    callable(getattr(self.operation, "estimate")) and
+                    not estimate_loaded):
                     self.status = "estimating"
                     self.operation.estimate(prev_result)
                 self.status = "applying"